@@ -5,6 +5,7 @@ from sparseconverter import for_backend, NUMPY
 from libertem.utils.devices import detect
 
 from libertem_holo.base.filters import (
+    butterworth_aperture,
     butterworth_disk,
     butterworth_line,
     disk_aperture,
@@ -88,3 +89,38 @@ def test_disk_aperture(backend, benchmark, lt_ctx):
     benchmark(
         lambda: disk_aperture(out_shape=(4096, 4096), radius=128.0, xp=xp),
     )
+
+
+@pytest.mark.benchmark(
+    group="filters"
+)
+@pytest.mark.parametrize(
+    'backend', ['numpy', 'cupy'],
+)
+def test_butterworth_aperture(backend, benchmark, lt_ctx):
+    if backend == 'cupy':
+        d = detect()
+        if not d['cudas'] or not d['has_cupy']:
+            pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+
+    if backend == 'cupy':
+        import cupy as xp
+    else:
+        xp = np
+
+    out = xp.zeros((4096, 4096), dtype=np.float32)
+
+    benchmark(
+        lambda: for_backend(
+            butterworth_aperture(
+                shape=(4096, 4096),
+                radius=128.0,
+                sb_position=(100.1, 100),
+                line_width=3,
+                length_ratio=0.9,
+                out=out,
+                xp=xp,
+            ),
+            NUMPY
+        )
+    )
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.benchmark(
+    group="import"
+)
+@pytest.mark.parametrize(
+    'module', [
+        'libertem_holo.base.reconstr',
+        'libertem_holo.base.align',
+        'libertem_holo.udf',
+    ],
+)
+def test_import_time(module, benchmark):
+    # includes the interpreter startup, use `python` as the baseline:
+    benchmark.pedantic(
+        subprocess.run,
+        args=([sys.executable, "-c", f"import {module}"],),
+        kwargs={"check": True},
+        rounds=5,
+        iterations=1,
+    )
+
+
+@pytest.mark.benchmark(
+    group="import"
+)
+def test_import_time_baseline(benchmark):
+    benchmark.pedantic(
+        subprocess.run,
+        args=([sys.executable, "-c", "import numpy"],),
+        kwargs={"check": True},
+        rounds=5,
+        iterations=1,
+    )
@@ -30,3 +30,41 @@ def test_params_from_hologram(backend, benchmark, lt_ctx, large_holo_data):
             holo[0, 0], central_band_mask_radius=100, xp=xp
         ),
     )
+
+
+@pytest.mark.benchmark(
+    group="fft_size"
+)
+@pytest.mark.parametrize(
+    'fft_friendly', [False, True],
+)
+@pytest.mark.parametrize(
+    'sb_size', [100, 137, 203, 250, 397],
+)
+@pytest.mark.parametrize(
+    'backend', ['numpy', 'cupy'],
+)
+def test_ifft2_out_shape(backend, sb_size, fft_friendly, benchmark):
+    from libertem_holo.base.utils import next_fast_size
+
+    if backend == 'cupy':
+        d = detect()
+        if not d['cudas'] or not d['has_cupy']:
+            pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+        import cupy as xp
+    else:
+        xp = np
+
+    # same as the default in `HoloParams.from_hologram`:
+    out_side = 2 * sb_size + 16
+    if fft_friendly:
+        out_side = next_fast_size(out_side)
+    data = xp.ones((out_side, out_side), dtype=np.complex128)
+
+    def _run():
+        res = xp.fft.ifft2(data)
+        if xp is not np:
+            xp.cuda.runtime.deviceSynchronize()
+        return res
+
+    benchmark(_run)
@@ -130,3 +130,121 @@ def test_stack_alignment(
             correlator=None,
             xp=xp,
         )
+
+
+@pytest.fixture(scope="module")
+def shifted_stack_and_shifts():
+    from libertem_holo.base.utils import apply_fourier_shift
+
+    num_frames = 16
+    shape = (1024, 1024)
+    rng = np.random.default_rng(42)
+    base = rng.random(shape).astype(np.float32)
+    spectrum = np.fft.fft2(base)
+    shifts = rng.uniform(-20, 20, size=(num_frames, 2))
+    stack = np.fft.ifft2(
+        apply_fourier_shift(np.repeat(spectrum[None], num_frames, axis=0), shifts)
+    ).real.astype(np.float32)
+    return stack, shifts
+
+
+@pytest.fixture(scope="module")
+def shifted_stack(shifted_stack_and_shifts):
+    return shifted_stack_and_shifts[0]
+
+
+@pytest.mark.benchmark(
+    group="stack_alignment_scaling"
+)
+@pytest.mark.parametrize(
+    'num_workers', [1, 4, 16],
+)
+@pytest.mark.parametrize(
+    'batch_size', [1, 4, 16],
+)
+def test_stack_alignment_scaling(batch_size, num_workers, benchmark, shifted_stack):
+    benchmark(
+        align_stack,
+        stack=shifted_stack,
+        wave_stack=shifted_stack,
+        static=None,
+        correlator=None,
+        batch_size=batch_size,
+        num_workers=num_workers,
+    )
+
+
+@pytest.mark.benchmark(
+    group="stack_alignment_memmap"
+)
+@pytest.mark.parametrize(
+    'prefetch', [0, 4],
+)
+def test_stack_alignment_memmap(prefetch, benchmark, shifted_stack, tmp_path):
+    np.save(tmp_path / "stack.npy", shifted_stack)
+    stack = np.load(tmp_path / "stack.npy", mmap_mode="r")
+    benchmark(
+        align_stack,
+        stack=stack,
+        wave_stack=stack,
+        static=None,
+        correlator=None,
+        prefetch=prefetch,
+    )
+
+
+@pytest.mark.benchmark(
+    group="stack_alignment_correlator"
+)
+@pytest.mark.parametrize(
+    'correlator', ['image', 'pyramid', 'image_window', 'projection', 'projection_refined'],
+)
+def test_stack_alignment_correlator(correlator, benchmark, shifted_stack_and_shifts):
+    from libertem_holo.base.align import (
+        ImageCorrelator, PyramidCorrelator, ProjectionCorrelator,
+    )
+    stack, shifts = shifted_stack_and_shifts
+    kwargs = {}
+    if correlator == 'pyramid':
+        corr = PyramidCorrelator(downsample=8, upsample_factor=10)
+    elif correlator == 'projection':
+        corr = ProjectionCorrelator(upsample_factor=10)
+    elif correlator == 'projection_refined':
+        corr = ProjectionCorrelator(upsample_factor=10, refine_radius=2)
+    else:
+        corr = ImageCorrelator(upsample_factor=10)
+    if correlator == 'image_window':
+        # the shifts of the stack are within +-20 px of each other:
+        kwargs['search_radius'] = 40
+    _, shifts_found, _, _ = benchmark(
+        align_stack,
+        stack=stack,
+        wave_stack=stack,
+        static=None,
+        correlator=corr,
+        batch_size=16,
+        store_corrs=False,
+        **kwargs,
+    )
+    # the stack is aligned to its first frame:
+    expected = -(shifts - shifts[0])
+    benchmark.extra_info['max_error_px'] = float(np.abs(shifts_found - expected).max())
+
+
+@pytest.mark.benchmark(
+    group="shift_stack"
+)
+@pytest.mark.parametrize(
+    'method', ['fourier', 'lanczos', 'cubic', 'linear'],
+)
+def test_shift_stack_method(method, benchmark, shifted_stack_and_shifts):
+    from scipy.ndimage import gaussian_filter
+    from libertem_holo.base.align import shift_stack
+
+    stack, shifts = shifted_stack_and_shifts
+    # band-limit the stack, so the accuracy of the methods can be compared:
+    stack = gaussian_filter(stack, sigma=(0, 1.5, 1.5), mode='wrap')
+    shifted = benchmark(shift_stack, stack, shifts, method=method)
+    expected = shift_stack(stack, shifts, method='fourier')
+    contrast = np.abs(expected - expected.mean()).max()
+    benchmark.extra_info['max_rel_error'] = float(np.abs(shifted - expected).max() / contrast)
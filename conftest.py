@@ -87,6 +87,39 @@ def large_holo_data(tmpdir, lt_ctx):
     return npy_ds_path, lt_ctx.load('npy', str(npy_ds_path))
 
 
+@pytest.fixture(params=["numpy", "cupy"])
+def xp(request):
+    """
+    The array module of each backend, skipping CuPy if it's not available
+    """
+    if request.param == "cupy":
+        d = detect()
+        if not d["cudas"] or not d["has_cupy"]:
+            pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+        import cupy as cp
+        return cp
+    return np
+
+
+@pytest.fixture
+def count_fft(monkeypatch):
+    """
+    Count the calls of the forward numpy FFTs, the returned list
+    gets one item per call and can be cleared in between
+    """
+    num_calls = []
+
+    def _counting(orig):
+        def _inner(*args, **kwargs):
+            num_calls.append(1)
+            return orig(*args, **kwargs)
+        return _inner
+
+    monkeypatch.setattr(np.fft, "fftn", _counting(np.fft.fftn))
+    monkeypatch.setattr(np.fft, "fft2", _counting(np.fft.fft2))
+    return num_calls
+
+
 @pytest.fixture
 def lt_ctx():
     return Context(executor=InlineJobExecutor())
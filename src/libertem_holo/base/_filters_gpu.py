@@ -0,0 +1,55 @@
+"""CUDA kernels for :mod:`libertem_holo.base.filters`.
+
+These live in a separate module, so that `numba.cuda` is only imported
+when the GPU kernels are actually used.
+"""
+from numba import cuda
+
+from libertem_holo.base.filters import (
+    _butterworth_disk_kernel, _butterworth_line_kernel, _butterworth_aperture_kernel,
+)
+
+
+@cuda.jit(cache=True)
+def _butterworth_disk_gpu(result, radius: float, order: int = 12):
+    y, x = cuda.grid(2)
+    cy = result.shape[0]/2
+    cx = result.shape[1]/2
+    inv_radius_sq = 1 / (radius * radius)
+    if x < result.shape[1] and y < result.shape[0]:
+        result[y, x] = _butterworth_disk_kernel(y, x, cy, cx, inv_radius_sq, order)
+
+
+@cuda.jit(cache=True)
+def _butterworth_line_gpu(result, line_params, inv_width, order=12):
+    y, x = cuda.grid(2)
+    if x < result.shape[1] and y < result.shape[0]:
+        cy, cx, a, c, inv_a_minus_b, inv_norm, sb_sel = line_params
+        result[y, x] = 1 - _butterworth_line_kernel(
+            y, x,
+            cy, cx, a, c, inv_a_minus_b, inv_norm, sb_sel,
+            inv_width,
+            order,
+        )
+
+
+@cuda.jit(cache=True)
+def _butterworth_aperture_gpu(
+    out, y_start, x_start,
+    disk_params, disk_order,
+    use_line, line_params, inv_width, line_order,
+):
+    y, x = cuda.grid(2)
+    if x < out.shape[1] and y < out.shape[0]:
+        out[y, x] = _butterworth_aperture_kernel(
+            y + y_start, x + x_start,
+            disk_params, disk_order,
+            use_line, line_params, inv_width, line_order,
+        )
+
+
+CACHED_GPU_KERNELS = (
+    _butterworth_disk_gpu,
+    _butterworth_line_gpu,
+    _butterworth_aperture_gpu,
+)
@@ -1,22 +1,23 @@
 from __future__ import annotations
 
+import collections
+import itertools
 import math
+import queue
+import threading
 import typing
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal, NamedTuple
 
-try:
-    import cupy as cp
-except ImportError:
-    cp = None
+import numba
 import numpy as np
 import numpy.typing as npt
-import matplotlib.pyplot as plt
-from sparseconverter import NUMPY, for_backend
-from scipy.ndimage import gaussian_filter
 import logging
 
 from libertem_holo.base.reconstr import get_slice_fft, HoloParams, get_phase, reconstruct_bf
-from libertem_holo.base.filters import central_line_filter, disk_aperture
+from libertem_holo.base.stats import StreamingStats
+from libertem_holo.base.utils import apply_fourier_shift
+from libertem_holo.base.filters import central_line_filter, disk_aperture, phase_unwrap
 
 log = logging.getLogger(__name__)
 
@@ -25,7 +26,8 @@ def _upsampled_dft(
     corrspecs: npt.NDArray,
     frequencies: tuple[np.ndarray, np.ndarray],
     upsampled_region_size: int,
-    axis_offsets: tuple[float, float],
+    axis_offsets: np.ndarray,
+    xp=np,
 ) -> np.ndarray:
     """
     From https://github.com/LiberTEM/LiberTEM-blobfinder, which is itself
@@ -33,24 +35,98 @@ def _upsampled_dft(
     which is itself based on code by Manuel Guizar released initially under a
     BSD 3-Clause license @ https://www.mathworks.com/matlabcentral/fileexchange/18401
 
+    Works on stacks of spectra with shape (..., h, w), with `axis_offsets` of
+    shape (..., 2), so a whole batch is upsampled with two batched matrix
+    multiplications. The computation stays on the backend given by `xp`, in
+    the precision of `corrspecs`.
+
     :meta private:
     """
     im2pi = -1j * 2 * np.pi
-    upsampled = corrspecs
-    for (ax_freq, ax_offset) in zip(frequencies[::-1], axis_offsets[::-1]):
-        kernel = np.linspace(
-            -ax_offset,
-            (-ax_offset + upsampled_region_size - 1),
-            num=int(upsampled_region_size),
-        )
-        kernel = np.exp(kernel[:, None] * ax_freq * im2pi, dtype=np.complex64)
-        # Equivalent to:
-        #   data[i, j, k] = kernel[i, :] @ data[j, k].T
-        upsampled = np.tensordot(kernel, upsampled, axes=(1, -1))
-    return upsampled
+    complex_dtype = np.result_type(corrspecs.dtype, np.complex64)
+    region_size = int(upsampled_region_size)
+    axis_offsets = xp.asarray(axis_offsets, dtype=np.float64)
+    region = xp.arange(region_size, dtype=np.float64)
+    freq_y, freq_x = frequencies
+    # kernel_y[..., i, k] = exp(-2πi (i - offset_y) freq_y[k]), shape (..., r, h):
+    kernel_y = xp.exp(
+        im2pi * (region - axis_offsets[..., 0, None])[..., :, None] * freq_y
+    ).astype(complex_dtype)
+    # kernel_x[..., l, j] = exp(-2πi (j - offset_x) freq_x[l]), shape (..., w, r):
+    kernel_x = xp.exp(
+        im2pi * freq_x[:, None] * (region - axis_offsets[..., 1, None])[..., None, :]
+    ).astype(complex_dtype)
+    return xp.matmul(xp.matmul(kernel_y, corrspecs.astype(complex_dtype, copy=False)), kernel_x)
+
+
+def _refine_shifts(
+    image_products: npt.NDArray,
+    shifts: npt.NDArray,
+    upsample_factor: int,
+    xp=np,
+    real: bool = False,
+) -> np.ndarray:
+    """
+    Refine the integer `shifts` of shape (..., 2) to a precision of
+    `1 / upsample_factor`, using the cross-power spectra `image_products`
+    of shape (..., h, w). With `real`, the maximum of the real part of the
+    correlation is used instead of its magnitude.
+
+    :meta private:
+    """
+    float_dtype = image_products.real.dtype
+    frequencies = (
+        xp.fft.fftfreq(image_products.shape[-2], upsample_factor),
+        xp.fft.fftfreq(image_products.shape[-1], upsample_factor),
+    )
+    # Initial shift estimate in upsampled grid
+    shifts = xp.round(shifts * upsample_factor) / upsample_factor
+    upsampled_region_size = math.ceil(upsample_factor * 1.5)
+    # Center of output array at dftshift + 1
+    dftshift = math.trunc(upsampled_region_size / 2.0)
+    # Matrix multiply DFT around the current shift estimate
+    sample_region_offset = dftshift - xp.round(shifts * upsample_factor)
+    cross_correlation = _upsampled_dft(
+        image_products.conj(),
+        frequencies,
+        upsampled_region_size,
+        sample_region_offset,
+        xp=xp,
+    ).conj()
+    # Locate maximum and map back to original pixel grid
+    maxima = _argmax_2d(
+        _correlation_values(cross_correlation, real, xp=xp), xp=xp,
+    ).astype(float_dtype, copy=False)
+    maxima -= dftshift
+    return (shifts + maxima / upsample_factor).astype(float_dtype, copy=False)
+
+
+def _correlation_values(cross_correlation: npt.NDArray, real: bool, xp=np) -> np.ndarray:
+    """
+    The real part of `cross_correlation` if `real`, otherwise its magnitude.
+
+    :meta private:
+    """
+    if real:
+        return cross_correlation.real
+    return xp.abs(cross_correlation)
+
+
+def _argmax_2d(images: npt.NDArray, xp=np) -> np.ndarray:
+    """
+    Positions (y, x) of the maximum of each image in a stack of shape
+    (..., h, w), as an integer array of shape (..., 2).
+
+    :meta private:
+    """
+    flat_idx = xp.argmax(images.reshape(images.shape[:-2] + (-1,)), axis=-1)
+    return xp.stack(xp.unravel_index(flat_idx, images.shape[-2:]), axis=-1)
 
 
 def _plot_cross_correlate(*, shifted_corr, pos, plot_title, src, target):
+    import matplotlib.pyplot as plt
+    from sparseconverter import NUMPY, for_backend
+
     fig, ax = plt.subplots(3, sharex=True, sharey=True)
     ax[0].imshow(for_backend(shifted_corr, NUMPY))
     ax[0].plot(pos[1], pos[0], 'x', color='red')
@@ -69,6 +145,10 @@ def cross_correlate(
     normalization: Literal['phase'] | None = 'phase',
     upsample_factor=1,
     xp=np,
+    *,
+    src_freq: np.ndarray | None = None,
+    target_freq: np.ndarray | None = None,
+    packed: bool = False,
 ) -> tuple[np.ndarray, np.ndarray]:
     """Rigid image registration by cross-correlation.
 
@@ -96,61 +176,37 @@ def cross_correlate(
 
     xp
         numpy or cupy
-    """
-    src = xp.asarray(src)
-    target = xp.asarray(target)
-    src_freq = xp.fft.fftn(src)
-    target_freq = xp.fft.fftn(target)
-    image_product = src_freq * target_freq.conj()
 
-    if normalization == 'phase':
-        eps = np.finfo(image_product.real.dtype).eps
-        image_product /= np.maximum(np.abs(image_product), 100 * eps)
-    elif normalization is not None:
-        raise ValueError(f"unknown normalization {normalization}")
+    src_freq
+        The forward FFT of `src`, if it was already computed. In that case,
+        `src` is only used for plotting and can be `None`.
 
-    cross_correlation = xp.fft.ifftn(image_product)
-    shifted_corr = xp.fft.fftshift(np.abs(cross_correlation))
+    target_freq
+        The forward FFT of `target`, if it was already computed. In that case,
+        `target` is only used for plotting and can be `None`.
 
-    maxima = xp.unravel_index(
-        xp.argmax(shifted_corr),
-        shifted_corr.shape
+    packed
+        Whether `src` and `target` each pack two real images `a` and `b`
+        as :code:`a + 1j * b`, see :func:`cross_correlate_batch`
+    """
+    from sparseconverter import NUMPY, for_backend
+
+    if src_freq is None:
+        src_freq = xp.fft.fftn(xp.asarray(src))
+    if target_freq is None:
+        target_freq = xp.fft.fftn(xp.asarray(target))
+
+    shifts, shifted_corrs = cross_correlate_batch(
+        src_freq,
+        target_freq[None],
+        normalization=normalization,
+        upsample_factor=upsample_factor,
+        xp=xp,
+        packed=packed,
     )
-    float_dtype = image_product.real.dtype
+    shift = shifts[0]
+    shifted_corr = shifted_corrs[0]
     midpoint = xp.array([xp.fix(axis_size / 2) for axis_size in src_freq.shape])
-    shift = xp.stack(maxima).astype(float_dtype, copy=False)
-    shift -= midpoint
-
-    # estimate sublixel shifts using the upsampled DFT method:
-    if upsample_factor > 1:
-        frequencies = (
-            xp.fft.fftfreq(src.shape[0], upsample_factor),
-            xp.fft.fftfreq(src.shape[1], upsample_factor),
-        )
-
-        # Initial shift estimate in upsampled grid
-        upsample_factor = xp.array(upsample_factor, dtype=float_dtype)
-        shift = xp.round(shift * upsample_factor) / upsample_factor
-        upsampled_region_size = xp.ceil(upsample_factor * 1.5)
-        # Center of output array at dftshift + 1
-        dftshift = xp.fix(upsampled_region_size / 2.0)
-        # Matrix multiply DFT around the current shift estimate
-        sample_region_offset = dftshift - np.round(shift * upsample_factor)
-        cross_correlation = _upsampled_dft(
-            image_product.conj(),
-            frequencies,
-            upsampled_region_size,
-            sample_region_offset,
-        ).conj()
-        # Locate maximum and map back to original pixel grid
-        maxima = xp.unravel_index(
-            xp.argmax(xp.abs(cross_correlation)), cross_correlation.shape
-        )
-
-        maxima = xp.stack(maxima).astype(float_dtype, copy=False)
-        maxima -= dftshift
-
-        shift += maxima / upsample_factor
 
     if xp is np:
         shift = tuple(float(x) for x in shift)
@@ -161,6 +217,10 @@ def cross_correlate(
     pos = xp.array(shift) + midpoint
 
     if plot:
+        if src is None:
+            src = xp.fft.ifftn(src_freq).real
+        if target is None:
+            target = xp.fft.ifftn(target_freq).real
         _plot_cross_correlate(
             shifted_corr=shifted_corr,
             pos=pos,
@@ -172,10 +232,188 @@ def cross_correlate(
     return pos, shifted_corr
 
 
-def gradient(image: np.ndarray, scale=1):
+def _unpack_spectra(
+    packed_freqs: npt.NDArray,
+    xp=np,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Split the spectra of packed images :code:`a + 1j * b`, with real `a`
+    and `b`, into the spectra of `a` and `b`, using that the spectrum of
+    a real image is conjugate symmetric.
+
+    :meta private:
+    """
+    reversed_conj = xp.roll(
+        xp.flip(packed_freqs, axis=(-2, -1)), 1, axis=(-2, -1),
+    ).conj()
+    return (packed_freqs + reversed_conj) / 2, (packed_freqs - reversed_conj) / 2j
+
+
+def _cross_power_spectra(
+    src_freq: npt.NDArray,
+    target_freqs: npt.NDArray,
+    normalization: Literal['phase'] | None,
+    xp=np,
+    packed: bool = False,
+) -> np.ndarray:
+    """
+    The (optionally normalized) cross-power spectra of `target_freqs` with
+    shape (N, h, w) against `src_freq` with shape (h, w).
+
+    For `packed` spectra, the cross-power spectra of both components are
+    computed and normalized separately, and then summed.
+
+    :meta private:
+    """
+    if packed:
+        src_a, src_b = _unpack_spectra(src_freq, xp=xp)
+        target_a, target_b = _unpack_spectra(target_freqs, xp=xp)
+        return (
+            _cross_power_spectra(src_a, target_a, normalization, xp=xp)
+            + _cross_power_spectra(src_b, target_b, normalization, xp=xp)
+        )
+    image_products = src_freq * target_freqs.conj()
+    if normalization == 'phase':
+        eps = np.finfo(image_products.real.dtype).eps
+        image_products /= xp.maximum(xp.abs(image_products), 100 * eps)
+    elif normalization is not None:
+        raise ValueError(f"unknown normalization {normalization}")
+    return image_products
+
+
+def cross_correlate_batch(
+    src_freq: np.ndarray,
+    target_freqs: np.ndarray,
+    normalization: Literal['phase'] | None = 'phase',
+    upsample_factor: int = 1,
+    xp=np,
+    *,
+    prior: np.ndarray | tuple[float, float] | None = None,
+    search_radius: int | None = None,
+    packed: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Register a stack of images against a common static image.
+
+    This is the batched equivalent of :func:`cross_correlate`, working on
+    spectra: the correlation maps are computed with a single stacked inverse
+    FFT, and the subpixel refinement of all images is done using batched
+    matrix multiplications on the backend given by `xp`.
+
+    If a `prior` and a `search_radius` are given, the correlation is only
+    evaluated for shifts within `search_radius` pixels around the prior,
+    using a matrix DFT instead of the inverse FFT. This is faster if the
+    window is small compared to the images, for example if the shift is
+    known approximately from the previous frame of a drifting series.
+
+    Parameters
+    ==========
+    src_freq
+        The forward FFT of the static image, with shape (h, w), or one static
+        image per moving image, with shape (N, h, w). In general, any shape
+        that broadcasts against `target_freqs`, so several static images can
+        be shared without repeating them, for example with shape (1, T, h, w)
+        against moving images with shape (N, T, h, w).
+
+    target_freqs
+        The forward FFTs of the moving images, with shape (N, h, w), or
+        with more leading axes, which are kept in the results
+
+    normalization
+        'phase' or None, same as for :func:`cross_correlate`
+
+    upsample_factor
+        Subpixel scaling factor, same as for :func:`cross_correlate`
+
+    xp
+        numpy or cupy
+
+    prior
+        The expected (y, x) shift, either one for all images, or an array
+        of shape (N, 2)
+
+    search_radius
+        Only search for the shift within this many pixels around `prior`
+
+    packed
+        Whether the images each pack two real images `a` and `b` as
+        :code:`a + 1j * b`. The correlation is then the sum of the
+        correlations of `a` and `b`, each normalized separately, which is
+        real, so its real part is used instead of the magnitude.
+
+    Returns
+    =======
+    shifts
+        Array of shape (N, 2), with the (y, x) shift of each image
+        relative to the static image
+
+    corrmaps
+        The fft-shifted correlation maps, with shape (N, h, w). If searching
+        around a prior, these are the correlation values within the search
+        window, with shape (N, 2 * search_radius + 1, 2 * search_radius + 1),
+        centered on the rounded prior.
+    """
+    image_products = _cross_power_spectra(
+        src_freq, target_freqs, normalization, xp=xp, packed=packed,
+    )
+
+    if prior is not None and search_radius is not None:
+        float_dtype = image_products.real.dtype
+        shifts = xp.round(xp.broadcast_to(
+            xp.asarray(prior, dtype=float_dtype),
+            image_products.shape[:-2] + (2,),
+        ))
+        shifts, window_corrs = _window_search(
+            image_products, shifts, search_radius, xp=xp, real=packed,
+        )
+        if upsample_factor > 1:
+            shifts = _refine_shifts(
+                image_products, shifts, upsample_factor, xp=xp, real=packed,
+            )
+        return shifts, window_corrs
+
+    cross_correlation = xp.fft.ifftn(image_products, axes=(-2, -1))
+    shifted_corrs = xp.fft.fftshift(
+        _correlation_values(cross_correlation, packed, xp=xp), axes=(-2, -1),
+    )
+
+    float_dtype = image_products.real.dtype
+    shifts = _argmax_2d(shifted_corrs, xp=xp).astype(float_dtype)
+    shifts -= xp.asarray(
+        [math.trunc(axis_size / 2) for axis_size in image_products.shape[-2:]],
+        dtype=float_dtype,
+    )
+
+    # estimate subpixel shifts using the upsampled DFT method:
+    if upsample_factor > 1:
+        shifts = _refine_shifts(image_products, shifts, upsample_factor, xp=xp, real=packed)
+    return shifts, shifted_corrs
+
+
+def gradient(image: np.ndarray, scale=1, xp=np):
     scale = [scale] * image.ndim
-    gradients = np.gradient(np.asarray(image), *scale)
-    return np.stack(gradients, axis=-1)
+    gradients = xp.gradient(xp.asarray(image), *scale)
+    return xp.stack(gradients, axis=-1)
+
+
+def phase_gradient(wave: np.ndarray, scale=1, xp=np):
+    """Gradient of the phase of a complex wave, without unwrapping.
+
+    The differences are computed as the angle of products like
+    :code:`w[i + 1] * conj(w[i - 1])`, which are free of phase wraps as long
+    as the phase changes by less than π between the neighbors. Otherwise
+    this is the same as :func:`gradient` of the unwrapped phase: central
+    differences in the interior and one-sided differences at the edges.
+    """
+    wave = xp.asarray(wave)
+    grads = []
+    for axis in range(wave.ndim):
+        w = xp.moveaxis(wave, axis, 0)
+        grad = xp.empty(w.shape, dtype=w.real.dtype)
+        grad[1:-1] = xp.angle(w[2:] * w[:-2].conj()) / (2 * scale)
+        grad[0] = xp.angle(w[1] * w[0].conj()) / scale
+        grad[-1] = xp.angle(w[-1] * w[-2].conj()) / scale
+        grads.append(xp.moveaxis(grad, 0, axis))
+    return xp.stack(grads, axis=-1)
 
 
 def get_grad_angle(image, scale=3):
@@ -190,6 +428,37 @@ def get_grad_xy(image, scale=3):
     return (grad[..., 0], grad[..., 1])
 
 
+InputSource = Literal['hologram', 'wave', 'phase']
+ShiftMethod = Literal['fourier', 'linear', 'cubic', 'lanczos']
+
+
+def _check_source(source: InputSource, holoparams: HoloParams | None) -> None:
+    if source not in ('hologram', 'wave', 'phase'):
+        raise ValueError(f"unknown source {source}")
+    if source == 'hologram' and holoparams is None:
+        raise ValueError("holoparams are needed to reconstruct holograms")
+
+
+def _get_phase_gradient(
+    img: np.ndarray,
+    source: InputSource,
+    holoparams: HoloParams | None,
+    scale: float,
+    xp=np,
+) -> np.ndarray:
+    """
+    The gradient of the phase of `img`, which is a hologram, a reconstructed
+    wave or a phase image, depending on `source`.
+
+    :meta private:
+    """
+    if source == 'wave':
+        return phase_gradient(img, scale=scale, xp=xp)
+    if source == 'hologram':
+        img = get_phase(img, holoparams, xp=xp)
+    return gradient(img, scale=scale, xp=xp)
+
+
 def is_left(
     a: np.ndarray,
     b: np.ndarray,
@@ -208,13 +477,73 @@ class RegResult(NamedTuple):
     corrmap: np.ndarray
 
 
+class CachedSpectrum(NamedTuple):
+    """A pre-processed image, together with its forward FFT.
+
+    Can be returned from :meth:`Correlator.prepare_input` or
+    :meth:`Correlator.prepare_reference`, so the spectrum doesn't need
+    to be computed again for each correlation.
+    """
+    image: np.ndarray
+    spectrum: np.ndarray
+
+
+def _unpack_spectrum(
+    prepared: typing.Any,
+) -> tuple[np.ndarray, np.ndarray | None]:
+    if isinstance(prepared, CachedSpectrum):
+        return prepared.image, prepared.spectrum
+    return prepared, None
+
+
 class Correlator:
+    def _cached_plan(
+        self,
+        key: typing.Hashable,
+        build: typing.Callable[[], typing.Any],
+    ) -> typing.Any:
+        """Return the pre-processing plan for `key`, building it on first use.
+
+        Plans are things like filters or windows that only depend on the
+        shape of the input, so they can be re-used for all frames.
+        """
+        plans = self.__dict__.setdefault("_plans", {})
+        if key not in plans:
+            plans[key] = build()
+        return plans[key]
+
     def prepare_input(
         self,
         img: np.ndarray,
     ) -> typing.Any:
         raise NotImplementedError()
 
+    def prepare_reference(
+        self,
+        img: np.ndarray,
+    ) -> typing.Any:
+        """Pre-process the static reference image.
+
+        This is only called once per stack, so implementations can cache
+        expensive representations of the reference here, like its spectrum.
+        The result is passed as `ref_image` to :meth:`correlate`. By default,
+        this is the same as :meth:`prepare_input`.
+        """
+        return self.prepare_input(img)
+
+    def prepare_batch(
+        self,
+        imgs: np.ndarray,
+    ) -> list[typing.Any]:
+        """Pre-process a batch of moving images.
+
+        Returns a list with one entry per image, each of which can be
+        passed as `moving_image` to :meth:`correlate`. Override this if
+        the pre-processing can be done more efficiently for many images
+        at once.
+        """
+        return [self.prepare_input(img) for img in imgs]
+
     def correlate(
         self,
         ref_image: typing.Any,
@@ -223,8 +552,166 @@ class Correlator:
     ) -> RegResult:
         raise NotImplementedError()
 
+    def correlate_batch(
+        self,
+        ref_image: typing.Any,
+        moving_images: list[typing.Any],
+        *,
+        prior: tuple[float, float] | None = None,
+        search_radius: int | None = None,
+    ) -> list[RegResult]:
+        """Register a batch of moving images, as returned from
+        :meth:`prepare_batch`, against the reference.
+
+        Returns a list with one :class:`RegResult` per image. Override this
+        if the registration can be done more efficiently for many images
+        at once.
+
+        Correlators that support it only search for shifts within
+        `search_radius` pixels around the expected shift `prior`, if both
+        are given. By default, they are ignored and the whole correlation
+        map is searched.
+        """
+        return [
+            self.correlate(ref_image, moving_image, plot=False)
+            for moving_image in moving_images
+        ]
+
 
-class ImageCorrelator(Correlator):
+class FFTCorrelator(Correlator):
+    """
+    Base class for correlators that register the pre-processed images
+    using :func:`cross_correlate`. Subclasses need to implement
+    :meth:`prepare_input`, and set the `_xp`, `_upsample_factor` and
+    `_normalization` attributes.
+
+    The reference is prepared as a :class:`CachedSpectrum`, so its forward
+    FFT is only computed once per stack. Subclasses that pack two real
+    images into one complex image set `_packed`, see
+    :func:`cross_correlate_batch`.
+    """
+    _xp: typing.Any = np
+    _upsample_factor: int = 1
+    _normalization: Literal['phase'] | None = 'phase'
+    _packed: bool = False
+
+    def prepare_reference(
+        self,
+        img: np.ndarray,
+    ) -> CachedSpectrum:
+        xp = self._xp
+        image = xp.asarray(self.prepare_input(img))
+        return CachedSpectrum(image=image, spectrum=xp.fft.fftn(image))
+
+    def prepare_batch(
+        self,
+        imgs: np.ndarray,
+    ) -> list[CachedSpectrum]:
+        """
+        Pre-process each image, and compute the spectra of the whole
+        batch using a single stacked FFT.
+        """
+        xp = self._xp
+        images = xp.stack([xp.asarray(self.prepare_input(img)) for img in imgs])
+        spectra = xp.fft.fftn(images, axes=(-2, -1))
+        return [
+            CachedSpectrum(image=image, spectrum=spectrum)
+            for image, spectrum in zip(images, spectra)
+        ]
+
+    def correlate(
+        self,
+        ref_image: typing.Any,
+        moving_image: typing.Any,
+        plot: bool = False,
+    ) -> RegResult:
+        ref_image, ref_freq = _unpack_spectrum(ref_image)
+        moving_image, moving_freq = _unpack_spectrum(moving_image)
+        pos, corrmap = cross_correlate(
+            ref_image,
+            moving_image,
+            xp=self._xp,
+            plot=plot,
+            upsample_factor=self._upsample_factor,
+            normalization=self._normalization,
+            src_freq=ref_freq,
+            target_freq=moving_freq,
+            packed=self._packed,
+        )
+        pos_rel = (
+            pos[0] - (corrmap.shape[0]) // 2,
+            pos[1] - (corrmap.shape[1]) // 2,
+        )
+        return RegResult(maximum=pos, shift=pos_rel, corrmap=corrmap)
+
+    def correlate_batch(
+        self,
+        ref_image: typing.Any,
+        moving_images: list[typing.Any],
+        *,
+        prior: tuple[float, float] | None = None,
+        search_radius: int | None = None,
+    ) -> list[RegResult]:
+        """
+        Register the whole batch using :func:`cross_correlate_batch`.
+        """
+        ref_freq, moving_freqs = self._batch_spectra(ref_image, moving_images)
+        shifts, corrmaps = cross_correlate_batch(
+            ref_freq,
+            moving_freqs,
+            normalization=self._normalization,
+            upsample_factor=self._upsample_factor,
+            xp=self._xp,
+            prior=prior,
+            search_radius=search_radius,
+            packed=self._packed,
+        )
+        return self._make_results(shifts, corrmaps, ref_freq.shape)
+
+    def _batch_spectra(
+        self,
+        ref_image: typing.Any,
+        moving_images: list[typing.Any],
+    ) -> tuple[np.ndarray, np.ndarray]:
+        xp = self._xp
+        ref_image, ref_freq = _unpack_spectrum(ref_image)
+        if ref_freq is None:
+            ref_freq = xp.fft.fftn(xp.asarray(ref_image))
+        moving_freqs = []
+        for moving_image in moving_images:
+            moving_image, moving_freq = _unpack_spectrum(moving_image)
+            if moving_freq is None:
+                moving_freq = xp.fft.fftn(xp.asarray(moving_image))
+            moving_freqs.append(moving_freq)
+        return ref_freq, xp.stack(moving_freqs)
+
+    def _hanning_window(self, shape: tuple[int, int]) -> np.ndarray:
+        """The 2D hanning window for `shape`, built once per shape."""
+        xp = self._xp
+        shape = tuple(shape)
+        return self._cached_plan(
+            ("hanning", shape),
+            lambda: xp.outer(xp.hanning(shape[0]), xp.hanning(shape[1])),
+        )
+
+    def _make_results(
+        self,
+        shifts: np.ndarray,
+        corrmaps: np.ndarray,
+        shape: tuple[int, ...],
+    ) -> list[RegResult]:
+        xp = self._xp
+        midpoint = xp.asarray([axis_size // 2 for axis_size in shape])
+        positions = shifts + midpoint
+        if xp is not np:
+            shifts = shifts.get()
+        return [
+            RegResult(maximum=pos, shift=tuple(float(x) for x in shift), corrmap=corrmap)
+            for pos, shift, corrmap in zip(positions, shifts, corrmaps)
+        ]
+
+
+class ImageCorrelator(FFTCorrelator):
     """
     Cross correlation based image registration with some
     pre-filtering. Assumes real-space images as input.
@@ -256,7 +743,7 @@ class ImageCorrelator(Correlator):
 
         # apply hanning filter:
         if self._hanning:
-            img = img * xp.outer(xp.hanning(img.shape[0]), xp.hanning(img.shape[1]))
+            img = img * self._hanning_window(img.shape)
 
         # apply binning:
         if self._zoom_factor != 1:
@@ -270,50 +757,74 @@ class ImageCorrelator(Correlator):
         moving_image: typing.Any,
         plot: bool = False,
     ) -> RegResult:
-        pos, corrmap = cross_correlate(
-            ref_image,
-            moving_image,
-            xp=self._xp,
-            plot=plot,
-            upsample_factor=self._upsample_factor,
-            normalization=self._normalization,
-        )
-        pos_rel = (
-            pos[0] - (moving_image.shape[0]) // 2,
-            pos[1] - (moving_image.shape[1]) // 2,
+        result = super().correlate(ref_image, moving_image, plot=plot)
+        return self._unbin(result)
+
+    def correlate_batch(
+        self,
+        ref_image: typing.Any,
+        moving_images: list[typing.Any],
+        *,
+        prior: tuple[float, float] | None = None,
+        search_radius: int | None = None,
+    ) -> list[RegResult]:
+        if prior is not None and search_radius is not None:
+            # the correlation happens on the binned images:
+            prior = tuple(float(x) * self._zoom_factor for x in prior)
+            search_radius = math.ceil(search_radius * self._zoom_factor)
+        results = super().correlate_batch(
+            ref_image, moving_images, prior=prior, search_radius=search_radius,
         )
+        return [self._unbin(result) for result in results]
+
+    def _unbin(self, result: RegResult) -> RegResult:
         if self._binning != 1:
             pos_rel = (
-                pos_rel[0] / self._zoom_factor,
-                pos_rel[1] / self._zoom_factor,
+                result.shift[0] / self._zoom_factor,
+                result.shift[1] / self._zoom_factor,
             )
-        return RegResult(maximum=pos, shift=pos_rel, corrmap=corrmap)
+            result = result._replace(shift=pos_rel)
+        return result
 
 
-class BiprismDeletionCorrelator(Correlator):
+class PyramidCorrelator(FFTCorrelator):
     """
-    Cross correlation on low magnification while removing biprism.
+    Coarse-to-fine cross correlation based image registration, for large
+    images with large shifts. Assumes real-space images as input.
+
+    The cross-power spectrum is cropped to its lowest frequencies, which is
+    an exact downsampling by `downsample`, and the coarse shift is found
+    using a small inverse FFT. It is then refined at full resolution, only
+    evaluating the correlation within a window of about `downsample` pixels
+    around the coarse shift, using a matrix DFT. This avoids the full-size
+    inverse FFT of :class:`ImageCorrelator`.
+
+    The returned correlation maps are the coarse ones, with a shape
+    reduced by `downsample`. Plotting is not supported.
     """
     def __init__(
         self,
-        mask: np.ndarray,
+        downsample: int = 4,
         upsample_factor: int = 1,
         normalization: Literal['phase'] | None = 'phase',
+        hanning: bool = True,
         xp: typing.Any = np,
     ) -> None:
-        self._mask = mask
+        if downsample < 1:
+            raise ValueError(f"downsample should be at least 1, is {downsample}")
         self._xp = xp
+        self._downsample = downsample
         self._upsample_factor = upsample_factor
         self._normalization = normalization
+        self._hanning = hanning
 
     def prepare_input(
         self,
         img: np.ndarray,
     ) -> typing.Any:
-        overview = np.zeros_like(img)
-        overview[:] = img
-        overview[self._mask] = img.mean()
-        return overview
+        if self._hanning:
+            img = img * self._hanning_window(img.shape)
+        return img
 
     def correlate(
         self,
@@ -321,19 +832,352 @@ class BiprismDeletionCorrelator(Correlator):
         moving_image: typing.Any,
         plot: bool = False,
     ) -> RegResult:
-        pos, corrmap = cross_correlate(
-            ref_image,
-            moving_image,
-            xp=self._xp,
-            plot=plot,
-            upsample_factor=self._upsample_factor,
+        return self.correlate_batch(ref_image, [moving_image])[0]
+
+    def correlate_batch(
+        self,
+        ref_image: typing.Any,
+        moving_images: list[typing.Any],
+        *,
+        prior: tuple[float, float] | None = None,
+        search_radius: int | None = None,
+    ) -> list[RegResult]:
+        if prior is not None and search_radius is not None:
+            # the prior replaces the coarse level:
+            return super().correlate_batch(
+                ref_image, moving_images, prior=prior, search_radius=search_radius,
+            )
+        xp = self._xp
+        ref_freq, moving_freqs = self._batch_spectra(ref_image, moving_images)
+        image_products = _cross_power_spectra(
+            ref_freq, moving_freqs, self._normalization, xp=xp,
+        )
+
+        # coarse level: keep only the lowest frequencies
+        shape = image_products.shape[-2:]
+        coarse_shape = tuple(max(1, size // self._downsample) for size in shape)
+        idx_y = _low_frequency_indices(shape[0], coarse_shape[0], xp=xp)
+        idx_x = _low_frequency_indices(shape[1], coarse_shape[1], xp=xp)
+        coarse_products = image_products[:, idx_y[:, None], idx_x[None, :]]
+        coarse_corrs = xp.fft.fftshift(
+            xp.abs(xp.fft.ifftn(coarse_products, axes=(-2, -1))),
+            axes=(-2, -1),
+        )
+        float_dtype = image_products.real.dtype
+        coarse_midpoint = xp.asarray([size // 2 for size in coarse_shape], dtype=float_dtype)
+        scale = xp.asarray([
+            size / coarse_size for size, coarse_size in zip(shape, coarse_shape)
+        ], dtype=float_dtype)
+        shifts = _argmax_2d(coarse_corrs, xp=xp).astype(float_dtype)
+        shifts = xp.round((shifts - coarse_midpoint) * scale)
+
+        # fine level: search around the coarse shift at full resolution
+        radius = math.ceil(max(
+            size / coarse_size for size, coarse_size in zip(shape, coarse_shape)
+        ))
+        shifts, _ = _window_search(image_products, shifts, radius, xp=xp)
+        if self._upsample_factor > 1:
+            shifts = _refine_shifts(image_products, shifts, self._upsample_factor, xp=xp)
+        return self._make_results(shifts, coarse_corrs, shape)
+
+
+def _low_frequency_indices(size: int, cropped_size: int, xp=np) -> np.ndarray:
+    """
+    Indices of the `cropped_size` lowest frequencies of a non-shifted
+    spectrum of length `size`, in the order of a non-shifted spectrum of
+    length `cropped_size`.
+
+    :meta private:
+    """
+    return xp.concatenate([
+        xp.arange(0, (cropped_size + 1) // 2),
+        xp.arange(size - cropped_size // 2, size),
+    ])
+
+
+def _window_search(
+    image_products: npt.NDArray,
+    shifts: npt.NDArray,
+    radius: int,
+    xp=np,
+    real: bool = False,
+) -> np.ndarray:
+    """
+    Find the integer shift with the highest correlation within `radius`
+    pixels around `shifts`, for each of the cross-power spectra
+    `image_products` of shape (N, h, w), using a matrix DFT.
+
+    Returns the shifts, and the absolute correlation values within the
+    windows, with shape (N, 2 * radius + 1, 2 * radius + 1), normalized
+    like the result of an inverse FFT. With `real`, the real part of the
+    correlation is used instead.
+
+    :meta private:
+    """
+    float_dtype = image_products.real.dtype
+    frequencies = (
+        xp.fft.fftfreq(image_products.shape[-2]),
+        xp.fft.fftfreq(image_products.shape[-1]),
+    )
+    cross_correlation = _upsampled_dft(
+        image_products.conj(),
+        frequencies,
+        2 * radius + 1,
+        radius - shifts,
+        xp=xp,
+    ).conj()
+    window_corrs = _correlation_values(
+        cross_correlation, real, xp=xp,
+    ) / math.prod(image_products.shape[-2:])
+    maxima = _argmax_2d(window_corrs, xp=xp).astype(float_dtype, copy=False)
+    return (shifts + maxima - radius).astype(float_dtype, copy=False), window_corrs
+
+
+class Projections(NamedTuple):
+    """The pre-processed input of :class:`ProjectionCorrelator`.
+
+    Contains the spectra of the row and column projections of an image,
+    and optionally the spectrum of the image itself, for the refinement.
+    """
+    row_freq: np.ndarray
+    col_freq: np.ndarray
+    spectrum: np.ndarray | None
+
+
+class ProjectionCorrelator(Correlator):
+    """
+    Fast, coarse registration by correlating the row and column projections
+    of the images with 1D FFTs. Assumes real-space images as input.
+
+    The y shift is found from the projection onto the y axis (the sum of
+    each row), and the x shift from the projection onto the x axis. This
+    is only exact for shifts of images with a static background, but is a
+    good estimate for quick-look drift measurements on many frames.
+
+    If `refine_radius` is given, the estimate is refined by a 2D correlation
+    within this many pixels around it, see :func:`cross_correlate_batch`.
+    This needs the 2D spectra of the images.
+
+    The correlation maps are the 1D correlations of the row and the column
+    projections, concatenated, or the 2D correlation within the search
+    window, if `refine_radius` is given.
+    """
+    def __init__(
+        self,
+        upsample_factor: int = 1,
+        normalization: Literal['phase'] | None = 'phase',
+        hanning: bool = True,
+        refine_radius: int | None = None,
+        xp: typing.Any = np,
+    ) -> None:
+        self._xp = xp
+        self._upsample_factor = upsample_factor
+        self._normalization = normalization
+        self._hanning = hanning
+        self._refine_radius = refine_radius
+
+    def prepare_input(
+        self,
+        img: np.ndarray,
+    ) -> Projections:
+        projections = self.prepare_batch(self._xp.asarray(img)[None])
+        return projections[0]
+
+    def prepare_batch(
+        self,
+        imgs: np.ndarray,
+    ) -> list[Projections]:
+        xp = self._xp
+        imgs = xp.stack([xp.asarray(img) for img in imgs])
+        height, width = imgs.shape[-2:]
+        # integer frames, like raw detector data, are projected in float64,
+        # so the projections can be centered in-place:
+        dtype = imgs.dtype if np.issubdtype(imgs.dtype, np.inexact) else np.float64
+        rows = imgs.sum(axis=-1, dtype=dtype)
+        cols = imgs.sum(axis=-2, dtype=dtype)
+        rows -= rows.mean(axis=-1, keepdims=True)
+        cols -= cols.mean(axis=-1, keepdims=True)
+        if self._hanning:
+            rows *= self._cached_plan(("hanning", height), lambda: xp.hanning(height))
+            cols *= self._cached_plan(("hanning", width), lambda: xp.hanning(width))
+        row_freqs = xp.fft.fft(rows, axis=-1)
+        col_freqs = xp.fft.fft(cols, axis=-1)
+        if self._refine_radius is not None:
+            if self._hanning:
+                imgs = imgs * self._cached_plan(
+                    ("hanning", height, width),
+                    lambda: xp.outer(xp.hanning(height), xp.hanning(width)),
+                )
+            spectra = xp.fft.fftn(imgs, axes=(-2, -1))
+        else:
+            spectra = [None] * imgs.shape[0]
+        return [
+            Projections(row_freq=row_freq, col_freq=col_freq, spectrum=spectrum)
+            for row_freq, col_freq, spectrum in zip(row_freqs, col_freqs, spectra)
+        ]
+
+    def correlate(
+        self,
+        ref_image: typing.Any,
+        moving_image: typing.Any,
+        plot: bool = False,
+    ) -> RegResult:
+        return self.correlate_batch(ref_image, [moving_image])[0]
+
+    def correlate_batch(
+        self,
+        ref_image: typing.Any,
+        moving_images: list[typing.Any],
+        *,
+        prior: tuple[float, float] | None = None,
+        search_radius: int | None = None,
+    ) -> list[RegResult]:
+        xp = self._xp
+        shift_y, corr_y = _cross_correlate_1d(
+            ref_image.row_freq,
+            xp.stack([moving.row_freq for moving in moving_images]),
             normalization=self._normalization,
+            upsample_factor=self._upsample_factor,
+            xp=xp,
         )
-        pos_rel = (
-            pos[0] - (moving_image.shape[0]) // 2,
-            pos[1] - (moving_image.shape[1]) // 2,
+        shift_x, corr_x = _cross_correlate_1d(
+            ref_image.col_freq,
+            xp.stack([moving.col_freq for moving in moving_images]),
+            normalization=self._normalization,
+            upsample_factor=self._upsample_factor,
+            xp=xp,
         )
-        return RegResult(maximum=pos, shift=pos_rel, corrmap=corrmap)
+        shifts = xp.stack([shift_y, shift_x], axis=-1)
+        corrmaps = xp.concatenate([corr_y, corr_x], axis=-1)
+        shape = (ref_image.row_freq.shape[0], ref_image.col_freq.shape[0])
+        if self._refine_radius is not None:
+            shifts, corrmaps = cross_correlate_batch(
+                ref_image.spectrum,
+                xp.stack([moving.spectrum for moving in moving_images]),
+                normalization=self._normalization,
+                upsample_factor=self._upsample_factor,
+                xp=xp,
+                prior=shifts,
+                search_radius=self._refine_radius,
+            )
+        midpoint = xp.asarray([axis_size // 2 for axis_size in shape])
+        positions = shifts + midpoint
+        if xp is not np:
+            shifts = shifts.get()
+        return [
+            RegResult(maximum=pos, shift=tuple(float(x) for x in shift), corrmap=corrmap)
+            for pos, shift, corrmap in zip(positions, shifts, corrmaps)
+        ]
+
+
+def _cross_correlate_1d(
+    src_freq: npt.NDArray,
+    target_freqs: npt.NDArray,
+    normalization: Literal['phase'] | None,
+    upsample_factor: int,
+    xp=np,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    1D version of :func:`cross_correlate_batch`, for spectra `target_freqs`
+    of shape (N, n) against `src_freq` of shape (n,). Returns the shifts
+    with shape (N,) and the fft-shifted correlations with shape (N, n).
+
+    :meta private:
+    """
+    image_products = _cross_power_spectra(src_freq, target_freqs, normalization, xp=xp)
+    size = image_products.shape[-1]
+    float_dtype = image_products.real.dtype
+    corrs = xp.fft.fftshift(xp.abs(xp.fft.ifft(image_products, axis=-1)), axes=-1)
+    shifts = xp.argmax(corrs, axis=-1).astype(float_dtype) - size // 2
+
+    if upsample_factor > 1:
+        # upsampled DFT around the current estimate, like in _refine_shifts:
+        shifts = xp.round(shifts * upsample_factor) / upsample_factor
+        upsampled_region_size = math.ceil(upsample_factor * 1.5)
+        dftshift = math.trunc(upsampled_region_size / 2.0)
+        offsets = dftshift - xp.round(shifts * upsample_factor)
+        region = xp.arange(upsampled_region_size, dtype=np.float64)
+        freqs = xp.fft.fftfreq(size, upsample_factor)
+        kernel = xp.exp(
+            -2j * np.pi * (region - offsets[:, None])[..., None] * freqs
+        ).astype(image_products.dtype)
+        upsampled = xp.matmul(kernel, image_products.conj()[..., None])[..., 0].conj()
+        maxima = xp.argmax(xp.abs(upsampled), axis=-1).astype(float_dtype) - dftshift
+        shifts = (shifts + maxima / upsample_factor).astype(float_dtype)
+    return shifts, corrs
+
+
+class SpectrumCorrelator(FFTCorrelator):
+    """
+    Register complex waves directly on their spectra, as returned by
+    :func:`~libertem_holo.base.reconstr.reconstruct_spectrum` or as the
+    :code:`spectrum` result of :class:`~libertem_holo.udf.HoloReconstructUDF`.
+
+    The reconstruction already has the cropped and masked sideband of each
+    hologram, which is the forward FFT of the wave, so the registration only
+    needs the cross-power spectrum and a single inverse FFT per frame. As the
+    complex waves are correlated, a constant phase offset between them
+    doesn't matter.
+
+    To use it with :func:`align_stack`, pass the spectra as `stack`, and the
+    waves as `wave_stack`. No window can be applied in this domain, as opposed to
+    :class:`ImageCorrelator`, but the aperture already limits the bandwidth
+    of the waves.
+    """
+    def __init__(
+        self,
+        upsample_factor: int = 1,
+        normalization: Literal['phase'] | None = 'phase',
+        xp: typing.Any = np,
+    ) -> None:
+        self._xp = xp
+        self._upsample_factor = upsample_factor
+        self._normalization = normalization
+
+    def prepare_input(
+        self,
+        img: np.ndarray,
+    ) -> CachedSpectrum:
+        spectrum = self._xp.asarray(img)
+        return CachedSpectrum(image=spectrum, spectrum=spectrum)
+
+    def prepare_reference(
+        self,
+        img: np.ndarray,
+    ) -> CachedSpectrum:
+        return self.prepare_input(img)
+
+    def prepare_batch(
+        self,
+        imgs: np.ndarray,
+    ) -> list[CachedSpectrum]:
+        return [self.prepare_input(img) for img in imgs]
+
+
+class BiprismDeletionCorrelator(FFTCorrelator):
+    """
+    Cross correlation on low magnification while removing biprism.
+    """
+    def __init__(
+        self,
+        mask: np.ndarray,
+        upsample_factor: int = 1,
+        normalization: Literal['phase'] | None = 'phase',
+        xp: typing.Any = np,
+    ) -> None:
+        self._mask = mask
+        self._xp = xp
+        self._upsample_factor = upsample_factor
+        self._normalization = normalization
+
+    def prepare_input(
+        self,
+        img: np.ndarray,
+    ) -> typing.Any:
+        overview = np.zeros_like(img)
+        overview[:] = img
+        overview[self._mask] = img.mean()
+        return overview
 
     @classmethod
     def plot_get_coords(cls, img, coords_out):
@@ -346,6 +1190,8 @@ class BiprismDeletionCorrelator(Correlator):
         -----1-------2-----
         -----3-------4-----
         """
+        import matplotlib.pyplot as plt
+
         fig, ax = plt.subplots(1)
         ax.imshow(img)
 
@@ -364,7 +1210,7 @@ class BiprismDeletionCorrelator(Correlator):
         return mask
 
 
-class BrightFieldCorrelator(Correlator):
+class BrightFieldCorrelator(FFTCorrelator):
     """
     Cross correlation on bright field of hologram.
     """
@@ -380,169 +1226,160 @@ class BrightFieldCorrelator(Correlator):
         self._normalization = normalization
         self._upsample_factor = upsample_factor
 
-    def prepare_input(
+    def _build_plan(
         self,
-        img: np.ndarray,
-    ) -> typing.Any:
+        shape: tuple[int, int],
+    ) -> tuple[np.ndarray, tuple[slice, slice]]:
+        from scipy.ndimage import gaussian_filter
+
         holoparams = self._holoparams
         line_filter = central_line_filter(
             sb_position=holoparams.sb_position_int,
             out_shape=holoparams.out_shape,
-            orig_shape=img.shape,
+            orig_shape=shape,
             length_ratio=0.95,
             width=20
         )
         aperture = disk_aperture(out_shape=holoparams.out_shape, radius=holoparams.sb_size//3)
-        slice_fft = get_slice_fft(out_shape=holoparams.out_shape, sig_shape=img.shape)
+        slice_fft = get_slice_fft(out_shape=holoparams.out_shape, sig_shape=shape)
         line_filter = line_filter[slice_fft]
         aperture[np.fft.fftshift(line_filter)] = 0
         aperture = np.fft.fftshift(gaussian_filter(np.fft.fftshift(aperture), sigma=6))
-        holo_bf = np.abs(
+        return self._xp.asarray(aperture), slice_fft
+
+    def prepare_input(
+        self,
+        img: np.ndarray,
+    ) -> typing.Any:
+        xp = self._xp
+        # the aperture only depends on the shape, so it is built once:
+        aperture, slice_fft = self._cached_plan(
+            ("bf", tuple(img.shape)),
+            lambda: self._build_plan(tuple(img.shape)),
+        )
+        holo_bf = xp.abs(
             reconstruct_bf(
                 frame=img,
                 aperture=aperture,
                 slice_fft=slice_fft,
-                xp=self._xp
+                xp=xp,
             )
         )
-        holo_bf = np.gradient(holo_bf)[0]
-        return holo_bf
-
-    def correlate(
-        self,
-        ref_image: typing.Any,
-        moving_image: typing.Any,
-        plot: bool = False,
-    ) -> RegResult:
-        pos, corrmap = cross_correlate(
-            ref_image,
-            moving_image,
-            xp=self._xp,
-            plot=plot,
-            upsample_factor=self._upsample_factor,
-            normalization=self._normalization,
-        )
-        pos_rel = (
-            pos[0] - (moving_image.shape[0]) // 2,
-            pos[1] - (moving_image.shape[1]) // 2,
-        )
-        return RegResult(maximum=pos, shift=pos_rel, corrmap=corrmap)
+        return xp.gradient(holo_bf, axis=0)
 
 
-class PhaseImageCorrelator(Correlator):
+class PhaseImageCorrelator(FFTCorrelator):
     """
     Cross correlation on reconstructed phase image.
+
+    The input can be holograms (:code:`source='hologram'`), which are
+    reconstructed using `holoparams`, already reconstructed waves
+    (:code:`source='wave'`), which only need to be unwrapped, or unwrapped
+    phase images (:code:`source='phase'`), which are used as-is.
     """
 
     def __init__(
         self,
-        holoparams: HoloParams,
+        holoparams: HoloParams | None = None,
         upsample_factor: int = 1,
         normalization: Literal['phase'] | None = 'phase',
         xp: typing.Any = np,
+        source: InputSource = 'hologram',
     ) -> None:
+        _check_source(source, holoparams)
         self._holoparams = holoparams
         self._xp = xp
         self._normalization = normalization
         self._upsample_factor = upsample_factor
+        self._source = source
 
     def prepare_input(
         self,
         img: np.ndarray,
     ) -> typing.Any:
-        holoparams = self._holoparams
-        phase = get_phase(img, holoparams, xp=self._xp)
-        return phase
+        from sparseconverter import NUMPY, for_backend
 
-    def correlate(
-        self,
-        ref_image: typing.Any,
-        moving_image: typing.Any,
-        plot: bool = False,
-    ) -> RegResult:
-        pos, corrmap = cross_correlate(
-            ref_image,
-            moving_image,
-            xp=self._xp,
-            plot=plot,
-            normalization=self._normalization,
-            upsample_factor=self._upsample_factor,
-        )
-        pos_rel = (
-            pos[0] - (moving_image.shape[0]) // 2,
-            pos[1] - (moving_image.shape[1]) // 2,
-        )
-        return RegResult(maximum=pos, shift=pos_rel, corrmap=corrmap)
+        if self._source == 'hologram':
+            return get_phase(img, self._holoparams, xp=self._xp)
+        elif self._source == 'wave':
+            # phase_unwrap is numpy-only:
+            return phase_unwrap(for_backend(np.angle(img), NUMPY))
+        return img
 
 
-class GradAngleCorrelator(Correlator):
+class GradAngleCorrelator(FFTCorrelator):
     """
     Cross correlation on gradient angle of phase image.
+
+    The input can be holograms (:code:`source='hologram'`), reconstructed
+    waves (:code:`source='wave'`) or unwrapped phase images
+    (:code:`source='phase'`). For waves, the gradient is computed without
+    unwrapping, see :func:`phase_gradient`.
     """
 
     def __init__(
         self,
-        holoparams: HoloParams,
+        holoparams: HoloParams | None = None,
         upsample_factor: int = 1,
         normalization: Literal['phase'] | None = 'phase',
         xp: typing.Any = np,
+        source: InputSource = 'hologram',
     ) -> None:
+        _check_source(source, holoparams)
         self._holoparams = holoparams
         self._xp = xp
         self._normalization = normalization
         self._upsample_factor = upsample_factor
+        self._source = source
 
     def prepare_input(
         self,
         img: np.ndarray,
     ) -> np.ndarray:
-        holoparams = self._holoparams
-        grad_angle = get_grad_angle(get_phase(img, holoparams, xp=self._xp))
-        return grad_angle
-
-    def correlate(
-        self,
-        ref_image: typing.Any,
-        moving_image: typing.Any,
-        plot: bool = False,
-    ) -> RegResult:
-        pos, corrmap = cross_correlate(
-            ref_image,
-            moving_image,
-            xp=self._xp,
-            plot=plot,
-            upsample_factor=self._upsample_factor,
-            normalization=self._normalization,
-        )
-        pos_rel = (
-            pos[0] - (moving_image.shape[0]) // 2,
-            pos[1] - (moving_image.shape[1]) // 2,
-        )
-        return RegResult(maximum=pos, shift=pos_rel, corrmap=corrmap)
+        xp = self._xp
+        grad = _get_phase_gradient(img, self._source, self._holoparams, scale=3, xp=xp)
+        return xp.arctan2(grad[..., 0], grad[..., 1])
 
 
-class GradXYCorrelator(Correlator):
+class GradXYCorrelator(FFTCorrelator):
     """
-    Cross correlation on gradient x and Y, correlation maps summed.
+    Cross correlation on gradient x and y of the phase image.
+
+    Both gradients are packed into one complex image `grad_x + 1j * grad_y`,
+    so a single forward FFT per image gives the spectra of both components.
+    These are separated again to compute the (phase normalized) cross
+    correlation of each component, and the sum of both correlations is used
+    to find the shift, see the `packed` argument of
+    :func:`cross_correlate_batch`.
+
+    The input can be holograms (:code:`source='hologram'`), reconstructed
+    waves (:code:`source='wave'`) or unwrapped phase images
+    (:code:`source='phase'`). For waves, the gradients are computed without
+    unwrapping, see :func:`phase_gradient`.
     """
+    _packed = True
 
     def __init__(
         self,
-        holoparams: HoloParams,
+        holoparams: HoloParams | None = None,
         xp: typing.Any = np,
+        upsample_factor: int = 1,
+        normalization: Literal['phase'] | None = 'phase',
+        source: InputSource = 'hologram',
     ) -> None:
+        _check_source(source, holoparams)
         self._holoparams = holoparams
         self._xp = xp
+        self._upsample_factor = upsample_factor
+        self._normalization = normalization
+        self._source = source
 
     def prepare_input(
         self,
         img: np.ndarray,
     ) -> typing.Any:
-        holoparams = self._holoparams
-        (grad_x, grad_y) = get_grad_xy(
-            get_phase(img, holoparams, xp=self._xp),
-            scale=3,
-        )
+        grad = _get_phase_gradient(img, self._source, self._holoparams, scale=3, xp=self._xp)
+        grad_x, grad_y = grad[..., 0], grad[..., 1]
         # because `gradient` interpolates at the edge, we get a nice
         # vertical artifact that the cross correlation latches onto,
         # so we need to slice the edges away. take care to slice
@@ -550,40 +1387,8 @@ class GradXYCorrelator(Correlator):
         # slice enough such that the interpolated region is removed
         # completely (I think this relates to the `scale` argument
         # above):
-        return (grad_x[4:-5, 4:-5], grad_y[4:-5, 4:-5])
-
-    def correlate(
-        self,
-        ref_image: typing.Any,
-        moving_image: typing.Any,
-        plot: bool = False,
-    ) -> RegResult:
-        xp = self._xp
-        ref_image_x, ref_image_y = ref_image
-        moving_image_x, moving_image_y = moving_image
-        pos_x, corrmap_x = cross_correlate(
-            ref_image_x,
-            moving_image_x,
-            xp=xp,
-            plot=plot,
-        )
-        pos_y, corrmap_y = cross_correlate(
-            ref_image_y,
-            moving_image_y,
-            xp=xp,
-            plot=plot,
-        )
-        corrmap = corrmap_x + corrmap_y
-        pos = xp.unravel_index(xp.argmax(corrmap), corrmap.shape)
-        if xp is np:
-            pos = tuple(float(x) for x in pos)
-        else:
-            pos = tuple(float(for_backend(x, NUMPY)) for x in pos)
-        pos_rel = (
-            pos[0] - (moving_image_y.shape[0]) // 2,
-            pos[1] - (moving_image_y.shape[1]) // 2,
-        )
-        return RegResult(maximum=pos, shift=pos_rel, corrmap=corrmap)
+        grad_x, grad_y = grad_x[4:-5, 4:-5], grad_y[4:-5, 4:-5]
+        return self._xp.asarray(grad_x + 1j * grad_y)
 
 
 class NoopCorrelator(Correlator):
@@ -610,7 +1415,16 @@ def align_stack(
     static: np.ndarray | None,
     correlator: Correlator | None = None,
     xp=np,
-) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    *,
+    batch_size: int = 1,
+    num_workers: int = 1,
+    store_corrs: bool | None = None,
+    out: typing.Any | None = None,
+    prefetch: int = 0,
+    search_radius: int | None = None,
+    stats: StreamingStats | None = None,
+    shift_method: ShiftMethod = 'fourier',
+) -> tuple[typing.Any, np.ndarray, np.ndarray, np.ndarray]:
     """Align stacks of N holograms.
 
     Parameters
@@ -621,7 +1435,9 @@ def align_stack(
         for the alignment. It should be of dtype float32 or float64,
         so for holograms, you may want to align on the abs(wave).
         You can also slice the original data, if you want to align
-        to a region of interest.
+        to a region of interest. Correlators that work on the phase, like
+        :class:`GradXYCorrelator`, can take the reconstructed waves
+        directly, using :code:`source='wave'`.
 
     wave_stack
         The (complex) result of the reconstruction. This should have
@@ -629,6 +1445,11 @@ def align_stack(
         complex images as the stack argument, but the 2d items in the
         stack can have a different shape.
 
+    Both `stack` and `wave_stack` can also be lazily indexable arrays, like
+    memory-mapped files or HDF5 datasets, which are read batch by batch, or
+    iterables of 2d frames. Pass the same object for both if the stack should
+    be aligned on its own content; it is then only read once.
+
     static
         A reference image to align against. If this is not given,
         the first image of the stack will be taken.
@@ -640,11 +1461,70 @@ def align_stack(
         A requirement is that it has to work on the value given as the
         stack parameter.
 
+    batch_size
+        Process this many frames at once, using stacked FFTs for the
+        correlation (if the correlator supports it, see
+        :meth:`Correlator.prepare_batch`) and for shifting the waves.
+
+    num_workers
+        Process batches in parallel using this many threads. The FFTs
+        release the GIL, so this also helps for correlators whose
+        pre-processing can't be batched.
+
+    store_corrs
+        Keep the correlation maps of all frames, which take as much memory
+        as a float32 copy of the stack. If this is disabled, only the height
+        of the correlation peak is kept for each frame. Enabled by default,
+        unless `search_radius` is given.
+
+    out
+        Write the aligned stack into this array instead of allocating a new
+        one. It must have the same shape as `wave_stack`, and can be anything
+        that supports assignment to slices along the first axis, for example
+        a :class:`numpy.memmap` or a zarr array. Pass `wave_stack` itself
+        to align it in-place. Arrays that don't belong to the backend given
+        by `xp` receive the frames as numpy arrays.
+
+    prefetch
+        Read up to this many frames ahead in a background thread, so that
+        reading from disk overlaps with the alignment. Useful for stacks that
+        are read lazily, like memory-mapped files, HDF5 datasets or
+        generators.
+
+    search_radius
+        Use the shift of the previous batch as a prior, and only search for
+        shifts within this many pixels around it, if the correlator supports
+        it (see :meth:`Correlator.correlate_batch`). This is useful for
+        slowly drifting series, and the radius has to cover the drift over
+        `batch_size` frames. The first batch is searched fully. As the
+        batches depend on each other, they are processed in order, and
+        `num_workers` has to be 1. The correlation maps can't be stored in
+        this mode.
+
+    stats
+        A :class:`~libertem_holo.base.stats.StreamingStats` instance, which
+        is updated with the aligned frames, in order, as they are produced.
+        This gives the per-pixel mean and standard deviation of the aligned
+        stack and a residual for each frame, without keeping the aligned
+        stack in memory; combine it with `out` for stacks that don't fit.
+        See also :func:`stack_alignment_quality`.
+
+    shift_method
+        How the shifts are applied to `wave_stack`, see :func:`shift_stack`
+        for the available methods and their accuracy. The real-space methods
+        are cheaper than the default Fourier shift, especially for
+        amplitude-only stacks.
+
+    The results don't depend on `batch_size` and `num_workers`, unless
+    `search_radius` is given.
+
     Returns
     =======
 
     aligned_stack
-        The aligned stack. Same shape and dtype as wave_stack
+        The aligned stack. Same shape and dtype as wave_stack, or `out`
+        if it was given. If `wave_stack` is an iterable, it is returned
+        as an array of the backend.
 
     shifts
         The shifts that were applied to the stack. Shape (N, 2)
@@ -655,11 +1535,25 @@ def align_stack(
 
     corrs
         The correlation maps, as returned from the correlator. Useful for
-        debugging.
+        debugging. If `store_corrs` is disabled, these are only the heights
+        of the correlation peaks, with shape (N,).
     """
-    wave_stack = xp.asarray(wave_stack)
-    stack = xp.asarray(stack)
-    aligned_stack = xp.zeros_like(wave_stack)
+    if search_radius is not None:
+        if num_workers > 1:
+            raise ValueError("search_radius can't be used with num_workers > 1")
+        if store_corrs:
+            raise ValueError("store_corrs is not supported together with search_radius")
+        store_corrs = False
+    elif store_corrs is None:
+        store_corrs = True
+
+    known_length = _is_indexable(stack) and _is_indexable(wave_stack)
+    aligned_stack = out
+    if out is not None and known_length and tuple(out.shape) != tuple(wave_stack.shape):
+        raise ValueError(
+            f"out has shape {tuple(out.shape)}, expected "
+            f"{tuple(wave_stack.shape)}"
+        )
 
     if correlator is None:
         correlator = ImageCorrelator(
@@ -670,50 +1564,461 @@ def align_stack(
             xp=xp,
         )
 
-    if static is None:
-        reference = stack[0]
-    else:
-        reference = static
-    reference = correlator.prepare_input(reference)
+    batch_size = max(1, batch_size)
+    batches = _iter_batches(stack, wave_stack, batch_size=batch_size, xp=xp)
 
-    corrs = xp.zeros((stack.shape[0],) + reference.shape, dtype=np.float32)
-    shifts = xp.zeros((wave_stack.shape[0], 2), dtype="float32")
+    if static is not None:
+        reference = static
+    elif known_length:
+        reference = xp.asarray(stack[0])
+    else:
+        first_batch = next(batches, None)
+        if first_batch is None:
+            raise ValueError("cannot align an empty stack")
+        reference = first_batch[1][0]
+        batches = itertools.chain([first_batch], batches)
+    # may contain a cached spectrum, which is re-used for all frames:
+    prepared_reference = correlator.prepare_reference(reference)
+    reference, _ = _unpack_spectrum(prepared_reference)
+
+    if prefetch > 0:
+        batches = _prefetch(batches, depth=math.ceil(prefetch / batch_size))
+
+    if known_length:
+        if aligned_stack is None:
+            aligned_stack = xp.zeros(wave_stack.shape, dtype=wave_stack.dtype)
+        # allocated on first use, as the shape of the correlation maps
+        # depends on the correlator:
+        corrs = None
+        shifts = xp.zeros((wave_stack.shape[0], 2), dtype="float32")
+    else:
+        aligned_parts, corrs_parts, shifts_parts = [], [], []
+    # foreign targets, like numpy arrays with the cupy backend, or zarr arrays:
+    to_host = (
+        aligned_stack is not None
+        and xp is not np
+        and not isinstance(aligned_stack, xp.ndarray)
+    )
 
-    if xp is np:
-        import scipy.ndimage as ni
+    def _align_batch(start: int, stack_batch, wave_batch, prior=None):
+        prepared = correlator.prepare_batch(stack_batch)
+        if prior is None:
+            reg_results = correlator.correlate_batch(prepared_reference, prepared)
+        else:
+            reg_results = correlator.correlate_batch(
+                prepared_reference,
+                prepared,
+                prior=prior,
+                search_radius=search_radius,
+            )
+        batch_shifts = []
+        batch_corrs = []
+        for reg_result in reg_results:
+            corrmap = xp.asarray(reg_result.corrmap)
+            batch_corrs.append(corrmap if store_corrs else corrmap.max())
+            batch_shifts.append(reg_result.shift)
+        batch_shifts = xp.asarray(batch_shifts, dtype=np.float64)
+        batch_corrs = xp.stack(batch_corrs).astype(np.float32)
+        shifted = shift_stack(wave_batch, batch_shifts, xp=xp, method=shift_method)
+        shifted = shifted.astype(wave_batch.dtype, copy=False)
+        return start, shifted, batch_shifts, batch_corrs
+
+    def _store(start: int, shifted, batch_shifts, batch_corrs) -> None:
+        nonlocal corrs
+        stop = start + shifted.shape[0]
+        if stats is not None:
+            stats.update(shifted)
+        if to_host:
+            shifted = shifted.get()
+        if aligned_stack is not None:
+            aligned_stack[start:stop] = shifted
+        else:
+            aligned_parts.append(shifted)
+        if known_length:
+            shifts[start:stop] = batch_shifts
+            if corrs is None:
+                corrs = xp.zeros((stack.shape[0],) + batch_corrs.shape[1:], dtype=np.float32)
+            corrs[start:stop] = batch_corrs
+        else:
+            shifts_parts.append(batch_shifts.astype(np.float32))
+            corrs_parts.append(batch_corrs)
+
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # submit a bounded number of batches at a time, so large or
+            # lazily read stacks are not loaded into memory all at once:
+            pending = collections.deque()
+            for batch in batches:
+                pending.append(executor.submit(_align_batch, *batch))
+                if len(pending) >= 2 * num_workers:
+                    _store(*pending.popleft().result())
+            while pending:
+                _store(*pending.popleft().result())
     else:
-        import cupyx.scipy.ndimage as ni
+        prior = None
+        for batch in batches:
+            result = _align_batch(*batch, prior=prior)
+            _store(*result)
+            if search_radius is not None:
+                # the last shift of this batch is the prior for the next one:
+                batch_shifts = result[2]
+                prior = tuple(float(x) for x in batch_shifts[-1])
+
+    if known_length and corrs is None:
+        corrs = xp.zeros(
+            (stack.shape[0],) + (reference.shape if store_corrs else ()),
+            dtype=np.float32,
+        )
+    if not known_length:
+        if not shifts_parts:
+            raise ValueError("cannot align an empty stack")
+        if aligned_stack is None:
+            aligned_stack = xp.concatenate(aligned_parts)
+        shifts = xp.concatenate(shifts_parts)
+        corrs = xp.concatenate(corrs_parts)
+    return aligned_stack, shifts, reference, corrs
 
-    for i, (reg_frame, wave_frame) in enumerate(zip(stack, wave_stack)):
-        wave_frame = xp.asarray(wave_frame)
-        pre_reg_frame = correlator.prepare_input(reg_frame)
 
-        reg_result = correlator.correlate(
-            reference,
-            pre_reg_frame,
-            plot=False,
-        )
-        corrs[i] = reg_result.corrmap
+def _is_indexable(stack: typing.Any) -> bool:
+    """Whether `stack` can be sliced along the first axis, like an array."""
+    return hasattr(stack, "shape") and hasattr(stack, "__getitem__")
 
-        shifted = xp.fft.ifft2(ni.fourier_shift(
-            xp.fft.fftn(wave_frame),
-            xp.asarray(reg_result.shift),
-        ))
 
-        # support for non-complex data: explicitly discard imaginary part
-        if not np.iscomplexobj(wave_stack):
-            shifted = shifted.real
+def _read_batch(batch: typing.Any, xp=np) -> typing.Any:
+    """Convert `batch` to an `xp` array that holds its data in memory.
+
+    Slicing a memory-mapped file only creates a view, which would defer
+    reading to the first access, so it is copied instead.
+    """
+    if isinstance(batch, np.memmap):
+        batch = np.array(batch)
+    return xp.asarray(batch)
+
+
+def _iter_batches(
+    stack: typing.Any,
+    wave_stack: typing.Any,
+    batch_size: int,
+    xp=np,
+) -> typing.Iterator[tuple[int, typing.Any, typing.Any]]:
+    """Read `stack` and `wave_stack` in batches of `batch_size` frames.
+
+    Yields tuples (start, stack_batch, wave_batch), converted to `xp`
+    arrays. Array-like inputs, like memory-mapped files or HDF5 datasets, are
+    sliced, so only the current batch is read; other iterables are consumed
+    frame by frame.
+    """
+    if _is_indexable(stack) and _is_indexable(wave_stack):
+        num_frames = min(stack.shape[0], wave_stack.shape[0])
+        for start in range(0, num_frames, batch_size):
+            stop = min(start + batch_size, num_frames)
+            stack_batch = _read_batch(stack[start:stop], xp=xp)
+            if wave_stack is stack:
+                wave_batch = stack_batch
+            else:
+                wave_batch = _read_batch(wave_stack[start:stop], xp=xp)
+            yield start, stack_batch, wave_batch
+        return
+
+    if wave_stack is stack:
+        frames = ((frame, frame) for frame in stack)
+    else:
+        frames = zip(stack, wave_stack)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(frames, batch_size))
+        if not chunk:
+            return
+        stack_batch = xp.stack([xp.asarray(frame) for frame, _ in chunk])
+        wave_batch = xp.stack([xp.asarray(wave) for _, wave in chunk])
+        yield start, stack_batch, wave_batch
+        start += len(chunk)
+
+
+def _prefetch(iterable: typing.Iterable, depth: int) -> typing.Iterator:
+    """Consume `iterable` in a background thread, up to `depth` items ahead.
+
+    Exceptions raised while reading are re-raised in the consuming thread.
+    """
+    items = queue.Queue(maxsize=max(1, depth))
+    done = object()
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _reader() -> None:
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except BaseException as e:
+            _put((done, e))
+            return
+        _put((done, None))
+
+    reader = threading.Thread(target=_reader, name="align-stack-prefetch", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if exc is not None:
+                raise exc
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+# interpolation kernels for the real-space shift methods, and their support:
+_SHIFT_KERNEL_RADIUS = {
+    'linear': 1,
+    'cubic': 2,
+    'lanczos': 3,
+}
+
+
+def _interpolation_weights(frac: np.ndarray, method: ShiftMethod) -> tuple[np.ndarray, np.ndarray]:
+    """Weights for interpolating at fractional offsets `frac` in [-0.5, 0.5].
+
+    Returns the integer tap offsets j, shape (T,), and the weights K(frac + j)
+    for each shift, shape (N, T). The weights are normalized to sum to one, so
+    constant images stay constant.
+    """
+    radius = _SHIFT_KERNEL_RADIUS[method]
+    offsets = np.arange(-radius, radius + 1)
+    x = frac[:, None] + offsets[None, :]
+    ax = np.abs(x)
+    if method == 'linear':
+        weights = np.clip(1 - ax, 0, None)
+    elif method == 'cubic':
+        # Keys' cubic convolution kernel, with a = -0.5:
+        weights = np.where(
+            ax <= 1,
+            1.5 * ax**3 - 2.5 * ax**2 + 1,
+            np.where(ax < 2, -0.5 * ax**3 + 2.5 * ax**2 - 4 * ax + 2, 0),
+        )
+    else:
+        weights = np.where(ax < radius, np.sinc(x) * np.sinc(x / radius), 0)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return offsets, weights
+
+
+@numba.njit(cache=True, inline="always")
+def _shift_row(stack, shifts_int, offsets, weights, out, k):
+    h, w = stack.shape[1:]
+    i = k // h
+    y = k % h
+    out[i, y, :] = 0
+    for t in range(offsets.shape[0]):
+        src = (y - shifts_int[i] + offsets[t]) % h
+        weight = weights[i, t]
+        for x in range(w):
+            out[i, y, x] += weight * stack[i, src, x]
+
+
+@numba.njit(cache=True, inline="always")
+def _shift_row_cols(stack, shifts_int, offsets, weights, out, k):
+    h, w = stack.shape[1:]
+    i = k // h
+    y = k % h
+    for x in range(w):
+        out[i, y, x] = 0
+        for t in range(offsets.shape[0]):
+            src = (x - shifts_int[i] + offsets[t]) % w
+            out[i, y, x] += weights[i, t] * stack[i, y, src]
+
+
+@numba.njit(cache=True, parallel=True)
+def _shift_rows_cpu(stack, shifts_int, offsets, weights, out):
+    n, h, w = stack.shape
+    for k in numba.prange(n * h):
+        _shift_row(stack, shifts_int, offsets, weights, out, k)
+
+
+@numba.njit(cache=True, parallel=True)
+def _shift_cols_cpu(stack, shifts_int, offsets, weights, out):
+    n, h, w = stack.shape
+    for k in numba.prange(n * h):
+        _shift_row_cols(stack, shifts_int, offsets, weights, out, k)
+
+
+# single-threaded variants, for calls from other threads than the main
+# thread: the numba thread pool must not be used from several threads at
+# once, which hangs or aborts depending on the threading layer
+@numba.njit(cache=True)
+def _shift_rows_cpu_serial(stack, shifts_int, offsets, weights, out):
+    n, h, w = stack.shape
+    for k in range(n * h):
+        _shift_row(stack, shifts_int, offsets, weights, out, k)
+
+
+@numba.njit(cache=True)
+def _shift_cols_cpu_serial(stack, shifts_int, offsets, weights, out):
+    n, h, w = stack.shape
+    for k in range(n * h):
+        _shift_row_cols(stack, shifts_int, offsets, weights, out, k)
+
+
+# numba-compiled functions of this module which are cached on disk, see
+# :func:`libertem_holo.base.filters.set_jit_cache_dir`:
+_CACHED_CPU_KERNELS = (
+    _shift_row,
+    _shift_row_cols,
+    _shift_rows_cpu,
+    _shift_cols_cpu,
+    _shift_rows_cpu_serial,
+    _shift_cols_cpu_serial,
+)
+
+
+def _compile_shift_kernels(dtypes=(np.float32, np.complex64)) -> None:
+    """Compile (or load from the cache) the shift kernels, without running them."""
+    if numba.config.DISABLE_JIT:
+        return
+    offsets, weights = _interpolation_weights(np.zeros(1), 'linear')
+    for dtype in dtypes:
+        stack = np.zeros((1, 1, 1), dtype=dtype)
+        args = (
+            stack,
+            np.zeros(1, dtype=np.int64),
+            offsets,
+            weights.astype(stack.real.dtype),
+            stack,
+        )
+        signature = tuple(numba.typeof(arg) for arg in args)
+        for kernel in (
+            _shift_rows_cpu,
+            _shift_cols_cpu,
+            _shift_rows_cpu_serial,
+            _shift_cols_cpu_serial,
+        ):
+            kernel.compile(signature)
+
+
+def _shift_axis(stack, shifts: np.ndarray, axis: int, method: ShiftMethod, xp=np):
+    """Shift each image of `stack` along `axis` (1 or 2), with periodic boundaries."""
+    shifts_int = np.round(shifts)
+    offsets, weights = _interpolation_weights(shifts - shifts_int, method)
+    shifts_int = shifts_int.astype(np.int64)
+    weights = weights.astype(stack.real.dtype)
+    out = xp.empty_like(stack)
+    if xp is np:
+        if threading.current_thread() is threading.main_thread():
+            kernel = _shift_rows_cpu if axis == 1 else _shift_cols_cpu
+        else:
+            kernel = _shift_rows_cpu_serial if axis == 1 else _shift_cols_cpu_serial
+        kernel(stack, shifts_int, offsets, weights, out)
+        return out
+    n, h, w = stack.shape
+    size = stack.shape[axis]
+    shifts_int = xp.asarray(shifts_int)
+    weights = xp.asarray(weights)
+    frames = xp.arange(n)
+    out[:] = 0
+    for t, offset in enumerate(offsets):
+        src = (xp.arange(size)[None, :] - shifts_int[:, None] + int(offset)) % size
+        if axis == 1:
+            gathered = stack[frames[:, None], src]
+        else:
+            gathered = stack[frames[:, None, None], xp.arange(h)[None, :, None], src[:, None, :]]
+        out += weights[:, t, None, None] * gathered
+    return out
 
-        aligned_stack[i] = shifted
-        shifts[i] = xp.stack(reg_result.shift)
-    return aligned_stack, shifts, reference, corrs
 
+def shift_stack(
+    wave_stack: np.ndarray,
+    shifts: np.ndarray,
+    xp=np,
+    method: ShiftMethod = 'fourier',
+) -> np.ndarray:
+    """Shift each image in `wave_stack` by the corresponding entry of `shifts`.
+
+    By default, the shift is applied in Fourier space, using stacked FFTs.
+    The other methods shift by the integer part of the shift, and interpolate
+    the subpixel part with a separable kernel in real space, which is cheaper
+    for large images. On the CPU, they run in parallel over frames and rows
+    when called from the main thread. In other threads, for example in the
+    workers of :func:`align_stack`, they run single-threaded, as the numba
+    thread pool can't be used from several threads at the same time.
+    All methods treat the images as periodic, like the Fourier shift.
+
+    The accuracy of the methods, as the maximum error relative to the Fourier
+    shift and to the image contrast, measured on random images smoothed with
+    a Gaussian of 1.5 pixels:
+
+    * :code:`'fourier'`: exact for band-limited images
+    * :code:`'lanczos'`: Lanczos kernel with a radius of 3 pixels, about 1%
+    * :code:`'cubic'`: Keys' cubic convolution, about 1.5%
+    * :code:`'linear'`: linear interpolation, which also smoothes the image
+      for subpixel shifts, about 7%
+
+    For smoother images, the errors of all real-space methods drop, and
+    :code:`'cubic'` is as accurate as :code:`'lanczos'` at a lower cost.
+    The real-space methods are best suited for amplitude images and small
+    subpixel shifts. Interpolating complex waves with a strong phase gradient,
+    like holograms or waves with a large tilt, is less accurate.
 
-def stack_alignment_quality(wave_stack: np.ndarray, shifts):
+    Parameters
+    ----------
+    wave_stack
+        Real or complex images of shape (N, h, w)
+    shifts
+        Array of shape (N, 2) with (y, x) shifts in pixels
+    xp
+        Either numpy or cupy
+    method
+        One of :code:`'fourier'`, :code:`'lanczos'`, :code:`'cubic'` or
+        :code:`'linear'`
+
+    Returns
+    -------
+    The shifted stack, with the same dtype as `wave_stack`.
+    """
+    wave_stack = xp.asarray(wave_stack)
+    if method != 'fourier':
+        if method not in _SHIFT_KERNEL_RADIUS:
+            raise ValueError(f"unknown shift method: {method!r}")
+        if not np.issubdtype(wave_stack.dtype, np.inexact):
+            wave_stack = wave_stack.astype(np.float32)
+        shifts = np.asarray(
+            shifts.get() if hasattr(shifts, "get") else shifts,
+            dtype=np.float64,
+        ).reshape((-1, 2))
+        shifted = _shift_axis(wave_stack, shifts[:, 0], axis=1, method=method, xp=xp)
+        return _shift_axis(shifted, shifts[:, 1], axis=2, method=method, xp=xp)
+    shifted = xp.fft.ifft2(apply_fourier_shift(
+        xp.fft.fft2(wave_stack),
+        shifts,
+        xp=xp,
+    ))
+    # support for non-complex data: explicitly discard imaginary part
+    if not np.iscomplexobj(wave_stack):
+        shifted = shifted.real
+    return shifted
+
+
+def stack_alignment_quality(wave_stack: np.ndarray | StreamingStats, shifts):
     """Stack quality ,judged by standard deviation on the stacking axis.
 
     This should be mostly noise, if not, there may be issues from the alignment.
+
+    Instead of the aligned stack, a
+    :class:`~libertem_holo.base.stats.StreamingStats` instance can be
+    passed, as accumulated by :func:`align_stack` using the `stats` argument.
+    Then, the full stack doesn't need to be kept in memory.
     """
-    std_image = np.std(np.abs(wave_stack), axis=0)
+    if isinstance(wave_stack, StreamingStats):
+        std_image = wave_stack.std
+    else:
+        std_image = np.std(np.abs(wave_stack), axis=0)
     offset = math.ceil(shifts.max()) + 1
     return std_image[offset:-offset, offset:-offset]
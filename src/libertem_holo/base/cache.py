@@ -0,0 +1,317 @@
+"""Persistent on-disk cache for reconstruction parameters and results.
+
+Entries are content-addressed: the key is a hash of the input data and the
+parameters that were used to compute them, see :meth:`DiskCache.key`. Each
+entry is a directory with one :code:`.npy` file per array, which are opened
+memory-mapped, and a small JSON file with the remaining metadata. The total
+size of the cache is bounded; when it grows too large, the least recently
+used entries are removed.
+
+Examples
+--------
+>>> import tempfile
+>>> cache = DiskCache(tempfile.mkdtemp())
+>>> hologram = np.random.default_rng(0).random((64, 64))
+>>> key = cache.key("phase", hologram, sigma=2)
+>>> cache.get_arrays(key) is None
+True
+>>> cache.put_arrays(key, {"phase": np.zeros((32, 32))})
+>>> cache.get_arrays(key)["phase"].shape
+(32, 32)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import typing
+import uuid
+
+import numpy as np
+
+from libertem_holo.base.utils import HoloParams
+
+_META_FILE = "meta.json"
+
+
+def _to_host(arr: typing.Any) -> np.ndarray:
+    if hasattr(arr, "get"):
+        # cupy array
+        arr = arr.get()
+    return np.asarray(arr)
+
+
+def _to_json(value: typing.Any) -> typing.Any:
+    """Convert tuples and numpy scalars to plain JSON values."""
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, (tuple, list)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, "item") and getattr(value, "ndim", None) == 0:
+        # 0d numpy or cupy array
+        return value.item()
+    return value
+
+
+def _update_hash(h, value: typing.Any) -> None:
+    if isinstance(value, os.PathLike):
+        # files are identified by their path, size and modification time,
+        # so opening a large dataset again doesn't need to read it:
+        path = pathlib.Path(value).resolve()
+        stat = path.stat()
+        h.update(f"path:{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    elif hasattr(value, "shape") and hasattr(value, "dtype"):
+        arr = np.ascontiguousarray(_to_host(value))
+        h.update(f"array:{arr.dtype.str}:{arr.shape};".encode())
+        h.update(memoryview(arr).cast("B"))
+    elif isinstance(value, dict):
+        h.update(b"dict:")
+        for k in sorted(value):
+            _update_hash(h, k)
+            _update_hash(h, value[k])
+        h.update(b";")
+    elif isinstance(value, (tuple, list)):
+        h.update(b"seq:")
+        for v in value:
+            _update_hash(h, v)
+        h.update(b";")
+    else:
+        h.update(f"{type(value).__name__}:{value!r};".encode())
+
+
+class DiskCache:
+    """Content-addressed on-disk cache with size-bounded LRU eviction.
+
+    Parameters
+    ----------
+    path
+        The cache directory, which is created if it doesn't exist. It can be
+        shared between sessions and processes.
+    max_size
+        The maximum total size of the cache in bytes. When it is exceeded
+        after adding an entry, the least recently used entries are removed.
+        An entry that is larger than `max_size` on its own is not kept.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        max_size: int = 10 * 2**30,
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.max_size = max_size
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(*parts: typing.Any, **params: typing.Any) -> str:
+        """Compute a cache key from input data and parameters.
+
+        Arrays are hashed by their content, paths by their location, size
+        and modification time, and other values by their :func:`repr`. Keyword
+        arguments are sorted by name, so their order doesn't matter.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            _update_hash(h, part)
+        _update_hash(h, params)
+        return h.hexdigest()
+
+    def _entry(self, key: str) -> pathlib.Path:
+        return self.path / key
+
+    def __contains__(self, key: str) -> bool:
+        return (self._entry(key) / _META_FILE).exists()
+
+    def _touch(self, entry: pathlib.Path) -> None:
+        try:
+            os.utime(entry / _META_FILE)
+        except FileNotFoundError:
+            pass
+
+    def get_arrays(
+        self,
+        key: str,
+        mmap_mode: typing.Literal['r', 'c'] | None = 'r',
+    ) -> dict[str, np.ndarray] | None:
+        """Open the arrays stored under `key`, or return `None` if there are none.
+
+        The arrays are memory-mapped read-only by default, so opening them
+        is fast independent of their size.
+        """
+        entry = self._entry(key)
+        self._touch(entry)
+        try:
+            meta = json.loads((entry / _META_FILE).read_text())
+            return {
+                name: np.load(entry / f"{name}.npy", mmap_mode=mmap_mode)
+                for name in meta["arrays"]
+            }
+        except FileNotFoundError:
+            # missing, or evicted concurrently
+            return None
+
+    def get_meta(self, key: str) -> dict[str, typing.Any] | None:
+        """The metadata stored together with the arrays under `key`."""
+        try:
+            return json.loads((self._entry(key) / _META_FILE).read_text())["meta"]
+        except FileNotFoundError:
+            return None
+
+    def put_arrays(
+        self,
+        key: str,
+        arrays: dict[str, np.ndarray],
+        meta: dict[str, typing.Any] | None = None,
+    ) -> None:
+        """Store `arrays` and optional JSON-serializable `meta` under `key`.
+
+        The entry is written to a temporary directory first and then moved
+        into place, so readers never see a partially written entry. Existing
+        entries are kept, as they have the same content.
+        """
+        entry = self._entry(key)
+        tmp = self.path / f".tmp-{key}-{uuid.uuid4().hex}"
+        tmp.mkdir()
+        try:
+            for name, arr in arrays.items():
+                np.save(tmp / f"{name}.npy", _to_host(arr))
+            (tmp / _META_FILE).write_text(json.dumps({
+                "arrays": list(arrays),
+                "meta": _to_json(meta or {}),
+            }))
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # someone else was faster
+                if key not in self:
+                    raise
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: typing.Callable[[], dict[str, np.ndarray]],
+    ) -> dict[str, np.ndarray]:
+        """Return the arrays stored under `key`, computing and storing them first if needed."""
+        cached = self.get_arrays(key)
+        if cached is not None:
+            return cached
+        arrays = compute()
+        self.put_arrays(key, arrays)
+        cached = self.get_arrays(key)
+        # may have been evicted right away, if it's larger than the cache:
+        return arrays if cached is None else cached
+
+    def put_holoparams(self, key: str, params: HoloParams) -> None:
+        """Store `params`, including the aperture, under `key`."""
+        self.put_arrays(
+            key,
+            {"aperture": params.aperture},
+            meta={
+                "sb_size": params.sb_size,
+                "sb_position": params.sb_position,
+                "orig_shape": params.orig_shape,
+                "out_shape": params.out_shape,
+                "scale_factor": params.scale_factor,
+            },
+        )
+
+    def get_holoparams(self, key: str, xp=np) -> HoloParams | None:
+        """Load the :class:`~libertem_holo.base.utils.HoloParams` stored under `key`.
+
+        With numpy, the aperture is memory-mapped; with cupy, it is copied
+        to the device.
+        """
+        # both may be missing if the entry is evicted concurrently:
+        arrays = self.get_arrays(key)
+        meta = self.get_meta(key)
+        if arrays is None or meta is None:
+            return None
+
+        def _tuple(value):
+            return tuple(value) if isinstance(value, list) else value
+
+        return HoloParams(
+            sb_size=_tuple(meta["sb_size"]),
+            sb_position=_tuple(meta["sb_position"]),
+            aperture=xp.asarray(arrays["aperture"]),
+            orig_shape=_tuple(meta["orig_shape"]),
+            out_shape=_tuple(meta["out_shape"]),
+            scale_factor=meta["scale_factor"],
+            xp=xp,
+        )
+
+    def holoparams_from_hologram(
+        self,
+        hologram: np.ndarray | str | os.PathLike,
+        xp=np,
+        **kwargs: typing.Any,
+    ) -> HoloParams:
+        """Cached version of :meth:`~libertem_holo.base.utils.HoloParams.from_hologram`.
+
+        The key is computed from the hologram and the keyword arguments.
+        The hologram can also be given as a path to a :code:`.npy` file, in
+        which case it is only read if the parameters are not cached yet.
+        """
+        if isinstance(hologram, str):
+            hologram = pathlib.Path(hologram)
+        key = self.key("HoloParams.from_hologram", hologram, **kwargs)
+        params = self.get_holoparams(key, xp=xp)
+        if params is None:
+            if isinstance(hologram, os.PathLike):
+                hologram = np.load(hologram)
+            params = HoloParams.from_hologram(hologram, xp=xp, **kwargs)
+            self.put_holoparams(key, params)
+        return params
+
+    def _entries(self) -> list[tuple[int, int, pathlib.Path]]:
+        """All complete entries, as tuples of (last access, size, path)."""
+        entries = []
+        for entry in self.path.iterdir():
+            meta = entry / _META_FILE
+            if entry.name.startswith(".") or not meta.exists():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((meta.stat().st_mtime_ns, size, entry))
+            except FileNotFoundError:
+                # removed concurrently
+                continue
+        return entries
+
+    @property
+    def size(self) -> int:
+        """The total size of all entries, in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: str | None = None) -> None:
+        """Remove the least recently used entries until the cache fits into `max_size`.
+
+        The entry `keep` is never removed to make room, but it is removed
+        right away if it doesn't fit on its own.
+        """
+        entries = self._entries()
+        kept = [e for e in entries if e[2].name == keep]
+        others = sorted((e for e in entries if e[2].name != keep), key=lambda e: e[0])
+        if any(size > self.max_size for _, size, _ in kept):
+            for _, _, entry in kept:
+                shutil.rmtree(entry, ignore_errors=True)
+            kept = []
+        total = sum(size for _, size, _ in kept + others)
+        for _, size, entry in others:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        for _, _, entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
@@ -1,20 +1,36 @@
 """Useful image filtering helpers."""
+from __future__ import annotations
+
+import logging
 import math
+import os
+import sys
+import threading
 
 import numpy as np
 import numba
-from numba import cuda
-import sparse
-from scipy import ndimage
-from scipy.signal import fftconvolve
-from skimage.filters import window
-from skimage.restoration import unwrap_phase
-
-from libertem.masks import radial_bins
+
 from libertem_holo.base.utils import (
     fft_shift_coords, other_sb, draw_lf_rect, get_slice_fft,
 )
 
+log = logging.getLogger(__name__)
+
+
+# thread-local state: `compile_only` is set while warming up in a background
+# thread, where the `parallel=True` kernels must not run, as the numba
+# thread pool can't be used from several threads at the same time:
+_jit_state = threading.local()
+
+
+def _call_cpu_kernel(kernel, *args):
+    """Call `kernel`, or only compile it for `args` in compile-only mode."""
+    if getattr(_jit_state, "compile_only", False):
+        if not numba.config.DISABLE_JIT:
+            kernel.compile(tuple(numba.typeof(arg) for arg in args))
+        return None
+    return kernel(*args)
+
 
 def disk_aperture(out_shape: tuple[int, int], radius: float, xp=np) -> np.ndarray:
     """Generate a disk-shaped aperture, fft-shifted.
@@ -34,6 +50,7 @@ def disk_aperture(out_shape: tuple[int, int], radius: float, xp=np) -> np.ndarra
         2d array containing aperture
 
     """
+    from libertem.masks import radial_bins
     center = int(out_shape[0] / 2), int(out_shape[1] / 2)
 
     bins = xp.asarray(radial_bins(
@@ -68,12 +85,18 @@ def butterworth_disk(shape: tuple[int, int], radius: float, order: int = 12, xp=
     xp
         Either numpy or cupy
     """
+    # normalize argument types, so we hit the same compiled signatures
+    # as `warmup`:
+    shape = (int(shape[0]), int(shape[1]))
+    radius = float(radius)
+    order = int(order)
     if xp is np:
         cy = shape[0]/2
         cx = shape[1]/2
-        return _butterworth_disk_cpu(shape, radius, cy, cx, order)
+        return _call_cpu_kernel(_butterworth_disk_cpu, shape, radius, cy, cx, order)
     else:
         import cupy as cp
+        from libertem_holo.base._filters_gpu import _butterworth_disk_gpu
         result = cp.zeros(shape, dtype=np.float32)
         size = 32
         threadsperblock = (size, size)
@@ -89,9 +112,11 @@ def butterworth_disk(shape: tuple[int, int], radius: float, order: int = 12, xp=
 
 
 @numba.njit(cache=True, inline="always")
-def _butterworth_disk_kernel(y, x, cy, cx, radius, order):
-    d = math.sqrt((y-cy)**2 + (x-cx)**2)
-    return 1/math.sqrt(1 + math.pow((d/radius), 2*order))
+def _butterworth_disk_kernel(y, x, cy, cx, inv_radius_sq, order):
+    # (d/r)**(2*order) == (d**2/r**2)**order, which avoids the sqrt and lets
+    # numba use an integer power instead of `math.pow`:
+    q = ((y-cy)**2 + (x-cx)**2) * inv_radius_sq
+    return 1/math.sqrt(1 + q**order)
 
 
 @numba.njit(cache=True, parallel=True)
@@ -103,23 +128,16 @@ def _butterworth_disk_cpu(
     order: int = 12,
 ):
     result = np.zeros(shape, dtype=np.float32)
+    inv_radius_sq = 1 / (radius * radius)
     for y in numba.prange(shape[0]):
         for x in range(shape[1]):
-            result[y, x] = _butterworth_disk_kernel(y, x, cy, cx, radius, order)
+            result[y, x] = _butterworth_disk_kernel(y, x, cy, cx, inv_radius_sq, order)
     return result
 
 
-@cuda.jit(cache=True)
-def _butterworth_disk_gpu(result, radius: float, order: int = 12):
-    y, x = cuda.grid(2)
-    cy = result.shape[0]/2
-    cx = result.shape[1]/2
-    if x < result.shape[1] and y < result.shape[0]:
-        result[y, x] = _butterworth_disk_kernel(y, x, cy, cx, radius, order)
-
-
 def highpass(img: np.ndarray, sigma: float = 2) -> np.ndarray:
     """Return highpass by subtracting a gaussian lowpass filter."""
+    from scipy import ndimage
     return img - ndimage.gaussian_filter(img, sigma=sigma)
 
 
@@ -159,6 +177,7 @@ def phase_unwrap(image):
     -------
         2d nd array of the unwrapped phase image
     """
+    from skimage.restoration import unwrap_phase
 
     if image.dtype.kind != 'c':
         image_new = unwrap_phase(image)
@@ -184,6 +203,7 @@ def remove_dead_pixels(img, sigma_lowpass=2.0, sigma_exclusion=6.0):
         removed
 
     """
+    import sparse
     from libertem.corrections.detector import correct
     mask = exclusion_mask(highpass(img, sigma=sigma_lowpass), sigma=sigma_exclusion)
 
@@ -227,6 +247,8 @@ def window_filter(input_array, window_type, window_shape):
     at the border.
 
     """
+    from scipy.signal import fftconvolve
+    from skimage.filters import window
     if isinstance(window_shape, int):
         window_shape = (window_shape, window_shape)
     win = window(window_type, window_shape)
@@ -312,15 +334,12 @@ def central_line_filter(
         return dest
 
 
-@numba.njit(cache=True, inline="always")
-def _butterworth_line_kernel(
-    y, x, cy, cx,
-    shape,
-    width,
-    sb_position,
-    length_ratio,
-    order,
-):
+@numba.njit(cache=True)
+def _butterworth_line_params(cy, cx, sb_position, length_ratio):
+    """
+    Per-aperture constants of the line filter, which only depend on the
+    center and the sideband position, and not on the pixel coordinates.
+    """
     a = (sb_position[0] - cy) / (sb_position[1] - cx)
     b = 1
 
@@ -329,44 +348,61 @@ def _butterworth_line_kernel(
     length = sb_dist * (1 - length_ratio)
 
     if sb_position[0] - cy >= 0:
-        sb_sel = 1
+        sb_sel = 1.0
     else:
-        sb_sel = -1
+        sb_sel = -1.0
 
     # shift to starting point
-    cy += length * (sb_position[0] - cy) / sb_dist
-    cx += length * (sb_position[1] - cx) / sb_dist
+    cy_start = cy + length * (sb_position[0] - cy) / sb_dist
+    cx_start = cx + length * (sb_position[1] - cx) / sb_dist
 
     c = -1/a
+    inv_a_minus_b = 1 / (a - b)
+    inv_norm = 1 / math.sqrt(a**2 + 1)
+    return (cy_start, cx_start, a, c, inv_a_minus_b, inv_norm, sb_sel)
+
+
+@numba.njit(cache=True, inline="always")
+def _butterworth_line_kernel(
+    y, x,
+    cy, cx, a, c, inv_a_minus_b, inv_norm, sb_sel,
+    inv_width,
+    order,
+):
+    b = 1
     x0 = x - cx
     y0 = y - cy
     d = y0 - c * x0
-    xc = (d-c)/(a-b)
+    xc = (d-c) * inv_a_minus_b
 
     if sb_sel * xc < 0:
-        dist = abs(a*x0 - y0 + b)/math.sqrt(a**2 + 1)
+        dist = abs(a*x0 - y0 + b) * inv_norm
     else:
         dist = math.sqrt((y-cy-1)**2 + (x-cx)**2)
-    return 1 / math.sqrt(1 + math.pow((dist/width), 2*order))
+    q = dist * inv_width
+    return 1 / math.sqrt(1 + (q*q)**order)
 
 
 @numba.njit(cache=True, parallel=True)
 def _butterworth_line_cpu(shape, width, sb_position, length_ratio=0.9, order=12):
     result = np.zeros(shape, dtype=np.float32)
-    cy = shape[0] / 2 - 1
-    cx = shape[1] / 2 - 1
+    cy, cx, a, c, inv_a_minus_b, inv_norm, sb_sel = _butterworth_line_params(
+        shape[0] / 2 - 1,
+        shape[1] / 2 - 1,
+        sb_position,
+        length_ratio,
+    )
+    inv_width = 1 / width
 
     for y in numba.prange(shape[0]):
         for x in range(shape[1]):
-            result[y, x] = _butterworth_line_kernel(
-                y, x, cy, cx,
-                shape,
-                width,
-                sb_position,
-                length_ratio,
+            result[y, x] = 1 - _butterworth_line_kernel(
+                y, x,
+                cy, cx, a, c, inv_a_minus_b, inv_norm, sb_sel,
+                inv_width,
                 order,
             )
-    return 1 - result
+    return result
 
 
 def butterworth_line(
@@ -395,49 +431,333 @@ def butterworth_line(
     xp
         Either numpy or cupy
     """
+    shape = (int(shape[0]), int(shape[1]))
+    width = float(width)
+    sb_position = (float(sb_position[0]), float(sb_position[1]))
+    length_ratio = float(length_ratio)
+    order = int(order)
     if xp is np:
-        return _butterworth_line_cpu(
-            shape=shape,
-            width=width,
-            sb_position=sb_position,
-            length_ratio=length_ratio,
-            order=order,
+        return _call_cpu_kernel(
+            _butterworth_line_cpu, shape, width, sb_position, length_ratio, order,
         )
     else:
         import cupy as cp
+        from libertem_holo.base._filters_gpu import _butterworth_line_gpu
         result = cp.zeros(shape, dtype=np.float32)
         size = 16
         threadsperblock = (size, size)
         blockspergrid_x = math.ceil(result.shape[0] / threadsperblock[0])
         blockspergrid_y = math.ceil(result.shape[1] / threadsperblock[1])
         blockspergrid = (blockspergrid_x, blockspergrid_y)
-        _butterworth_line_gpu[blockspergrid, threadsperblock](
-            result,
-            width,
+        line_params = _butterworth_line_params(
+            shape[0] / 2 - 1,
+            shape[1] / 2 - 1,
             sb_position,
             length_ratio,
+        )
+        _butterworth_line_gpu[blockspergrid, threadsperblock](
+            result,
+            line_params,
+            1 / width,
             order,
         )
-        return 1 - result
+        return result
 
 
-@cuda.jit
-def _butterworth_line_gpu(
-    result, width, sb_position, length_ratio=0.9, order=12
+def butterworth_aperture(
+    shape: tuple[int, int],
+    radius: float,
+    *,
+    sb_position: tuple[float, float] | None = None,
+    line_width: float | None = None,
+    length_ratio: float = 0.9,
+    disk_order: int = 12,
+    line_order: int = 12,
+    slice_fft: tuple[slice, slice] | None = None,
+    out: np.ndarray | None = None,
+    xp=np,
 ):
-    y, x = cuda.grid(2)
-    if x < result.shape[1] and y < result.shape[0]:
-        cy = result.shape[0] / 2 - 1
-        cx = result.shape[1] / 2 - 1
-        result[y, x] = _butterworth_line_kernel(
-            y, x, cy, cx,
-            result.shape,
-            width,
-            sb_position,
-            length_ratio,
-            order,
+    """Generate a butterworth disk, multiplied with a butterworth line filter.
+
+    This is equivalent to
+    :code:`butterworth_disk(...)[slice_fft] * butterworth_line(...)[slice_fft]`,
+    but computed in a single pass, only for the pixels inside of `slice_fft`,
+    and without allocating any full-size temporary arrays.
+
+    Parameters
+    ----------
+    shape
+        shape of the full (uncropped) aperture, usually the shape of the hologram
+
+    radius
+        radius of the disk in pixels
+
+    sb_position
+        Position of the sideband, in fft-shifted coordinates, as for
+        :func:`butterworth_line`. Only needed if `line_width` is given.
+
+    line_width
+        width of the line filter in pixels. Pass `None` to disable the line filter.
+
+    length_ratio
+        length ratio of the line filter
+
+    disk_order
+        order of the butterworth filter of the disk
+
+    line_order
+        order of the butterworth filter of the line
+
+    slice_fft
+        Only compute this part of the aperture, for example as returned by
+        :func:`~libertem_holo.base.utils.get_slice_fft`. By default, the whole
+        aperture is computed.
+
+    out
+        If given, write the result into this float32 array, which has to match
+        the shape of the (cropped) aperture. Should be a cupy array if `xp` is cupy.
+
+    xp
+        Either numpy or cupy
+    """
+    if slice_fft is None:
+        slice_fft = (slice(0, shape[0]), slice(0, shape[1]))
+    y_start, y_stop, _ = slice_fft[0].indices(shape[0])
+    x_start, x_stop, _ = slice_fft[1].indices(shape[1])
+    out_shape = (y_stop - y_start, x_stop - x_start)
+
+    if out is None:
+        out = xp.zeros(out_shape, dtype=np.float32)
+    elif tuple(out.shape) != out_shape or out.dtype != np.float32:
+        raise ValueError(
+            f"`out` should be a float32 array of shape {out_shape}, "
+            f"is {out.dtype} {tuple(out.shape)}"
         )
 
+    disk_params = (shape[0] / 2, shape[1] / 2, 1 / (radius * radius))
+    if line_width is None:
+        use_line = False
+        line_params = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        inv_width = 0.0
+    else:
+        if sb_position is None:
+            raise ValueError("`sb_position` is needed for the line filter")
+        use_line = True
+        line_params = _butterworth_line_params(
+            shape[0] / 2 - 1,
+            shape[1] / 2 - 1,
+            (float(sb_position[0]), float(sb_position[1])),
+            float(length_ratio),
+        )
+        inv_width = 1 / line_width
+
+    disk_order = int(disk_order)
+    line_order = int(line_order)
+    if xp is np:
+        _call_cpu_kernel(
+            _butterworth_aperture_cpu,
+            out, y_start, x_start,
+            disk_params, disk_order,
+            use_line, line_params, inv_width, line_order,
+        )
+    else:
+        from libertem_holo.base._filters_gpu import _butterworth_aperture_gpu
+        size = 16
+        threadsperblock = (size, size)
+        blockspergrid_x = math.ceil(out.shape[0] / threadsperblock[0])
+        blockspergrid_y = math.ceil(out.shape[1] / threadsperblock[1])
+        blockspergrid = (blockspergrid_x, blockspergrid_y)
+        _butterworth_aperture_gpu[blockspergrid, threadsperblock](
+            out, y_start, x_start,
+            disk_params, disk_order,
+            use_line, line_params, inv_width, line_order,
+        )
+    return out
+
+
+@numba.njit(cache=True, inline="always")
+def _butterworth_aperture_kernel(
+    y, x,
+    disk_params, disk_order,
+    use_line, line_params, inv_width, line_order,
+):
+    cy, cx, inv_radius_sq = disk_params
+    value = _butterworth_disk_kernel(y, x, cy, cx, inv_radius_sq, disk_order)
+    if use_line:
+        lcy, lcx, a, c, inv_a_minus_b, inv_norm, sb_sel = line_params
+        value *= 1 - _butterworth_line_kernel(
+            y, x,
+            lcy, lcx, a, c, inv_a_minus_b, inv_norm, sb_sel,
+            inv_width,
+            line_order,
+        )
+    return value
+
+
+@numba.njit(cache=True, parallel=True)
+def _butterworth_aperture_cpu(
+    out, y_start, x_start,
+    disk_params, disk_order,
+    use_line, line_params, inv_width, line_order,
+):
+    for y in numba.prange(out.shape[0]):
+        for x in range(out.shape[1]):
+            out[y, x] = _butterworth_aperture_kernel(
+                y + y_start, x + x_start,
+                disk_params, disk_order,
+                use_line, line_params, inv_width, line_order,
+            )
+
 
 def hanning_2d(shape: tuple[int, int], xp=np):
     return xp.outer(xp.hanning(shape[0]), xp.hanning(shape[1]))
+
+
+# numba-compiled functions of this module which are cached on disk:
+_CACHED_CPU_KERNELS = (
+    _butterworth_disk_kernel,
+    _butterworth_disk_cpu,
+    _butterworth_line_params,
+    _butterworth_line_kernel,
+    _butterworth_line_cpu,
+    _butterworth_aperture_kernel,
+    _butterworth_aperture_cpu,
+)
+
+
+def set_jit_cache_dir(cache_dir: str | os.PathLike) -> None:
+    """Set the directory where compiled numba kernels are cached.
+
+    By default, numba caches next to the source files, or in the directory
+    given by the `NUMBA_CACHE_DIR` environment variable. If the installation
+    is read-only, the cache can't be written, and every new process needs to
+    compile the kernels again. Use this function to point the cache to a
+    writable (and ideally persistent) location, before calling :func:`warmup`.
+
+    Note that this changes `numba.config.CACHE_DIR`, so it also affects numba
+    functions from other packages that are compiled afterwards.
+
+    Parameters
+    ----------
+    cache_dir
+        The directory to use, will be created if it doesn't exist
+    """
+    cache_dir = os.fspath(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    numba.config.CACHE_DIR = cache_dir
+    _enable_caching()
+
+
+def _enable_caching() -> None:
+    """Set up the on-disk cache of the kernels for `numba.config.CACHE_DIR`."""
+    kernels = _CACHED_CPU_KERNELS
+    # the kernels of other modules pick up the new directory when they are
+    # defined, so we only need to update them if they have already been
+    # imported:
+    align_module = sys.modules.get("libertem_holo.base.align")
+    if align_module is not None:
+        kernels = kernels + align_module._CACHED_CPU_KERNELS
+    gpu_module = sys.modules.get("libertem_holo.base._filters_gpu")
+    if gpu_module is not None:
+        kernels = kernels + gpu_module.CACHED_GPU_KERNELS
+    for kernel in kernels:
+        kernel.enable_caching()
+
+
+def warmup(xp=np) -> None:
+    """Compile (or load from the cache) the kernels for the common signatures.
+
+    The butterworth kernels, and the real-space shift kernels of
+    :func:`libertem_holo.base.align.shift_stack`, are compiled lazily on
+    first use, which can take seconds. Call this function to move this cost
+    to a convenient point in time, for example when starting up a worker
+    process. The shift kernels are compiled for float32 and complex64 stacks.
+
+    Parameters
+    ----------
+    xp
+        Either numpy or cupy; with cupy, the GPU kernels are compiled, too.
+    """
+    from libertem_holo.base.align import _compile_shift_kernels
+
+    _compile_shift_kernels()
+    shape = (16, 16)
+    slice_fft = (slice(4, 12), slice(4, 12))
+    backends = [np] if xp is np else [np, xp]
+    for backend in backends:
+        butterworth_disk(shape, radius=4.0, order=12, xp=backend)
+        butterworth_line(
+            shape, width=2.0, sb_position=(2, 5), length_ratio=0.9, order=12,
+            xp=backend,
+        )
+        for line_width in (2.0, None):
+            butterworth_aperture(
+                shape,
+                radius=4.0,
+                sb_position=(2, 5),
+                line_width=line_width,
+                slice_fft=slice_fft,
+                xp=backend,
+            )
+
+
+_warmup_lock = threading.Lock()
+_warmup_threads: dict[str, threading.Thread] = {}
+
+
+def warmup_in_background(
+    xp=np,
+    cache_dir: str | os.PathLike | None = None,
+) -> threading.Thread:
+    """Run :func:`warmup` in a background thread, at most once per process.
+
+    This is meant to be called from worker processes, so that the
+    kernels are compiled while other work is already running. The CPU
+    kernels are only compiled, not run, so the caller can keep using
+    them from other threads in the meantime.
+
+    Parameters
+    ----------
+    xp
+        Either numpy or cupy
+    cache_dir
+        If given, call :func:`set_jit_cache_dir` before compiling
+
+    Returns
+    -------
+    thread
+        The thread doing the warmup, which can be joined to wait for it
+        to finish. If a warmup for this backend was already started,
+        the existing thread is returned.
+    """
+    key = "numpy" if xp is np else "cupy"
+    with _warmup_lock:
+        thread = _warmup_threads.get(key)
+        if thread is not None:
+            return thread
+        if cache_dir is not None:
+            set_jit_cache_dir(cache_dir)
+
+        device_id = None
+        if xp is not np:
+            device_id = xp.cuda.Device().id
+
+        def _run():
+            # compile without running the kernels, so we don't compete with
+            # the caller for the numba thread pool:
+            _jit_state.compile_only = True
+            try:
+                if device_id is None:
+                    warmup(xp=xp)
+                else:
+                    with xp.cuda.Device(device_id):
+                        warmup(xp=xp)
+            except Exception:
+                log.exception("JIT warmup failed")
+
+        thread = threading.Thread(
+            target=_run, name=f"libertem-holo-warmup-{key}", daemon=True,
+        )
+        thread.start()
+        _warmup_threads[key] = thread
+        return thread
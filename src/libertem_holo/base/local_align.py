@@ -0,0 +1,404 @@
+"""Local, tile-wise registration for non-uniform drift and distortions.
+
+:func:`~libertem_holo.base.align.align_stack` finds one rigid shift per
+frame. Here, each frame is split into a grid of overlapping tiles, which are
+registered against the same tiles of a reference image. A smooth polynomial
+displacement field is then fitted to the tile shifts, and each frame is
+resampled once using that field.
+"""
+from __future__ import annotations
+
+import math
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal, NamedTuple
+
+import numpy as np
+
+from libertem_holo.base.align import cross_correlate_batch
+
+
+class TileShifts(NamedTuple):
+    """The result of :func:`register_tiles`."""
+
+    #: y coordinates of the tile centers, shape (ny,)
+    centers_y: np.ndarray
+    #: x coordinates of the tile centers, shape (nx,)
+    centers_x: np.ndarray
+    #: (y, x) shift of each tile of each frame, shape (N, ny, nx, 2)
+    shifts: np.ndarray
+    #: height of the correlation peak of each tile, shape (N, ny, nx)
+    peaks: np.ndarray
+
+
+def tile_starts(size: int, tile_size: int, step: int) -> np.ndarray:
+    """Start indices of tiles of `tile_size` along an axis of length `size`.
+
+    The tiles are spaced by `step`, and the last tile ends at the end of the
+    axis, so the whole axis is covered.
+    """
+    if tile_size > size:
+        raise ValueError(f"tile_size {tile_size} is larger than the image ({size})")
+    starts = list(range(0, size - tile_size + 1, step))
+    if starts[-1] != size - tile_size:
+        starts.append(size - tile_size)
+    return np.array(starts)
+
+
+def _extract_tiles(
+    images: np.ndarray,
+    starts_y: np.ndarray,
+    starts_x: np.ndarray,
+    tile_size: int,
+    xp=np,
+) -> np.ndarray:
+    """
+    Gather the tiles of a stack of images with shape (N, h, w) into an array
+    of shape (N, ny, nx, tile_size, tile_size).
+    """
+    offsets = xp.arange(tile_size)
+    idx_y = xp.asarray(starts_y)[:, None] + offsets
+    idx_x = xp.asarray(starts_x)[:, None] + offsets
+    return images[:, idx_y[:, None, :, None], idx_x[None, :, None, :]]
+
+
+def register_tiles(
+    stack: np.ndarray,
+    reference: np.ndarray,
+    tile_size: int = 128,
+    step: int | None = None,
+    upsample_factor: int = 10,
+    normalization: Literal['phase'] | None = 'phase',
+    hanning: bool = True,
+    batch_size: int = 4,
+    num_workers: int = 1,
+    xp=np,
+) -> TileShifts:
+    """Register a grid of overlapping tiles of each frame against a reference.
+
+    All tiles of a batch of frames are registered at once, using stacked FFTs
+    and :func:`~libertem_holo.base.align.cross_correlate_batch`.
+
+    Parameters
+    ----------
+    stack
+        Real images with shape (N, h, w), for example the amplitudes of the
+        reconstructed waves
+    reference
+        The static reference image, with shape (h, w)
+    tile_size
+        Edge length of the square tiles. The tiles need to be large enough
+        to contain features that can be registered, and the shifts need to
+        be smaller than about half the tile size.
+    step
+        Distance between the tiles. By default, half of `tile_size`.
+    upsample_factor
+        Subpixel scaling factor, see
+        :func:`~libertem_holo.base.align.cross_correlate`
+    normalization
+        'phase' or None, see :func:`~libertem_holo.base.align.cross_correlate`
+    hanning
+        Apply a hanning window to each tile before correlating
+    batch_size
+        Register the tiles of this many frames at once
+    num_workers
+        Register batches in parallel using this many threads
+    xp
+        Either numpy or cupy
+
+    Returns
+    -------
+    The tile centers, and the shift and correlation peak of each tile
+    """
+    stack = xp.asarray(stack)
+    reference = xp.asarray(reference)
+    step = tile_size // 2 if step is None else step
+    height, width = reference.shape
+    starts_y = tile_starts(height, tile_size, step)
+    starts_x = tile_starts(width, tile_size, step)
+    grid_shape = (len(starts_y), len(starts_x))
+    num_tiles = math.prod(grid_shape)
+
+    window = 1
+    if hanning:
+        window = xp.outer(xp.hanning(tile_size), xp.hanning(tile_size))
+
+    def _tile_spectra(images):
+        tiles = _extract_tiles(images, starts_y, starts_x, tile_size, xp=xp)
+        tiles = tiles.reshape((-1, tile_size, tile_size))
+        tiles = tiles - tiles.mean(axis=(-2, -1), keepdims=True)
+        return xp.fft.fftn(tiles * window, axes=(-2, -1))
+
+    ref_spectra = _tile_spectra(reference[None])
+
+    def _register_batch(start: int, stop: int):
+        num_frames = stop - start
+        spectra = _tile_spectra(stack[start:stop]).reshape(
+            (num_frames, num_tiles, tile_size, tile_size),
+        )
+        # the reference spectra broadcast against all frames of the batch:
+        shifts, corrmaps = cross_correlate_batch(
+            ref_spectra[None],
+            spectra,
+            normalization=normalization,
+            upsample_factor=upsample_factor,
+            xp=xp,
+        )
+        peaks = corrmaps.reshape(corrmaps.shape[:-2] + (-1,)).max(axis=-1)
+        return (
+            shifts.reshape((num_frames,) + grid_shape + (2,)),
+            peaks.reshape((num_frames,) + grid_shape),
+        )
+
+    batch_size = max(1, batch_size)
+    batches = [
+        (start, min(start + batch_size, stack.shape[0]))
+        for start in range(0, stack.shape[0], batch_size)
+    ]
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(lambda batch: _register_batch(*batch), batches))
+    else:
+        results = [_register_batch(*batch) for batch in batches]
+
+    return TileShifts(
+        centers_y=starts_y + (tile_size - 1) / 2,
+        centers_x=starts_x + (tile_size - 1) / 2,
+        shifts=xp.concatenate([shifts for shifts, _ in results]),
+        peaks=xp.concatenate([peaks for _, peaks in results]),
+    )
+
+
+def _poly_basis(
+    y: np.ndarray,
+    x: np.ndarray,
+    shape: tuple[int, int],
+    degree: int,
+    xp=np,
+) -> np.ndarray:
+    """
+    2D polynomial terms :code:`y**i * x**j` with :code:`i + j <= degree`,
+    in coordinates normalized to [-1, 1] over `shape`. The terms are stacked
+    along the last axis.
+    """
+    yn = 2 * xp.asarray(y, dtype=np.float64) / max(shape[0] - 1, 1) - 1
+    xn = 2 * xp.asarray(x, dtype=np.float64) / max(shape[1] - 1, 1) - 1
+    return xp.stack([
+        yn**i * xn**j
+        for i in range(degree + 1)
+        for j in range(degree + 1 - i)
+    ], axis=-1)
+
+
+def fit_displacement(
+    tile_shifts: TileShifts,
+    shape: tuple[int, int],
+    degree: int = 2,
+    xp=np,
+) -> np.ndarray:
+    """Fit a smooth polynomial displacement field to the tile shifts.
+
+    Each component of the shift is fitted separately per frame, using
+    least squares weighted by the correlation peak of each tile, so tiles
+    without good features have less influence. Raises a `ValueError` if
+    the tiles with a positive peak can't determine all coefficients.
+
+    Parameters
+    ----------
+    tile_shifts
+        As returned by :func:`register_tiles`
+    shape
+        Shape (h, w) of the frames
+    degree
+        Degree of the 2D polynomial. 0 is a rigid shift per frame, 1 adds
+        affine distortions.
+    xp
+        Either numpy or cupy
+
+    Returns
+    -------
+    The polynomial coefficients, with shape (N, 2, num_terms), to be passed
+    to :func:`displacement_map`
+    """
+    cy, cx = np.meshgrid(tile_shifts.centers_y, tile_shifts.centers_x, indexing='ij')
+    basis = _poly_basis(cy.reshape((-1,)), cx.reshape((-1,)), shape, degree, xp=xp)
+    num_frames = tile_shifts.shifts.shape[0]
+    shifts = xp.asarray(tile_shifts.shifts).reshape((num_frames, -1, 2))
+    peaks = xp.asarray(tile_shifts.peaks).reshape((num_frames, -1))
+    # tiles without a positive correlation peak don't constrain the fit:
+    weights = xp.sqrt(xp.where(peaks > 0, peaks, 0))
+    num_terms = basis.shape[1]
+    coefficients = []
+    for i, (frame_shifts, frame_weights) in enumerate(zip(shifts, weights)):
+        coeffs, _, rank, _ = xp.linalg.lstsq(
+            basis * frame_weights[:, None],
+            frame_shifts * frame_weights[:, None],
+            rcond=None,
+        )
+        if int(rank) < num_terms:
+            raise ValueError(
+                f"frame {i}: the valid tiles determine only {int(rank)} of the "
+                f"{num_terms} terms of a polynomial of degree {degree}; "
+                f"use a lower `degree`, or more tiles"
+            )
+        coefficients.append(coeffs.T)
+    return xp.stack(coefficients)
+
+
+def displacement_map(
+    coefficients: np.ndarray,
+    shape: tuple[int, int],
+    xp=np,
+) -> np.ndarray:
+    """Evaluate the displacement field of one frame on the full pixel grid.
+
+    Parameters
+    ----------
+    coefficients
+        Coefficients of one frame, with shape (2, num_terms), as returned by
+        :func:`fit_displacement`
+    shape
+        Shape (h, w) of the frame
+    xp
+        Either numpy or cupy
+
+    Returns
+    -------
+    The (y, x) displacement of each pixel, with shape (2, h, w)
+    """
+    coefficients = xp.asarray(coefficients)
+    num_terms = coefficients.shape[-1]
+    # invert num_terms = (degree + 1) * (degree + 2) / 2:
+    degree = int(round((math.sqrt(8 * num_terms + 1) - 3) / 2))
+    yy = xp.arange(shape[0], dtype=np.float64)[:, None]
+    xx = xp.arange(shape[1], dtype=np.float64)[None, :]
+    basis = _poly_basis(yy, xx, shape, degree, xp=xp)
+    return xp.moveaxis(basis @ coefficients.T, -1, 0)
+
+
+def warp(
+    image: np.ndarray,
+    displacement: np.ndarray,
+    order: int = 3,
+    mode: str = 'nearest',
+    xp=np,
+) -> np.ndarray:
+    """Shift each pixel of `image` by `displacement`, in a single resampling.
+
+    The result at position `r` is the input at `r - displacement(r)`, so a
+    constant displacement is the same as a shift with
+    :func:`~libertem_holo.base.align.shift_stack`.
+
+    Parameters
+    ----------
+    image
+        Real or complex image with shape (h, w)
+    displacement
+        (y, x) displacement of each pixel, with shape (2, h, w)
+    order
+        Order of the spline interpolation, see
+        :func:`scipy.ndimage.map_coordinates`
+    mode
+        How to handle positions outside of the image, see
+        :func:`scipy.ndimage.map_coordinates`
+    xp
+        Either numpy or cupy
+    """
+    if xp is np:
+        from scipy.ndimage import map_coordinates
+    else:
+        from cupyx.scipy.ndimage import map_coordinates
+    image = xp.asarray(image)
+    coords = xp.indices(image.shape, dtype=np.float64) - xp.asarray(displacement)
+    if np.iscomplexobj(image):
+        return (
+            map_coordinates(image.real, coords, order=order, mode=mode)
+            + 1j * map_coordinates(image.imag, coords, order=order, mode=mode)
+        )
+    return map_coordinates(image, coords, order=order, mode=mode)
+
+
+def align_stack_local(
+    stack: np.ndarray,
+    wave_stack: np.ndarray,
+    static: np.ndarray | None = None,
+    tile_size: int = 128,
+    step: int | None = None,
+    degree: int = 2,
+    upsample_factor: int = 10,
+    order: int = 3,
+    batch_size: int = 4,
+    num_workers: int = 1,
+    xp: typing.Any = np,
+) -> tuple[np.ndarray, np.ndarray, TileShifts]:
+    """Align a stack with a smooth, non-uniform displacement per frame.
+
+    The tiles of all frames are registered using :func:`register_tiles`,
+    a polynomial displacement field is fitted using
+    :func:`fit_displacement`, and each frame of `wave_stack` is resampled
+    once using :func:`warp`.
+
+    Parameters
+    ----------
+    stack
+        Real images with shape (N, h, w) which are used for the
+        registration, for example the amplitudes of the reconstructed waves
+    wave_stack
+        The (complex) images to align, with the same shape as `stack`
+    static
+        A reference image to align against. If this is not given,
+        the first image of the stack will be taken.
+    tile_size, step, upsample_factor, batch_size
+        See :func:`register_tiles`
+    degree
+        See :func:`fit_displacement`
+    order
+        See :func:`warp`
+    num_workers
+        Register the tiles and resample the frames using this many threads
+    xp
+        Either numpy or cupy
+
+    Returns
+    -------
+    aligned_stack
+        The aligned stack, same shape as `wave_stack`
+    coefficients
+        The coefficients of the displacement field of each frame, see
+        :func:`displacement_map`
+    tile_shifts
+        The measured tile shifts, useful to judge the quality of the fit
+    """
+    stack = xp.asarray(stack)
+    wave_stack = xp.asarray(wave_stack)
+    if stack.shape != wave_stack.shape:
+        raise ValueError(
+            f"stack and wave_stack need to have the same shape, "
+            f"have {stack.shape} and {wave_stack.shape}"
+        )
+    reference = stack[0] if static is None else xp.asarray(static)
+    tile_shifts = register_tiles(
+        stack,
+        reference,
+        tile_size=tile_size,
+        step=step,
+        upsample_factor=upsample_factor,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        xp=xp,
+    )
+    shape = tuple(stack.shape[1:])
+    coefficients = fit_displacement(tile_shifts, shape=shape, degree=degree, xp=xp)
+    aligned_stack = xp.zeros_like(wave_stack)
+
+    def _warp_frame(i: int) -> None:
+        displacement = displacement_map(coefficients[i], shape, xp=xp)
+        aligned_stack[i] = warp(wave_stack[i], displacement, order=order, xp=xp)
+
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(_warp_frame, range(wave_stack.shape[0])))
+    else:
+        for i in range(wave_stack.shape[0]):
+            _warp_frame(i)
+    return aligned_stack, coefficients, tile_shifts
@@ -33,21 +33,55 @@ from __future__ import annotations
 import typing
 from typing import Literal
 import time
-from sparseconverter import NUMPY, for_backend
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.colors import LogNorm
 import logging
-from scipy.sparse.linalg import eigsh
 
 from libertem_holo.base.filters import phase_unwrap
-from libertem_holo.base.utils import get_slice_fft, HoloParams
+from libertem_holo.base.utils import apply_fourier_shift, get_slice_fft, HoloParams
 
 log = logging.getLogger(__name__)
 
 XPType = typing.Any  # Union[Module("numpy"), Module("cupy")]
 
 
+def reconstruct_spectrum(
+    frame: np.ndarray,
+    sb_pos: tuple[float, float],
+    aperture: np.ndarray,
+    slice_fft: tuple[slice, slice],
+    *,
+    precision: bool = True,
+    shift: tuple[float, float] | np.ndarray | None = None,
+    xp: XPType = np,
+) -> np.ndarray:
+    """Reconstruct the spectrum of the wave of a single hologram.
+
+    This is the cropped and masked sideband, with the same parameters as
+    :func:`reconstruct_frame`, right before the inverse FFT. It is the
+    non-shifted forward FFT of the reconstructed wave, meaning
+    :code:`xp.fft.ifft2(spectrum)` is the result of :func:`reconstruct_frame`.
+
+    The spectra can be used to register the waves without any additional
+    forward FFTs, see :class:`~libertem_holo.base.align.SpectrumCorrelator`.
+    """
+    frame = xp.array(frame)
+
+    if not precision:
+        frame = frame.astype(np.float32)
+
+    fft_frame = xp.fft.fft2(frame)
+    fft_frame = xp.roll(fft_frame, xp.array(sb_pos).astype(xp.int64), axis=(0, 1))
+
+    fft_frame = xp.fft.fftshift(xp.fft.fftshift(fft_frame)[slice_fft])
+
+    fft_frame = fft_frame * aperture
+
+    if shift is not None:
+        fft_frame = apply_fourier_shift(fft_frame, shift, xp=xp)
+
+    return fft_frame
+
+
 def reconstruct_frame(
     frame: np.ndarray,
     sb_pos: tuple[float, float],
@@ -55,6 +89,7 @@ def reconstruct_frame(
     slice_fft: tuple[slice, slice],
     *,
     precision: bool = True,
+    shift: tuple[float, float] | np.ndarray | None = None,
     xp: XPType = np,
 ) -> np.ndarray:
     """Reconstruct a single hologram.
@@ -74,24 +109,26 @@ def reconstruct_frame(
     precision
         Defines precision of the reconstruction, True for complex128 for the
         resulting complex wave, otherwise results will be complex64
+    shift
+        Optionally shift the reconstructed wave by this (y, x) offset in pixels
+        of the output shape, for example to apply shifts found by
+        :func:`~libertem_holo.base.align.align_stack`. The shift is applied to
+        the cropped spectrum before the inverse FFT, which is equivalent to,
+        but cheaper than, shifting the wave afterwards.
     xp
         Pass in either the numpy or cupy module to select CPU or GPU processing
 
     """
-    frame = xp.array(frame)
-
-    if not precision:
-        frame = frame.astype(np.float32)
-    frame_size = frame.shape
-
-    fft_frame = xp.fft.fft2(frame) / np.prod(frame_size)
-    fft_frame = xp.roll(fft_frame, xp.array(sb_pos).astype(xp.int64), axis=(0, 1))
-
-    fft_frame = xp.fft.fftshift(xp.fft.fftshift(fft_frame)[slice_fft])
-
-    fft_frame = fft_frame * aperture
-
-    return xp.fft.ifft2(fft_frame) * np.prod(frame_size)
+    spectrum = reconstruct_spectrum(
+        frame,
+        sb_pos=sb_pos,
+        aperture=aperture,
+        slice_fft=slice_fft,
+        precision=precision,
+        shift=shift,
+        xp=xp,
+    )
+    return xp.fft.ifft2(spectrum)
 
 
 def reconstruct_double_resolution(
@@ -302,6 +339,9 @@ def display_fft_image(
     detail : bolean
 
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
     fft_original_image = np.fft.fft2(image) / np.prod(image.shape)
     fft_original_image1 = np.roll(fft_original_image, sb_position, axis=(0, 1))
     fft_original_image2 = np.fft.fftshift(fft_original_image1)
@@ -336,6 +376,8 @@ def get_phase(
     xp: XPType = np,
 ) -> np.ndarray:
     """Reconstruct hologram using HoloParams and extract and unwrap phase."""
+    from sparseconverter import NUMPY, for_backend
+
     t0 = time.perf_counter()
 
     slice_fft = get_slice_fft(params.out_shape, hologram.shape)
@@ -379,7 +421,7 @@ def reconstruct_bf(
     fft_frame = xp.fft.fft2(frame)
     fft_frame = xp.fft.fftshift(xp.fft.fftshift(fft_frame)[slice_fft])
 
-    fft_frame = fft_frame * xp.array(aperture)
+    fft_frame = fft_frame * xp.asarray(aperture)
 
     return xp.fft.ifft2(fft_frame)
 
@@ -431,6 +473,9 @@ def phase_offset_correction(
     xp
         Either numpy or cupy for GPU support
     """
+    from scipy.sparse.linalg import eigsh
+    from sparseconverter import NUMPY, for_backend
+
     aligned_stack = xp.asarray(aligned_stack)
     R = aligned_stack.shape[0]
     orig_R = R
@@ -0,0 +1,461 @@
+"""Streaming statistics over stacks of images.
+
+These accumulate per-pixel statistics frame by frame, so the full stack never
+has to be kept in memory. Partial results, for example from different
+threads or workers, can be merged.
+
+Robust averages, like the sigma-clipped mean or the median, need two passes
+over the stack: the first one for the per-pixel mean and standard deviation,
+and the second one for the clipped sum or the histograms.
+"""
+from __future__ import annotations
+
+import typing
+
+import numpy as np
+
+
+class StreamingStats:
+    """Per-pixel mean and variance over a stream of frames.
+
+    Uses Welford's algorithm for numerically stable updates, and the pairwise
+    formula of Chan et al. for merging partial results. All accumulation is
+    done in float64. Complex frames contribute their absolute value.
+
+    In addition to the per-pixel statistics, a residual is recorded for each
+    frame: the root mean square difference between the frame and the mean
+    of all frames before it. This makes it possible to monitor the quality of
+    an alignment while it runs, as badly aligned frames stand out with a
+    large residual. The first frame has no residual, and is recorded as NaN.
+
+    Examples
+    --------
+    >>> stats = StreamingStats()
+    >>> for frame in np.ones((3, 16, 16)):
+    ...     stats.update(frame)
+    >>> stats.count
+    3
+    >>> float(stats.std.max())
+    0.0
+    """
+
+    def __init__(self, margin: int = 0, xp=np) -> None:
+        """
+        Parameters
+        ----------
+        margin
+            Exclude this many pixels at each border of the frames from the
+            residuals, for example to skip regions that wrap around when
+            shifting. The per-pixel statistics always cover the full frame.
+        xp
+            Either numpy or cupy
+        """
+        self.margin = margin
+        self.xp = xp
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+        self._residuals = []
+
+    def _crop(self, image: np.ndarray) -> np.ndarray:
+        if self.margin <= 0:
+            return image
+        m = self.margin
+        return image[..., m:-m, m:-m]
+
+    def update(self, frames: np.ndarray) -> None:
+        """Add a single frame of shape (h, w), or a batch of shape (N, h, w).
+
+        Frames of a batch are added one after the other, so the result doesn't
+        depend on how a stack is split into batches.
+        """
+        xp = self.xp
+        frames = xp.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        if np.iscomplexobj(frames):
+            frames = xp.abs(frames)
+        if self._mean is None:
+            self._mean = xp.zeros(frames.shape[1:], dtype=np.float64)
+            self._m2 = xp.zeros(frames.shape[1:], dtype=np.float64)
+        elif frames.shape[1:] != self._mean.shape:
+            raise ValueError(
+                f"frames of shape {frames.shape[1:]} don't match the "
+                f"accumulated shape {self._mean.shape}"
+            )
+        for frame in frames:
+            delta = frame - self._mean
+            if self.count == 0:
+                self._residuals.append(xp.asarray(np.nan))
+            else:
+                self._residuals.append(xp.sqrt(xp.mean(self._crop(delta) ** 2)))
+            self.count += 1
+            self._mean += delta / self.count
+            self._m2 += delta * (frame - self._mean)
+
+    def merge(self, other: StreamingStats) -> StreamingStats:
+        """Merge the statistics of `other` into this instance.
+
+        The residuals of `other` are appended as they are, so they are relative
+        to the running mean of `other`.
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self._mean = other._mean.copy()
+            self._m2 = other._m2.copy()
+        else:
+            if other._mean.shape != self._mean.shape:
+                raise ValueError(
+                    f"can't merge statistics of shape {other._mean.shape} "
+                    f"into {self._mean.shape}"
+                )
+            count = self.count + other.count
+            delta = other._mean - self._mean
+            self._mean += delta * (other.count / count)
+            self._m2 += other._m2 + delta ** 2 * (self.count * other.count / count)
+        self.count += other.count
+        self._residuals.extend(other._residuals)
+        return self
+
+    def _check_count(self) -> None:
+        if self.count == 0:
+            raise ValueError("no frames have been accumulated")
+
+    @property
+    def mean(self) -> np.ndarray:
+        """The per-pixel mean"""
+        self._check_count()
+        return self._mean
+
+    @property
+    def variance(self) -> np.ndarray:
+        """The per-pixel population variance, like :code:`np.var(stack, axis=0)`"""
+        self._check_count()
+        return self._m2 / self.count
+
+    @property
+    def std(self) -> np.ndarray:
+        """The per-pixel standard deviation, like :code:`np.std(stack, axis=0)`"""
+        return self.xp.sqrt(self.variance)
+
+    @property
+    def residuals(self) -> np.ndarray:
+        """The residual of each frame, in the order they were added, shape (N,)"""
+        if not self._residuals:
+            return self.xp.zeros((0,), dtype=np.float64)
+        return self.xp.stack(self._residuals)
+
+    def __repr__(self) -> str:
+        shape = None if self._mean is None else self._mean.shape
+        return f"<StreamingStats count={self.count} shape={shape}>"
+
+
+class ClippedMean:
+    """Per-pixel sigma-clipped mean, accumulated over a stream of frames.
+
+    This is the second pass of a sigma-clipped average: values that deviate
+    from the per-pixel mean of a first pass by more than `sigma` standard
+    deviations are rejected, for example frames that were taken while the
+    beam was blanked. The first pass is a :class:`StreamingStats` instance.
+
+    For complex frames, the rejection is based on the absolute value, like in
+    :class:`StreamingStats`, and the complex values are averaged.
+    """
+
+    def __init__(self, stats: StreamingStats, sigma: float = 3.0) -> None:
+        """
+        Parameters
+        ----------
+        stats
+            The statistics of the first pass over the same frames
+        sigma
+            Reject values that are further than this many standard deviations
+            from the mean
+        """
+        self.xp = stats.xp
+        self.sigma = sigma
+        self._center = stats.mean
+        self._limit = sigma * stats.std
+        self._sum = None
+        self._count = self.xp.zeros(self._center.shape, dtype=np.int64)
+
+    def update(self, frames: np.ndarray) -> None:
+        """Add a single frame of shape (h, w), or a batch of shape (N, h, w)."""
+        xp = self.xp
+        frames = xp.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        values = xp.abs(frames) if np.iscomplexobj(frames) else frames
+        keep = xp.abs(values - self._center) <= self._limit
+        batch_sum = xp.where(keep, frames, 0).sum(axis=0)
+        if self._sum is None:
+            self._sum = batch_sum.astype(np.result_type(batch_sum.dtype, np.float64))
+        else:
+            self._sum += batch_sum
+        self._count += keep.sum(axis=0)
+
+    def merge(self, other: ClippedMean) -> ClippedMean:
+        """Merge the partial sums of `other`, which has to use the same first pass."""
+        if other._sum is not None:
+            if self._sum is None:
+                self._sum = other._sum.copy()
+            else:
+                self._sum += other._sum
+        self._count += other._count
+        return self
+
+    @property
+    def count(self) -> np.ndarray:
+        """The number of values that were kept for each pixel"""
+        return self._count
+
+    @property
+    def mean(self) -> np.ndarray:
+        """The per-pixel clipped mean, NaN where all values were rejected"""
+        if self._sum is None:
+            raise ValueError("no frames have been accumulated")
+        xp = self.xp
+        return xp.where(
+            self._count > 0,
+            self._sum / xp.maximum(self._count, 1),
+            np.nan,
+        )
+
+
+class StreamingHistogram:
+    """Per-pixel histograms of a stream of frames, for approximate quantiles.
+
+    Each pixel has `bins` equally sized bins between `lower` and `upper`,
+    which can be scalars or per-pixel arrays, for example the mean plus and
+    minus a few standard deviations from a :class:`StreamingStats` pass.
+    Values outside of this range are counted in the first or last bin, so
+    they don't shift quantiles like the median, as long as they are in the
+    minority. Quantiles are interpolated linearly within the bins, and are
+    accurate to one bin width, :code:`(upper - lower) / bins`.
+
+    The histograms take :code:`bins * h * w * 4` bytes, independent of the
+    number of frames. Only real values are supported; see
+    :func:`streaming_median` for complex stacks.
+    """
+
+    def __init__(
+        self,
+        lower: float | np.ndarray,
+        upper: float | np.ndarray,
+        shape: tuple[int, int],
+        bins: int = 64,
+        xp=np,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        lower, upper
+            The range of the histograms, as scalars or arrays of shape `shape`
+        shape
+            The shape (h, w) of the frames
+        bins
+            The number of bins per pixel
+        xp
+            Either numpy or cupy
+        """
+        self.xp = xp
+        self.bins = bins
+        self.shape = tuple(shape)
+        self._lower = xp.broadcast_to(xp.asarray(lower, dtype=np.float64), self.shape)
+        upper = xp.broadcast_to(xp.asarray(upper, dtype=np.float64), self.shape)
+        width = (upper - self._lower) / bins
+        # avoid division by zero for constant pixels, their quantiles
+        # are `lower`:
+        self._empty_range = ~(width > 0)
+        self._width = xp.where(self._empty_range, 1.0, width)
+        self._counts = xp.zeros((bins,) + self.shape, dtype=np.uint32)
+        self.count = 0
+
+    def update(self, frames: np.ndarray) -> None:
+        """Add a single frame of shape (h, w), or a batch of shape (N, h, w)."""
+        xp = self.xp
+        frames = xp.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        if np.iscomplexobj(frames):
+            raise TypeError("StreamingHistogram only supports real values")
+        indices = xp.floor((frames - self._lower) / self._width)
+        indices = xp.clip(indices, 0, self.bins - 1).astype(np.int64)
+        counts = self._counts.reshape((self.bins, -1))
+        pixels = xp.arange(counts.shape[1])
+        # each pixel appears once per frame, so there are no duplicate indices:
+        for frame_indices in indices.reshape((indices.shape[0], -1)):
+            counts[frame_indices, pixels] += 1
+        self.count += frames.shape[0]
+
+    def merge(self, other: StreamingHistogram) -> StreamingHistogram:
+        """Merge the histograms of `other`, which has to use the same bins."""
+        self._counts += other._counts
+        self.count += other.count
+        return self
+
+    def quantile(self, q: float) -> np.ndarray:
+        """The approximate per-pixel `q` quantile, with `q` between 0 and 1."""
+        if self.count == 0:
+            raise ValueError("no frames have been accumulated")
+        xp = self.xp
+        cumulative = xp.cumsum(self._counts, axis=0)
+        target = q * self.count
+        index = xp.argmax(cumulative >= target, axis=0)
+        index_slice = index[np.newaxis]
+        in_bin = xp.take_along_axis(self._counts, index_slice, axis=0)[0]
+        before = xp.take_along_axis(cumulative, index_slice, axis=0)[0] - in_bin
+        fraction = (target - before) / xp.maximum(in_bin, 1)
+        result = self._lower + (index + fraction) * self._width
+        return xp.where(self._empty_range, self._lower, result)
+
+    @property
+    def median(self) -> np.ndarray:
+        """The approximate per-pixel median"""
+        return self.quantile(0.5)
+
+
+def _iter_batches(stack: typing.Any, batch_size: int, xp=np) -> typing.Iterator[np.ndarray]:
+    for start in range(0, stack.shape[0], batch_size):
+        yield xp.asarray(stack[start:start + batch_size])
+
+
+def _first_pass(stack: typing.Any, batch_size: int, xp=np) -> StreamingStats:
+    stats = StreamingStats(xp=xp)
+    for batch in _iter_batches(stack, batch_size, xp=xp):
+        stats.update(batch)
+    return stats
+
+
+def _first_pass_parts(
+    stack: typing.Any,
+    batch_size: int,
+    xp=np,
+) -> tuple[StreamingStats, StreamingStats]:
+    stats_real = StreamingStats(xp=xp)
+    stats_imag = StreamingStats(xp=xp)
+    for batch in _iter_batches(stack, batch_size, xp=xp):
+        stats_real.update(batch.real)
+        stats_imag.update(batch.imag)
+    return stats_real, stats_imag
+
+
+def sigma_clipped_mean(
+    stack: typing.Any,
+    sigma: float = 3.0,
+    batch_size: int = 16,
+    stats: StreamingStats | None = None,
+    xp=np,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Sigma-clipped mean of a stack, reading it in batches.
+
+    The first pass computes the per-pixel mean and standard deviation, and
+    the second pass averages the values within `sigma` standard deviations,
+    see :class:`ClippedMean`. Only one batch of the stack is in memory at a
+    time, so this works on memory-mapped files, HDF5 datasets and the results
+    of UDFs alike.
+
+    Parameters
+    ----------
+    stack
+        An array-like of shape (N, h, w), real or complex, which can be sliced
+        along the first axis
+    sigma
+        Reject values that are further than this many standard deviations
+        from the mean
+    batch_size
+        Read this many frames at once
+    stats
+        The first pass, if it is already available, for example from
+        the `stats` argument of :func:`~libertem_holo.base.align.align_stack`
+    xp
+        Either numpy or cupy
+
+    Returns
+    -------
+    mean
+        The clipped mean, of shape (h, w)
+    count
+        The number of frames that contributed to each pixel
+    """
+    if stats is None:
+        stats = _first_pass(stack, batch_size, xp=xp)
+    clipped = ClippedMean(stats, sigma=sigma)
+    for batch in _iter_batches(stack, batch_size, xp=xp):
+        clipped.update(batch)
+    return clipped.mean, clipped.count
+
+
+def streaming_median(
+    stack: typing.Any,
+    bins: int = 64,
+    batch_size: int = 16,
+    stats: StreamingStats | tuple[StreamingStats, StreamingStats] | None = None,
+    width: float = 4.0,
+    xp=np,
+) -> np.ndarray:
+    """Approximate per-pixel median of a stack, reading it in batches.
+
+    The first pass computes the per-pixel mean and standard deviation, which
+    define the range of the :class:`StreamingHistogram` of the second pass as
+    `width` standard deviations around the mean. The result is accurate to
+    :code:`2 * width * std / bins`.
+
+    For complex stacks, the median of the real and imaginary parts is taken
+    separately. The first pass then computes the statistics of both parts,
+    and the accuracy of each part depends on its own standard deviation.
+
+    Parameters
+    ----------
+    stack
+        An array-like of shape (N, h, w), real or complex, which can be sliced
+        along the first axis
+    bins
+        The number of histogram bins per pixel
+    batch_size
+        Read this many frames at once
+    stats
+        The first pass, if it is already available. For complex stacks, a
+        tuple with the statistics of the real and the imaginary part, as
+        :class:`StreamingStats` of complex frames only cover the amplitude.
+    width
+        The half-width of the histogram range, in standard deviations
+    xp
+        Either numpy or cupy
+
+    Returns
+    -------
+    The approximate median, of shape (h, w)
+    """
+    is_complex = np.iscomplexobj(xp.asarray(stack[:1]))
+    if is_complex:
+        if stats is None:
+            stats = _first_pass_parts(stack, batch_size, xp=xp)
+        elif isinstance(stats, StreamingStats):
+            raise ValueError(
+                "for complex stacks, `stats` needs to be a tuple with the "
+                "statistics of the real and the imaginary part"
+            )
+        parts_stats = tuple(stats)
+    else:
+        if stats is None:
+            stats = _first_pass(stack, batch_size, xp=xp)
+        parts_stats = (stats,)
+    hists = [
+        StreamingHistogram(
+            part.mean - width * part.std,
+            part.mean + width * part.std,
+            shape=part.mean.shape,
+            bins=bins,
+            xp=xp,
+        )
+        for part in parts_stats
+    ]
+    for batch in _iter_batches(stack, batch_size, xp=xp):
+        hists[0].update(batch.real)
+        if is_complex:
+            hists[1].update(batch.imag)
+    if is_complex:
+        return hists[0].median + 1j * hists[1].median
+    return hists[0].median
@@ -29,20 +29,12 @@ from __future__ import annotations
 
 from __future__ import annotations
 
-from functools import lru_cache
 from typing import Any, Literal
+import math
 import typing
 import logging
 
-try:
-    import cupy as cp
-except ImportError:
-    cp = None
 import numpy as np
-from skimage.draw import polygon
-from scipy.ndimage import gaussian_filter
-from scipy.optimize import least_squares
-from sparseconverter import NUMPY, for_backend
 
 
 log = logging.getLogger(__name__)
@@ -90,6 +82,46 @@ def get_slice_fft(
     return (slice(y_min, y_max), slice(x_min, x_max))
 
 
+def _is_5_smooth(n: int) -> bool:
+    for p in (2, 3, 5):
+        while n % p == 0:
+            n //= p
+    return n == 1
+
+
+def next_fast_size(n: int, even: bool = True) -> int:
+    """Return the smallest FFT-friendly size that is at least `n`.
+
+    FFT-friendly sizes are 5-smooth, meaning their only prime factors are
+    2, 3 and 5. These are handled efficiently by both the numpy/scipy
+    (pocketfft) and the cupy (cuFFT) backends, while sizes with large prime
+    factors can be several times slower.
+
+    Parameters
+    ----------
+    n
+        The minimum size
+    even
+        Only return even sizes, which keeps the zero frequency exactly at
+        the center after an fft shift.
+    """
+    n = max(int(math.ceil(n)), 1)
+    if even:
+        return 2 * next_fast_size(math.ceil(n / 2), even=False)
+    while not _is_5_smooth(n):
+        n += 1
+    return n
+
+
+def fft_friendly_shape(shape: tuple[int, ...], even: bool = True) -> tuple[int, ...]:
+    """Round up each dimension of `shape` to an FFT-friendly size.
+
+    Useful for choosing the reconstruction shape, or for padding
+    holograms before transforming them. See :func:`next_fast_size`.
+    """
+    return tuple(next_fast_size(s, even=even) for s in shape)
+
+
 def _hard_disk_aperture(shape: tuple[int, int], radius: float, xp=np):
     cy = shape[0]//2
     cx = shape[1]//2
@@ -163,7 +195,7 @@ def estimate_sideband_position(
                 xp.asarray([int(fft_filtered.shape[0] / 2), 0]),
             )
         )
-        if xp is cp:
+        if xp is not np:
             sb_position = sb_position.get()
 
     return tuple(float(c) for c in sb_position)
@@ -236,6 +268,7 @@ class HoloParams(typing.NamedTuple):
         out_shape: tuple = None,
         line_filter_length: float = 0.9,
         line_filter_width: float | None = 20,
+        fft_friendly: bool = True,
         xp: XPType = np,
     ) -> HoloParams:
         """Determine reconstruction parameters from a hologram.
@@ -253,7 +286,8 @@ class HoloParams(typing.NamedTuple):
             to remove the central band
 
         out_shape
-            The reconstruction shape, should be larger than the sideband size
+            The reconstruction shape, should be larger than the sideband size.
+            If not given, it is derived from the sideband size.
 
         line_filter_length
             Length ratio of the line filter; as a fraction of the distance between
@@ -263,10 +297,14 @@ class HoloParams(typing.NamedTuple):
             Width of the line filter, in pixels. Passing in `None` will disable
             the line filter completely
 
+        fft_friendly
+            If `out_shape` is not given, round the derived shape up to a size
+            that can be transformed efficiently, see :func:`next_fast_size`.
+
         xp
             Pass in either the numpy or cupy module to select CPU or GPU processing
         """
-        from .filters import butterworth_line, butterworth_disk
+        from .filters import butterworth_aperture
         hologram = xp.asarray(hologram)
 
         sb_position = estimate_sideband_position(
@@ -280,36 +318,36 @@ class HoloParams(typing.NamedTuple):
 
         if out_shape is None:
             out_side = 2 * int(sb_size) + 16
+            if fft_friendly:
+                fast_side = next_fast_size(out_side)
+                # don't grow beyond the hologram:
+                if fast_side <= min(hologram.shape):
+                    out_side = fast_side
             out_shape = (out_side, out_side)
 
         fft_slice = get_slice_fft(out_shape, hologram.shape)
 
-        #  Disk aperture
-        aperture = butterworth_disk(
-            hologram.shape,
-            radius=sb_size,
-            order=20,
-            xp=xp,
-        )
-
         sb_position_int = tuple(
             int(c)
             for c in sb_position
         )
-        if line_filter_width is None:
-            aperture = np.fft.fftshift(aperture[fft_slice])
-        else:
-            lf = butterworth_line(
-                shape=hologram.shape,
-                width=line_filter_width,
-                sb_position=fft_shift_coords(
-                    sb_position_int, shape=hologram.shape
-                ),
-                length_ratio=line_filter_length,
-                order=2,
-                xp=xp,
-            )
-            aperture = xp.fft.fftshift(aperture[fft_slice] * lf[fft_slice])
+
+        # Disk aperture, multiplied with the line filter, only computed
+        # for the part that is cropped by `fft_slice`:
+        aperture = butterworth_aperture(
+            hologram.shape,
+            radius=sb_size,
+            sb_position=fft_shift_coords(
+                sb_position_int, shape=hologram.shape
+            ),
+            line_width=line_filter_width,
+            length_ratio=line_filter_length,
+            disk_order=20,
+            line_order=2,
+            slice_fft=fft_slice,
+            xp=xp,
+        )
+        aperture = xp.fft.fftshift(aperture)
 
         return cls(
             sb_size=sb_size,
@@ -322,6 +360,8 @@ class HoloParams(typing.NamedTuple):
         )
 
     def filter_aperture_gaussian(self, sigma: float) -> HoloParams:
+        from scipy.ndimage import gaussian_filter
+        from sparseconverter import NUMPY, for_backend
         aperture = for_backend(self.aperture, NUMPY)
         new_aperture = self.xp.asarray(gaussian_filter(aperture, sigma=sigma))
         return HoloParams(
@@ -335,14 +375,84 @@ class HoloParams(typing.NamedTuple):
         )
 
 
-@lru_cache
+def apply_fourier_shift(spectrum, shift, xp: XPType = np):
+    """Shift the image corresponding to `spectrum` by `shift` pixels.
+
+    This is equivalent to :func:`scipy.ndimage.fourier_shift` for complex
+    spectra, but supports stacks of spectra with a different shift per image,
+    and both numpy and cupy arrays.
+
+    Parameters
+    ----------
+    spectrum
+        The (non-shifted) 2D FFT of an image, or a stack of those with shape
+        (..., h, w). Has to be complex, and is modified in place.
+    shift
+        The shift (y, x) in pixels, or an array of shape (..., 2) with one
+        shift per image.
+    xp
+        Either numpy or cupy
+
+    Returns
+    -------
+    The modified `spectrum`
+    """
+    shift = xp.asarray(shift, dtype=np.float64)
+    fy = xp.fft.fftfreq(spectrum.shape[-2])
+    fx = xp.fft.fftfreq(spectrum.shape[-1])
+    ramp_y = xp.exp(-2j * np.pi * shift[..., 0, None] * fy).astype(spectrum.dtype)
+    ramp_x = xp.exp(-2j * np.pi * shift[..., 1, None] * fx).astype(spectrum.dtype)
+    spectrum *= ramp_y[..., :, None]
+    spectrum *= ramp_x[..., None, :]
+    return spectrum
+
+
 def shifted_coords_for_shape(shape):
+    """
+    Return an array of shape :code:`(*shape, 2)` which contains the
+    fft-shifted coordinates for each position.
+
+    Only kept for backwards-compatibility; :func:`fft_shift_coords` computes
+    the same mapping without building the full grid.
+    """
     return np.fft.fftshift(np.moveaxis(np.mgrid[0:shape[0], 0:shape[1]], 0, -1), axes=(0, 1))
 
 
-def fft_shift_coords(pos, shape):
-    coords = shifted_coords_for_shape(shape)
-    return tuple(int(n) for n in coords[pos[0], pos[1]])
+def fft_shift_coords(pos, shape, inverse: bool = False):
+    """
+    Map the position `pos` in an array of shape `shape` through `np.fft.fftshift`.
+
+    The result is the same as indexing the fft-shifted coordinate grid,
+    :code:`np.fft.fftshift(coords)[pos]`, where :code:`coords[y, x] == (y, x)`.
+    With :code:`inverse=True`, the grid is shifted with `np.fft.ifftshift`
+    instead, which undoes the mapping. For even sizes, both directions are
+    the same; for odd sizes, they differ by one pixel.
+
+    Parameters
+    ----------
+    pos
+        Either a single integer position (y, x), or an array of positions
+        of shape (..., 2)
+    shape
+        The shape of the array the positions refer to
+    inverse
+        Use the `np.fft.ifftshift` mapping
+
+    Returns
+    -------
+    A tuple of ints for a single position, otherwise an integer array
+    of the same shape as `pos`.
+    """
+    pos_arr = np.asarray(pos)
+    half = np.array([shape[0] // 2, shape[1] // 2])
+    size = np.array([shape[0], shape[1]])
+    if inverse:
+        shifted = (pos_arr + half) % size
+    else:
+        shifted = (pos_arr - half) % size
+    if pos_arr.ndim == 1:
+        return tuple(int(n) for n in shifted)
+    return shifted
 
 
 def other_sb(sb_position, shape):
@@ -424,6 +534,7 @@ def draw_lf_rect(dest, orig_shape, sb_position_shifted, length_ratio, width):
         width=width,
         orig_shape=orig_shape
     )
+    from skimage.draw import polygon
     rr, cc = polygon(coords[:, 0], coords[:, 1], shape=dest.shape)
     dest[rr, cc] = True
 
@@ -466,6 +577,7 @@ def remove_phase_ramp(
         ramp_y = np.mean(np.gradient(img_roi, axis=0))
         ramp_x = np.mean(np.gradient(img_roi, axis=1))
     elif method == 'fit':
+        from scipy.optimize import least_squares
 
         def linear_gradient(c, dy, dx, y, x):
             return c+y*dy+x*dx
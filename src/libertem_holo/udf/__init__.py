@@ -1,3 +1,4 @@
 from .reconstr import HoloReconstructUDF
+from .align import AlignedAverageUDF, StackAlignUDF
 
-__all__ = ["HoloReconstructUDF"]
+__all__ = ["AlignedAverageUDF", "HoloReconstructUDF", "StackAlignUDF"]
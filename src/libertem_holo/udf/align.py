@@ -0,0 +1,331 @@
+"""UDFs for aligning stacks of images.
+
+Based on the functions available in :code:`libertem_holo.base.align`.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+from libertem.udf import UDF
+
+from libertem_holo.base.align import Correlator, ImageCorrelator, SpectrumCorrelator
+from libertem_holo.base.reconstr import reconstruct_spectrum
+from libertem_holo.base.utils import apply_fourier_shift, get_slice_fft
+
+
+class StackAlignUDF(UDF):
+    """Align each frame of a dataset against a static reference.
+
+    This is the distributed equivalent of
+    :func:`~libertem_holo.base.align.align_stack`: each worker registers the
+    frames of its partitions against the reference, and shifts them in
+    Fourier space. Complex frames, like reconstructed waves, are registered
+    using their amplitude.
+
+    The results are:
+
+    * :code:`shift`: the (y, x) shift that was applied to each frame
+    * :code:`peak`: the height of the correlation peak of each frame
+    * :code:`aligned`: the aligned frames (only if :code:`return_aligned=True`)
+    * :code:`aligned_sum`: the sum of all aligned frames (only if
+      :code:`accumulate=True`)
+
+    Examples
+    --------
+    Align against the sum of all frames:
+
+    >>> from libertem.udf.sum import SumUDF
+    >>> reference = ctx.run_udf(dataset=dataset, udf=SumUDF())['intensity'].data
+    >>> udf = StackAlignUDF(reference=reference)
+    >>> res = ctx.run_udf(dataset=dataset, udf=udf)
+    >>> res['shift'].data.shape
+    (7, 5, 2)
+    """
+
+    def __init__(
+        self,
+        *,
+        reference: np.ndarray,
+        correlator: Correlator | None = None,
+        return_aligned: bool = True,
+        accumulate: bool = False,
+    ) -> None:
+        """Distributed stack alignment.
+
+        Parameters
+        ----------
+        reference
+            The static reference image to align against, with the same shape
+            as the frames of the dataset. It is pre-processed by the correlator
+            once per task.
+
+        correlator
+            A :class:`~libertem_holo.base.align.Correlator` instance. By
+            default, an :class:`~libertem_holo.base.align.ImageCorrelator` is
+            used, with reasonable default parameters and the backend the UDF
+            runs on. A custom correlator should use the same backend
+            (numpy or cupy) as the UDF.
+
+        return_aligned
+            Return the aligned frames as the :code:`aligned` result. Disable this
+            if only the shifts or the sum are needed, as this result has the size
+            of the whole dataset.
+
+        accumulate
+            Return the sum of all aligned frames as the :code:`aligned_sum`
+            result, which has the size of a single frame.
+        """
+        super().__init__(
+            reference=reference,
+            correlator=correlator,
+            return_aligned=return_aligned,
+            accumulate=accumulate,
+        )
+
+    def _get_dtype(self):
+        return np.result_type(self.meta.input_dtype, np.float32)
+
+    def get_result_buffers(self) -> dict[str, Any]:
+        ""
+        dtype = self._get_dtype()
+        buffers = {
+            "shift": self.buffer(kind="nav", dtype=np.float32, extra_shape=(2,)),
+            "peak": self.buffer(kind="nav", dtype=np.float32),
+        }
+        if self.params.return_aligned:
+            buffers["aligned"] = self.buffer(
+                kind="nav", dtype=dtype, extra_shape=tuple(self.meta.dataset_shape.sig),
+            )
+        if self.params.accumulate:
+            buffers["aligned_sum"] = self.buffer(kind="sig", dtype=dtype)
+        return buffers
+
+    def _get_correlator(self) -> Correlator:
+        correlator = self.params.correlator
+        if correlator is None:
+            correlator = ImageCorrelator(
+                upsample_factor=10,
+                normalization='phase',
+                hanning=True,
+                binning=1,
+                xp=self.xp,
+            )
+        return correlator
+
+    def get_task_data(self) -> dict[str, Any]:
+        ""
+        correlator = self._get_correlator()
+        reference = self.xp.asarray(self.params.reference)
+        if np.iscomplexobj(reference):
+            reference = self.xp.abs(reference)
+        return {
+            "correlator": correlator,
+            "reference": correlator.prepare_reference(reference),
+        }
+
+    def process_frame(self, frame: np.ndarray) -> None:
+        ""
+        xp = self.xp
+        correlator = self.task_data.correlator
+        frame = xp.asarray(frame)
+        reg_frame = xp.abs(frame) if np.iscomplexobj(frame) else frame
+
+        reg_result = correlator.correlate(
+            self.task_data.reference,
+            correlator.prepare_input(reg_frame),
+        )
+        shift = xp.asarray(reg_result.shift, dtype=np.float64)
+
+        self.results.shift[:] = self.forbuf(shift, self.results.shift)
+        self.results.peak[:] = float(reg_result.corrmap.max())
+
+        if self.params.return_aligned or self.params.accumulate:
+            aligned = xp.fft.ifft2(apply_fourier_shift(xp.fft.fft2(frame), shift, xp=xp))
+            if not np.iscomplexobj(frame):
+                aligned = aligned.real
+            if self.params.return_aligned:
+                self.results.aligned[:] = self.forbuf(aligned, self.results.aligned)
+            if self.params.accumulate:
+                self.results.aligned_sum[:] += self.forbuf(aligned, self.results.aligned_sum)
+
+    def merge(self, dest, src) -> None:
+        ""
+        for name in dest:
+            if name == "aligned_sum":
+                dest.aligned_sum[:] += src.aligned_sum
+            else:
+                getattr(dest, name)[:] = getattr(src, name)
+
+    def get_backends(self) -> tuple[str, ...]:
+        ""
+        return ("numpy", "cupy")
+
+
+class AlignedAverageUDF(UDF):
+    """Reconstruct, align and average holograms in a single pass.
+
+    Each hologram is reconstructed, registered against a reference wave
+    directly on the spectrum of its wave (see
+    :class:`~libertem_holo.base.align.SpectrumCorrelator`), shifted in
+    Fourier space and corrected for its constant phase offset against the
+    reference. The aligned spectra are summed up, so only a single inverse
+    FFT is needed for the average, and the size of the result doesn't depend
+    on the number of frames.
+
+    This replaces reconstructing all waves with
+    :class:`~libertem_holo.udf.HoloReconstructUDF`, aligning them with
+    :func:`~libertem_holo.base.align.align_stack` and correcting their phase
+    with :func:`~libertem_holo.base.reconstr.phase_offset_correction` on the
+    main node, if only the average is needed. Different from the latter, the
+    phase offset of each frame is measured against the reference, and not
+    optimized jointly for all frames.
+
+    The results are:
+
+    * :code:`wave`: the aligned average of the reconstructed waves
+    * :code:`spectrum_sum`: the sum of the aligned spectra of the waves
+    * :code:`count`: the number of frames that were averaged
+    * :code:`shift`: the (y, x) shift that was applied to each frame
+    * :code:`phase_offset`: the phase offset that was removed from each frame
+
+    Examples
+    --------
+    >>> from libertem_holo.base.filters import disk_aperture
+    >>> from libertem_holo.udf import HoloReconstructUDF
+    >>> shape = tuple(dataset.shape.sig)
+    >>> aperture = disk_aperture(out_shape=shape, radius=4.4)
+    >>> waves = ctx.run_udf(dataset=dataset, udf=HoloReconstructUDF(
+    ...     out_shape=shape, sb_position=[2, 3], aperture=aperture,
+    ... ))['wave'].data
+    >>> udf = AlignedAverageUDF(
+    ...     out_shape=shape,
+    ...     sb_position=[2, 3],
+    ...     aperture=aperture,
+    ...     reference=waves[0, 0],
+    ... )
+    >>> res = ctx.run_udf(dataset=dataset, udf=udf)
+    >>> res['wave'].data.shape
+    (64, 64)
+    """
+
+    def __init__(
+        self,
+        *,
+        out_shape: tuple[int, int],
+        sb_position: tuple[float, float],
+        aperture: np.ndarray,
+        reference: np.ndarray,
+        precision: bool = True,
+        correlator: Correlator | None = None,
+        phase_align: bool = True,
+    ) -> None:
+        """Aligned average of reconstructed waves.
+
+        Parameters
+        ----------
+        out_shape, sb_position, aperture, precision
+            The reconstruction parameters, same as for
+            :class:`~libertem_holo.udf.HoloReconstructUDF`
+
+        reference
+            The complex reference wave to align against, with shape
+            `out_shape`. It is broadcast to the workers, which compute its
+            spectrum once per task.
+
+        correlator
+            A :class:`~libertem_holo.base.align.Correlator` instance that
+            works on the spectra of the waves, like the default
+            :class:`~libertem_holo.base.align.SpectrumCorrelator`. It should
+            use the same backend (numpy or cupy) as the UDF.
+
+        phase_align
+            Remove the constant phase offset of each wave against the
+            reference before summing.
+        """
+        super().__init__(
+            out_shape=out_shape,
+            sb_position=sb_position,
+            aperture=aperture,
+            reference=reference,
+            precision=precision,
+            correlator=correlator,
+            phase_align=phase_align,
+        )
+
+    def get_result_buffers(self) -> dict[str, Any]:
+        ""
+        out_shape = tuple(self.params.out_shape)
+        dtype = np.complex128 if self.params.precision else np.complex64
+        return {
+            "spectrum_sum": self.buffer(kind="single", dtype=dtype, extra_shape=out_shape),
+            "count": self.buffer(kind="single", dtype=np.int64),
+            "shift": self.buffer(kind="nav", dtype=np.float32, extra_shape=(2,)),
+            "phase_offset": self.buffer(kind="nav", dtype=np.float32),
+            "wave": self.buffer(
+                kind="single", dtype=dtype, extra_shape=out_shape, use="result_only",
+            ),
+        }
+
+    def get_task_data(self) -> dict[str, Any]:
+        ""
+        xp = self.xp
+        correlator = self.params.correlator
+        if correlator is None:
+            correlator = SpectrumCorrelator(upsample_factor=10, xp=xp)
+        ref_spectrum = xp.fft.fft2(xp.asarray(self.params.reference))
+        return {
+            "correlator": correlator,
+            "reference": correlator.prepare_reference(ref_spectrum),
+            "ref_spectrum": ref_spectrum,
+            "aperture": xp.asarray(self.params.aperture),
+            "slice": get_slice_fft(self.params.out_shape, self.meta.partition_shape.sig),
+        }
+
+    def process_frame(self, frame: np.ndarray) -> None:
+        ""
+        xp = self.xp
+        correlator = self.task_data.correlator
+        spectrum = reconstruct_spectrum(
+            frame,
+            sb_pos=self.params.sb_position,
+            aperture=self.task_data.aperture,
+            slice_fft=self.task_data.slice,
+            precision=self.params.precision,
+            xp=xp,
+        )
+        reg_result = correlator.correlate(
+            self.task_data.reference,
+            correlator.prepare_input(spectrum),
+        )
+        shift = xp.asarray(reg_result.shift, dtype=np.float64)
+        spectrum = apply_fourier_shift(spectrum, shift, xp=xp)
+
+        if self.params.phase_align:
+            # the inner product is the same in Fourier space (Parseval):
+            offset = xp.angle(xp.vdot(self.task_data.ref_spectrum, spectrum))
+            spectrum *= xp.exp(-1j * offset)
+            self.results.phase_offset[:] = float(offset)
+
+        self.results.shift[:] = self.forbuf(shift, self.results.shift)
+        self.results.spectrum_sum[:] += self.forbuf(spectrum, self.results.spectrum_sum)
+        self.results.count[:] += 1
+
+    def merge(self, dest, src) -> None:
+        ""
+        dest.spectrum_sum[:] += src.spectrum_sum
+        dest.count[:] += src.count
+        dest.shift[:] = src.shift
+        dest.phase_offset[:] = src.phase_offset
+
+    def get_results(self) -> dict[str, np.ndarray]:
+        ""
+        count = max(int(self.results.count[0]), 1)
+        wave = np.fft.ifft2(self.results.spectrum_sum) / count
+        return {
+            "wave": wave.astype(self.results.spectrum_sum.dtype, copy=False),
+        }
+
+    def get_backends(self) -> tuple[str, ...]:
+        ""
+        return ("numpy", "cupy")
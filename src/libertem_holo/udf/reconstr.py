@@ -7,10 +7,11 @@ from __future__ import annotations
 from typing import Any
 
 import numpy as np
+from libertem.common.buffers import AuxBufferWrapper
 from libertem.udf import UDF
 
-from libertem_holo.base.filters import disk_aperture
-from libertem_holo.base.reconstr import reconstruct_frame
+from libertem_holo.base.filters import disk_aperture, warmup_in_background
+from libertem_holo.base.reconstr import reconstruct_spectrum
 from libertem_holo.base.utils import get_slice_fft
 
 
@@ -38,6 +39,31 @@ class HoloReconstructUDF(UDF):
     ... )
     >>> wave = ctx.run_udf(dataset=dataset, udf=holo_udf)['wave'].data
 
+    Shifts for each frame, for example found using
+    :class:`~libertem_holo.udf.StackAlignUDF` on a first reconstruction, can
+    be applied while reconstructing:
+
+    >>> shifts = np.zeros(tuple(dataset.shape.nav) + (2,))
+    >>> aligned_udf = HoloReconstructUDF(
+    ...     out_shape=shape,
+    ...     sb_position=sb_position,
+    ...     aperture=aperture,
+    ...     shifts=shifts,
+    ... )
+    >>> aligned_wave = ctx.run_udf(dataset=dataset, udf=aligned_udf)['wave'].data
+
+    The spectra of the waves can be returned as well, to register the waves
+    without computing their FFTs again, using
+    :class:`~libertem_holo.base.align.SpectrumCorrelator`:
+
+    >>> spectrum_udf = HoloReconstructUDF(
+    ...     out_shape=shape,
+    ...     sb_position=sb_position,
+    ...     aperture=aperture,
+    ...     return_spectrum=True,
+    ... )
+    >>> spectra = ctx.run_udf(dataset=dataset, udf=spectrum_udf)['spectrum'].data
+
     """
 
     def __init__(
@@ -47,6 +73,10 @@ class HoloReconstructUDF(UDF):
         sb_position: tuple[float, float],
         aperture: np.ndarray,
         precision: bool = True,
+        jit_warmup: bool = False,
+        jit_cache_dir: str | None = None,
+        shifts: np.ndarray | AuxBufferWrapper | None = None,
+        return_spectrum: bool = False,
     ) -> None:
         """Off-axis electron holography reconstruction.
 
@@ -75,24 +105,67 @@ class HoloReconstructUDF(UDF):
             fft-shifted (i.e. assume that the side band is shifted to the
             corners of the image)
 
+        jit_warmup
+            Compile the numba kernels of :mod:`libertem_holo.base.filters`
+            in a background thread on each worker, when it receives its first
+            task. Useful if the same workers are used to build apertures or run
+            the correlators afterwards. See
+            :func:`~libertem_holo.base.filters.warmup`.
+
+        jit_cache_dir
+            If given together with `jit_warmup`, cache the compiled kernels
+            in this directory on the workers. See
+            :func:`~libertem_holo.base.filters.set_jit_cache_dir`.
+
+        shifts
+            Shift each reconstructed wave by the given (y, x) offset in pixels
+            of `out_shape`. Should have shape :code:`(*nav_shape, 2)`, like the
+            :code:`shift` result of :class:`~libertem_holo.udf.StackAlignUDF`.
+            The shifts are applied to the spectrum before the inverse FFT, see
+            :func:`~libertem_holo.base.reconstr.reconstruct_frame`.
+
+        return_spectrum
+            Also return the spectrum of each wave as the :code:`spectrum`
+            result, as computed by
+            :func:`~libertem_holo.base.reconstr.reconstruct_spectrum`. It has
+            the same shape and size as the wave, and can be used to register
+            the waves directly in Fourier space.
+
         """
+        if shifts is not None and not isinstance(shifts, AuxBufferWrapper):
+            shifts = self.aux_data(
+                data=np.asarray(shifts, dtype=np.float64).reshape((-1,)),
+                kind="nav",
+                extra_shape=(2,),
+                dtype=np.float64,
+            )
         super().__init__(
             out_shape=out_shape,
             sb_position=sb_position,
             precision=precision,
             aperture=aperture,
+            jit_warmup=jit_warmup,
+            jit_cache_dir=jit_cache_dir,
+            shifts=shifts,
+            return_spectrum=return_spectrum,
         )
 
     def get_result_buffers(self) -> dict[str, Any]:
         ""
         extra_shape = self.params.out_shape
         dtype = np.complex128 if self.params.precision else np.complex64
-        return {
+        buffers = {
             "wave": self.buffer(kind="nav", dtype=dtype, extra_shape=extra_shape),
         }
+        if self.params.return_spectrum:
+            buffers["spectrum"] = self.buffer(kind="nav", dtype=dtype, extra_shape=extra_shape)
+        return buffers
 
     def get_task_data(self) -> dict[str, Any]:
         ""
+        if self.params.jit_warmup:
+            warmup_in_background(xp=self.xp, cache_dir=self.params.jit_cache_dir)
+
         slice_fft = get_slice_fft(
             self.params.out_shape,
             self.meta.partition_shape.sig,
@@ -105,16 +178,20 @@ class HoloReconstructUDF(UDF):
 
     def process_frame(self, frame: np.ndarray) -> None:
         ""
-        wav = reconstruct_frame(
+        spectrum = reconstruct_spectrum(
             frame,
             sb_pos=self.params.sb_position,
             aperture=self.task_data.aperture,
             slice_fft=self.task_data.slice,
             precision=self.params.precision,
+            shift=self.params.shifts,
             xp=self.xp,
         )
+        wav = self.xp.fft.ifft2(spectrum)
 
         self.results.wave[:] = self.forbuf(wav, self.results.wave)
+        if self.params.return_spectrum:
+            self.results.spectrum[:] = self.forbuf(spectrum, self.results.spectrum)
 
     def get_backends(self) -> tuple[str, ...]:
         ""
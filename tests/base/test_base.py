@@ -155,3 +155,150 @@ def test_phase_offset(backend: str, holo_data, lt_ctx) -> None:
     averaged, stack = phase_offset_correction(
         xp.asarray(w_holo[:2]), return_stack=True, xp=xp,
     )
+
+
+@pytest.mark.with_numba
+@pytest.mark.parametrize(
+    "line_width", [3, None],
+)
+@pytest.mark.parametrize(
+    "slice_fft", [
+        None,
+        (slice(128, 384), slice(100, 411)),
+    ],
+)
+def test_butterworth_aperture_fused(line_width, slice_fft):
+    from libertem_holo.base.filters import butterworth_aperture
+    shape = (512, 511)
+    sb_position = (100.1, 100)
+
+    expected = butterworth_disk(shape=shape, radius=128.0, order=20)
+    if line_width is not None:
+        expected = expected * butterworth_line(
+            shape=shape,
+            width=line_width,
+            sb_position=sb_position,
+            length_ratio=0.9,
+            order=2,
+        )
+    if slice_fft is not None:
+        expected = expected[slice_fft]
+
+    fused = butterworth_aperture(
+        shape,
+        radius=128.0,
+        sb_position=sb_position,
+        line_width=line_width,
+        length_ratio=0.9,
+        disk_order=20,
+        line_order=2,
+        slice_fft=slice_fft,
+    )
+    assert fused.dtype == np.float32
+    assert np.allclose(fused, expected, atol=1e-6)
+
+    out = np.zeros_like(fused)
+    res = butterworth_aperture(
+        shape,
+        radius=128.0,
+        sb_position=sb_position,
+        line_width=line_width,
+        length_ratio=0.9,
+        disk_order=20,
+        line_order=2,
+        slice_fft=slice_fft,
+        out=out,
+    )
+    assert res is out
+    assert np.allclose(out, fused)
+
+
+def test_butterworth_aperture_out_mismatch():
+    from libertem_holo.base.filters import butterworth_aperture
+    with pytest.raises(ValueError):
+        butterworth_aperture(
+            (64, 64), radius=8.0, out=np.zeros((64, 64), dtype=np.float64),
+        )
+
+
+def test_butterworth_aperture_cpu_gpu_equiv():
+    d = detect()
+    if not d['cudas'] or not d['has_cupy']:
+        pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+
+    import cupy as cp
+    from libertem_holo.base.filters import butterworth_aperture
+
+    kwargs = dict(
+        radius=128.0,
+        sb_position=(100.1, 100),
+        line_width=3,
+        slice_fft=(slice(128, 384), slice(100, 411)),
+    )
+    aperture_cpu = butterworth_aperture((512, 511), xp=np, **kwargs)
+    aperture_gpu = butterworth_aperture((512, 511), xp=cp, **kwargs)
+
+    assert np.allclose(aperture_gpu.get(), aperture_cpu)
+
+
+def test_warmup_cache_dir(tmpdir):
+    import numba
+    from libertem_holo.base.filters import set_jit_cache_dir, warmup, _enable_caching
+
+    old_cache_dir = numba.config.CACHE_DIR
+    try:
+        set_jit_cache_dir(str(tmpdir))
+        warmup(xp=np)
+        if not numba.config.DISABLE_JIT:
+            assert len(tmpdir.listdir()) > 0
+    finally:
+        # also point the cache locators of the kernels back to the old
+        # directory, so later tests don't write to `tmpdir`:
+        numba.config.CACHE_DIR = old_cache_dir
+        _enable_caching()
+    if not numba.config.DISABLE_JIT:
+        from libertem_holo.base.filters import _butterworth_disk_cpu
+        assert not _butterworth_disk_cpu._cache.cache_path.startswith(str(tmpdir))
+
+
+def test_warmup_in_background():
+    from libertem_holo.base.filters import warmup_in_background
+
+    thread = warmup_in_background(xp=np)
+    # only started once per process:
+    assert warmup_in_background(xp=np) is thread
+    thread.join()
+
+
+def test_warmup_in_background_concurrent(tmpdir):
+    import os
+    import subprocess
+    import sys
+
+    # the workqueue threading layer aborts the process if the parallel
+    # kernels are run from two threads at once, so run in a separate
+    # interpreter, with an empty cache to make the warmup take a while:
+    script = """
+import numpy as np
+from libertem_holo.base.filters import butterworth_aperture, warmup_in_background
+
+thread = warmup_in_background(xp=np)
+while thread.is_alive():
+    butterworth_aperture(
+        (64, 64), radius=8.0, sb_position=(10, 20), line_width=2.0,
+        slice_fft=(slice(16, 48), slice(16, 48)),
+    )
+thread.join()
+print("done")
+"""
+    env = dict(
+        os.environ,
+        NUMBA_THREADING_LAYER="workqueue",
+        NUMBA_CACHE_DIR=str(tmpdir),
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True, text=True, timeout=300, env=env,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "done"
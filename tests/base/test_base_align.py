@@ -130,3 +130,807 @@ def test_align_stack(backend):
         xp=xp,
     )
     assert np.allclose(-shifts_found, shifts)
+
+
+@pytest.mark.parametrize(
+    "upsample_factor", (1, 10),
+)
+def test_cross_correlate_batch(xp, upsample_factor):
+    from libertem_holo.base.align import cross_correlate_batch
+
+    shifts = [(-3.7, 4.2), (0.3, -0.6), (5.1, 2.0)]
+    input_data, _ = _test_data_shifted(shape=(64, 61), shift=(0, 0))
+    shifted = np.stack([
+        _test_data_shifted(shape=(64, 61), shift=shift)[1]
+        for shift in shifts
+    ])
+    src_freq = xp.fft.fftn(xp.asarray(input_data))
+    target_freqs = xp.fft.fftn(xp.asarray(shifted), axes=(-2, -1))
+
+    found, corrmaps = cross_correlate_batch(
+        src_freq, target_freqs, upsample_factor=upsample_factor, xp=xp,
+    )
+    found = for_backend(found, NUMPY)
+    assert found.shape == (len(shifts), 2)
+    assert corrmaps.shape == shifted.shape
+    for i, target_freq in enumerate(target_freqs):
+        pos, corrmap = cross_correlate(
+            None, None, upsample_factor=upsample_factor, xp=xp,
+            src_freq=src_freq, target_freq=target_freq,
+        )
+        pos = for_backend(pos, NUMPY)
+        assert np.allclose(pos - np.array([32, 30]), found[i])
+        assert np.allclose(for_backend(corrmap, NUMPY), for_backend(corrmaps[i], NUMPY))
+    assert np.allclose(-found, shifts, atol=1 / upsample_factor + 1e-5)
+
+
+@pytest.mark.parametrize(
+    "upsample_factor,search_radius", [(1, None), (10, None), (10, 6)],
+)
+def test_cross_correlate_batch_broadcast(upsample_factor, search_radius):
+    from libertem_holo.base.align import cross_correlate_batch
+
+    rng = np.random.default_rng(7)
+    # two frames of three "tiles" each, against one static image per tile:
+    src_freqs = np.fft.fftn(rng.random((3, 32, 32)), axes=(-2, -1))
+    target_freqs = np.fft.fftn(rng.random((2, 3, 32, 32)), axes=(-2, -1))
+    prior = None if search_radius is None else (1, -2)
+
+    shifts, corrmaps = cross_correlate_batch(
+        src_freqs[None], target_freqs,
+        upsample_factor=upsample_factor, prior=prior, search_radius=search_radius,
+    )
+    flat_shifts, flat_corrmaps = cross_correlate_batch(
+        np.broadcast_to(src_freqs[None], target_freqs.shape).reshape((-1, 32, 32)),
+        target_freqs.reshape((-1, 32, 32)),
+        upsample_factor=upsample_factor, prior=prior, search_radius=search_radius,
+    )
+    assert shifts.shape == (2, 3, 2)
+    assert corrmaps.shape[:2] == (2, 3)
+    assert np.allclose(shifts.reshape((-1, 2)), flat_shifts)
+    assert np.allclose(corrmaps.reshape(flat_corrmaps.shape), flat_corrmaps)
+
+
+@pytest.mark.parametrize(
+    "upsample_factor", (1, 10),
+)
+def test_cross_correlate_precomputed_spectrum(upsample_factor):
+    input_data, input_shifted = _test_data_shifted(shape=(64, 61), shift=(-3.7, 4.2))
+    pos, corrmap = cross_correlate(
+        input_shifted,
+        input_data,
+        upsample_factor=upsample_factor,
+    )
+    pos_freq, corrmap_freq = cross_correlate(
+        None,
+        None,
+        upsample_factor=upsample_factor,
+        src_freq=np.fft.fftn(input_shifted),
+        target_freq=np.fft.fftn(input_data),
+    )
+    assert np.allclose(pos, pos_freq)
+    assert np.allclose(corrmap, corrmap_freq)
+
+
+def test_align_stack_reference_spectrum_cached(count_fft):
+    from libertem_holo.base.align import ImageCorrelator, CachedSpectrum
+
+    stack = np.zeros((5, 64, 64), dtype=np.float32)
+    for i in range(stack.shape[0]):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=(i, -i))
+
+    correlator = ImageCorrelator(upsample_factor=10)
+    prepared = correlator.prepare_reference(stack[0])
+    assert isinstance(prepared, CachedSpectrum)
+    assert np.allclose(prepared.image, correlator.prepare_input(stack[0]))
+
+    # count all forward FFTs:
+    count_fft.clear()
+    aligned, shifts_found, reference, corrs = align_stack(
+        stack=stack,
+        wave_stack=stack,
+        static=None,
+        correlator=correlator,
+    )
+    # one for the reference, and for each frame one for the correlation
+    # and one for the shift:
+    assert len(count_fft) == 1 + 2 * stack.shape[0]
+    assert reference.shape == stack.shape[1:]
+    assert np.allclose(shifts_found, -np.array([(i, -i) for i in range(5)]), atol=0.1)
+
+
+@pytest.mark.parametrize(
+    "batch_size,num_workers", [
+        (3, 1),
+        (1, 3),
+        (4, 2),
+        (20, 1),
+    ],
+)
+@pytest.mark.parametrize(
+    "correlator_cls", ["batched", "unbatched"],
+)
+def test_align_stack_batched(batch_size, num_workers, correlator_cls):
+    from libertem_holo.base.align import ImageCorrelator, Correlator
+
+    stack = np.zeros((10, 64, 64), dtype=np.float32)
+    for i in range(stack.shape[0]):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=(i / 2, -i / 3))
+    wave_stack = stack * np.exp(1j * stack)
+
+    class UnbatchedCorrelator(ImageCorrelator):
+        # use the default, per-frame implementation:
+        prepare_batch = Correlator.prepare_batch
+
+    def _make_correlator():
+        if correlator_cls == "batched":
+            return ImageCorrelator(upsample_factor=10)
+        else:
+            return UnbatchedCorrelator(upsample_factor=10)
+
+    expected = align_stack(
+        stack=stack,
+        wave_stack=wave_stack,
+        static=None,
+        correlator=_make_correlator(),
+    )
+    result = align_stack(
+        stack=stack,
+        wave_stack=wave_stack,
+        static=None,
+        correlator=_make_correlator(),
+        batch_size=batch_size,
+        num_workers=num_workers,
+    )
+    for res, exp in zip(result, expected):
+        assert np.array_equal(res, exp)
+
+
+@pytest.mark.parametrize(
+    "target", ["memmap", "inplace"],
+)
+def test_align_stack_out(tmp_path, target):
+    stack = np.zeros((6, 64, 64), dtype=np.float32)
+    for i in range(stack.shape[0]):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=(i / 2, -i / 3))
+    wave_stack = (stack * np.exp(1j * stack)).astype(np.complex64)
+
+    expected, expected_shifts, _, expected_corrs = align_stack(
+        stack=stack,
+        wave_stack=wave_stack,
+        static=None,
+    )
+
+    if target == "memmap":
+        out = np.lib.format.open_memmap(
+            tmp_path / "aligned.npy", mode="w+", dtype=wave_stack.dtype, shape=wave_stack.shape,
+        )
+    else:
+        out = wave_stack
+    aligned, shifts_found, _, peaks = align_stack(
+        stack=stack,
+        wave_stack=wave_stack,
+        static=None,
+        store_corrs=False,
+        out=out,
+        batch_size=2,
+    )
+    assert aligned is out
+    assert np.array_equal(aligned, expected)
+    assert np.array_equal(shifts_found, expected_shifts)
+    assert peaks.shape == (stack.shape[0],)
+    assert np.allclose(peaks, expected_corrs.max(axis=(1, 2)))
+
+
+def test_align_stack_out_shape_mismatch():
+    stack = np.zeros((3, 16, 16), dtype=np.float32)
+    with pytest.raises(ValueError):
+        align_stack(
+            stack=stack,
+            wave_stack=stack,
+            static=None,
+            out=np.zeros((3, 16, 15), dtype=np.float32),
+        )
+
+
+@pytest.mark.parametrize(
+    "source", ["memmap", "generator", "same_generator"],
+)
+@pytest.mark.parametrize(
+    "prefetch", [0, 3],
+)
+def test_align_stack_lazy_input(tmp_path, source, prefetch):
+    stack = np.zeros((7, 64, 64), dtype=np.float32)
+    for i in range(stack.shape[0]):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=(i / 2, -i / 3))
+
+    expected = align_stack(stack=stack, wave_stack=stack, static=None)
+
+    if source == "memmap":
+        np.save(tmp_path / "stack.npy", stack)
+        lazy_stack = np.load(tmp_path / "stack.npy", mmap_mode="r")
+        lazy_wave_stack = lazy_stack
+    elif source == "generator":
+        lazy_stack = (frame for frame in stack)
+        lazy_wave_stack = (frame for frame in stack)
+    else:
+        lazy_stack = (frame for frame in stack)
+        lazy_wave_stack = lazy_stack
+
+    result = align_stack(
+        stack=lazy_stack,
+        wave_stack=lazy_wave_stack,
+        static=None,
+        batch_size=2,
+        num_workers=2,
+        prefetch=prefetch,
+    )
+    for res, exp in zip(result, expected):
+        assert np.array_equal(res, exp)
+
+
+def test_prefetch_reads_memmap(tmp_path):
+    from libertem_holo.base.align import _iter_batches, _prefetch
+
+    stack = np.random.default_rng(0).random((7, 16, 16))
+    np.save(tmp_path / "stack.npy", stack)
+    lazy_stack = np.load(tmp_path / "stack.npy", mmap_mode="r")
+
+    batches = list(_prefetch(_iter_batches(lazy_stack, lazy_stack, batch_size=3), depth=2))
+    assert [start for start, _, _ in batches] == [0, 3, 6]
+    for start, stack_batch, wave_batch in batches:
+        # the data was actually read in the background thread:
+        assert not isinstance(stack_batch, np.memmap)
+        assert stack_batch.base is None
+        assert wave_batch is stack_batch
+        assert np.array_equal(stack_batch, stack[start:start + 3])
+
+
+def test_align_stack_prefetch_error():
+    def _frames():
+        yield np.zeros((16, 16), dtype=np.float32)
+        raise RuntimeError("read error")
+
+    frames = _frames()
+    with pytest.raises(RuntimeError, match="read error"):
+        align_stack(stack=frames, wave_stack=frames, static=None, prefetch=2)
+
+
+@pytest.mark.parametrize(
+    "downsample,upsample_factor", [(1, 1), (4, 1), (4, 10), (5, 10)],
+)
+def test_pyramid_correlator(xp, downsample, upsample_factor):
+    from libertem_holo.base.align import PyramidCorrelator
+
+    shifts = np.array([(-23.7, 14.2), (0.3, -0.6), (31.1, -20.0)])
+    stack = np.zeros((len(shifts), 128, 122), dtype=np.float32)
+    for i, shift in enumerate(shifts):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=tuple(shift))
+    reference, _ = _test_data_shifted(shape=stack.shape[1:], shift=(0, 0))
+
+    correlator = PyramidCorrelator(
+        downsample=downsample, upsample_factor=upsample_factor, xp=xp,
+    )
+    _, shifts_found, _, corrs = align_stack(
+        stack=xp.asarray(stack),
+        wave_stack=xp.asarray(stack),
+        static=xp.asarray(reference),
+        correlator=correlator,
+        xp=xp,
+    )
+    shifts_found = for_backend(shifts_found, NUMPY)
+    assert corrs.shape == (len(shifts), 128 // downsample, 122 // downsample)
+    assert np.allclose(-shifts_found, shifts, atol=1 / upsample_factor + 1e-5)
+
+    single = correlator.correlate(
+        correlator.prepare_reference(xp.asarray(reference)),
+        correlator.prepare_input(xp.asarray(stack[0])),
+    )
+    assert np.allclose(single.shift, shifts_found[0])
+
+
+@pytest.mark.parametrize(
+    "batch_size", [1, 4],
+)
+@pytest.mark.parametrize(
+    "correlator_cls", ["image", "image_binned", "pyramid"],
+)
+def test_align_stack_search_radius(batch_size, correlator_cls):
+    from libertem_holo.base.align import ImageCorrelator, PyramidCorrelator
+
+    # slow drift, with a large offset:
+    drift = np.array([(20 + 0.4 * i, -15 + 0.7 * i) for i in range(12)])
+    stack = np.zeros((len(drift), 128, 128), dtype=np.float32)
+    for i, shift in enumerate(drift):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=tuple(shift))
+    reference, _ = _test_data_shifted(shape=stack.shape[1:], shift=(0, 0))
+
+    def _make_correlator():
+        if correlator_cls == "image":
+            return ImageCorrelator(upsample_factor=10)
+        elif correlator_cls == "image_binned":
+            return ImageCorrelator(upsample_factor=10, binning=2)
+        else:
+            return PyramidCorrelator(upsample_factor=10)
+
+    _, expected_shifts, _, _ = align_stack(
+        stack=stack,
+        wave_stack=stack,
+        static=reference,
+        correlator=_make_correlator(),
+    )
+    aligned, shifts_found, _, peaks = align_stack(
+        stack=stack,
+        wave_stack=stack,
+        static=reference,
+        correlator=_make_correlator(),
+        batch_size=batch_size,
+        search_radius=4,
+    )
+    assert peaks.shape == (len(drift),)
+    assert np.allclose(shifts_found, expected_shifts)
+
+
+def test_align_stack_search_radius_invalid():
+    stack = np.zeros((3, 16, 16), dtype=np.float32)
+    with pytest.raises(ValueError):
+        align_stack(stack=stack, wave_stack=stack, static=None, search_radius=2, num_workers=2)
+    with pytest.raises(ValueError):
+        align_stack(stack=stack, wave_stack=stack, static=None, search_radius=2, store_corrs=True)
+
+
+def test_cross_correlate_batch_window():
+    from libertem_holo.base.align import cross_correlate_batch
+
+    input_data, _ = _test_data_shifted(shape=(64, 61), shift=(0, 0))
+    _, shifted = _test_data_shifted(shape=(64, 61), shift=(-13.3, 7.6))
+    src_freq = np.fft.fftn(input_data)
+    target_freqs = np.fft.fftn(shifted)[None]
+
+    expected, _ = cross_correlate_batch(src_freq, target_freqs, upsample_factor=10)
+    found, window = cross_correlate_batch(
+        src_freq, target_freqs, upsample_factor=10, prior=(12.2, -9.1), search_radius=3,
+    )
+    assert window.shape == (1, 7, 7)
+    assert np.allclose(found, expected)
+    # the window is centered on the rounded prior (12, -9); the peak is at (13, -8):
+    assert np.unravel_index(np.argmax(window[0]), window.shape[1:]) == (4, 4)
+
+
+def test_brightfield_correlator_plan(holo_data, monkeypatch):
+    from scipy.ndimage import gaussian_filter
+    from libertem_holo.base import align
+    from libertem_holo.base.filters import central_line_filter, disk_aperture
+    from libertem_holo.base.reconstr import reconstruct_bf
+    from libertem_holo.base.utils import HoloParams, get_slice_fft
+
+    holo, ref, phase_ref, slice_crop = holo_data
+    params = HoloParams.from_hologram(
+        ref[0, 0],
+        central_band_mask_radius=1,
+        out_shape=(64, 64),
+        line_filter_length=0.9,
+        line_filter_width=2,
+    )
+
+    # reference implementation, building the filters for each frame:
+    def _expected(img):
+        line_filter = central_line_filter(
+            sb_position=params.sb_position_int,
+            out_shape=params.out_shape,
+            orig_shape=img.shape,
+            length_ratio=0.95,
+            width=20
+        )
+        aperture = disk_aperture(out_shape=params.out_shape, radius=params.sb_size//3)
+        slice_fft = get_slice_fft(out_shape=params.out_shape, sig_shape=img.shape)
+        aperture[np.fft.fftshift(line_filter[slice_fft])] = 0
+        aperture = np.fft.fftshift(gaussian_filter(np.fft.fftshift(aperture), sigma=6))
+        holo_bf = np.abs(reconstruct_bf(frame=img, aperture=aperture, slice_fft=slice_fft))
+        return np.gradient(holo_bf)[0]
+
+    num_calls = []
+
+    def _counting_disk_aperture(*args, **kwargs):
+        num_calls.append(1)
+        return disk_aperture(*args, **kwargs)
+
+    monkeypatch.setattr(align, "disk_aperture", _counting_disk_aperture)
+
+    correlator = align.BrightFieldCorrelator(params)
+    for img in holo[0, :3]:
+        assert np.allclose(correlator.prepare_input(img), _expected(img))
+    assert len(num_calls) == 1
+
+
+def test_image_correlator_hanning_plan():
+    from libertem_holo.base.align import ImageCorrelator
+
+    correlator = ImageCorrelator()
+    img = np.random.default_rng(42).random((32, 24))
+    expected = img * np.outer(np.hanning(32), np.hanning(24))
+    assert np.array_equal(correlator.prepare_input(img), expected)
+    assert np.array_equal(correlator.prepare_input(img[:16]), img[:16] * np.outer(
+        np.hanning(16), np.hanning(24),
+    ))
+    assert len(correlator._plans) == 2
+
+
+@pytest.mark.parametrize(
+    "upsample_factor", [1, 10],
+)
+def test_grad_xy_correlator_packed(upsample_factor, count_fft):
+    from libertem_holo.base.align import GradXYCorrelator, get_grad_xy
+
+    shift = (-3.4, 5.7)
+    input_data, input_shifted = _test_data_shifted(shape=(64, 64), shift=shift)
+
+    def _pack(img):
+        grad_x, grad_y = get_grad_xy(img, scale=3)
+        return grad_x + 1j * grad_y
+
+    # the phase image is used as-is:
+    correlator = GradXYCorrelator(source="phase", upsample_factor=upsample_factor)
+    ref = correlator.prepare_reference(input_data)
+    moving = correlator.prepare_input(input_shifted)
+    assert np.allclose(moving, _pack(input_shifted)[4:-5, 4:-5])
+
+    count_fft.clear()
+    result = correlator.correlate(ref, moving)
+    # only the moving image needs a forward transform:
+    assert len(count_fft) == 1
+    assert result.shift == pytest.approx((-shift[0], -shift[1]), abs=1 / upsample_factor + 1e-5)
+
+
+@pytest.mark.parametrize(
+    "normalization", ["phase", None],
+)
+def test_grad_xy_correlator_sum_of_components(normalization):
+    from libertem_holo.base.align import GradXYCorrelator
+
+    rng = np.random.default_rng(3)
+    input_data, input_shifted = _test_data_shifted(shape=(64, 64), shift=(-3.4, 5.7))
+    input_data = input_data + 0.1 * rng.random(input_data.shape)
+    input_shifted = input_shifted + 0.1 * rng.random(input_shifted.shape)
+
+    def _corr(src, target):
+        product = np.fft.fftn(src) * np.fft.fftn(target).conj()
+        if normalization == "phase":
+            product /= np.maximum(np.abs(product), 100 * np.finfo(product.real.dtype).eps)
+        return np.fft.fftshift(np.fft.ifftn(product).real)
+
+    correlator = GradXYCorrelator(source="phase", normalization=normalization)
+    ref = correlator.prepare_input(input_data)
+    moving = correlator.prepare_input(input_shifted)
+    expected = _corr(ref.real, moving.real) + _corr(ref.imag, moving.imag)
+
+    result = correlator.correlate(correlator.prepare_reference(input_data), moving)
+    assert np.allclose(result.corrmap, expected)
+    expected_pos = np.unravel_index(np.argmax(expected), expected.shape)
+    assert tuple(result.maximum) == pytest.approx(expected_pos)
+    (batch_result,) = correlator.correlate_batch(
+        correlator.prepare_reference(input_data), [moving],
+    )
+    assert np.allclose(batch_result.corrmap, expected)
+    assert batch_result.shift == pytest.approx(result.shift)
+
+
+def test_phase_gradient_wrap_free():
+    from libertem_holo.base.align import gradient, phase_gradient
+
+    yy, xx = np.mgrid[0:48, 0:40]
+    # strong ramp, which wraps many times, plus some structure:
+    phase = 0.9 * yy - 0.7 * xx + np.sin(xx / 5) * np.cos(yy / 7)
+    wave = 2 * np.exp(1j * phase)
+    assert np.allclose(phase_gradient(wave, scale=3), gradient(phase, scale=3))
+
+
+@pytest.mark.parametrize(
+    "correlator_cls", ["phase", "grad_angle", "grad_xy"],
+)
+@pytest.mark.parametrize(
+    "source", ["wave", "phase"],
+)
+def test_correlator_source(correlator_cls, source):
+    from libertem_holo.base.align import (
+        PhaseImageCorrelator, GradAngleCorrelator, GradXYCorrelator,
+    )
+    from libertem_holo.base.utils import apply_fourier_shift
+
+    rng = np.random.default_rng(42)
+    yy, xx = np.mgrid[0:64, 0:64]
+    phase = 0.3 * yy + 5 * np.exp(-((yy - 30)**2 + (xx - 34)**2) / 60)
+    phase += 0.05 * rng.random(phase.shape)
+    shifts = np.array([(2.0, -3.0), (-4.0, 1.0)])
+    phases = np.fft.ifft2(
+        apply_fourier_shift(np.repeat(np.fft.fft2(phase)[None], 2, axis=0), shifts)
+    ).real
+    if source == "wave":
+        stack = np.exp(1j * phases)
+        static = np.exp(1j * phase)
+    else:
+        stack = phases
+        static = phase
+
+    cls = {
+        "phase": PhaseImageCorrelator,
+        "grad_angle": GradAngleCorrelator,
+        "grad_xy": GradXYCorrelator,
+    }[correlator_cls]
+    correlator = cls(source=source, upsample_factor=10)
+    _, shifts_found, _, _ = align_stack(
+        stack=stack,
+        wave_stack=stack,
+        static=static,
+        correlator=correlator,
+    )
+    assert np.allclose(-shifts_found, shifts, atol=0.2)
+
+
+def test_correlator_source_needs_holoparams():
+    from libertem_holo.base.align import PhaseImageCorrelator
+
+    with pytest.raises(ValueError):
+        PhaseImageCorrelator()
+    with pytest.raises(ValueError):
+        PhaseImageCorrelator(source="foo")
+
+
+@pytest.mark.parametrize(
+    "upsample_factor,refine_radius", [(1, None), (10, None), (10, 3)],
+)
+def test_projection_correlator(xp, upsample_factor, refine_radius):
+    from libertem_holo.base.align import ProjectionCorrelator, ImageCorrelator
+
+    shifts = np.array([(-13.7, 4.2), (0.3, -0.6), (8.1, -11.0)])
+    stack = np.zeros((len(shifts), 96, 80), dtype=np.float32)
+    for i, shift in enumerate(shifts):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=tuple(shift))
+    reference, _ = _test_data_shifted(shape=stack.shape[1:], shift=(0, 0))
+
+    correlator = ProjectionCorrelator(
+        upsample_factor=upsample_factor, refine_radius=refine_radius, xp=xp,
+    )
+    _, shifts_found, _, corrs = align_stack(
+        stack=xp.asarray(stack),
+        wave_stack=xp.asarray(stack),
+        static=xp.asarray(reference),
+        correlator=correlator,
+        xp=xp,
+    )
+    shifts_found = for_backend(shifts_found, NUMPY)
+    assert np.allclose(-shifts_found, shifts, atol=1 / upsample_factor + 0.1)
+    if refine_radius is None:
+        assert corrs.shape == (len(shifts), 96 + 80)
+    else:
+        assert corrs.shape == (len(shifts), 7, 7)
+        # the refinement is the same as a full 2D correlation:
+        _, expected, _, _ = align_stack(
+            stack=xp.asarray(stack),
+            wave_stack=xp.asarray(stack),
+            static=xp.asarray(reference),
+            correlator=ImageCorrelator(upsample_factor=upsample_factor, xp=xp),
+            xp=xp,
+        )
+        assert np.allclose(shifts_found, for_backend(expected, NUMPY))
+
+    single = correlator.correlate(
+        correlator.prepare_reference(xp.asarray(reference)),
+        correlator.prepare_input(xp.asarray(stack[0])),
+    )
+    assert np.allclose(single.shift, shifts_found[0])
+
+
+@pytest.mark.parametrize(
+    "refine_radius", [None, 3],
+)
+def test_projection_correlator_integer_input(refine_radius):
+    from libertem_holo.base.align import ProjectionCorrelator
+
+    shifts = [(-13.7, 4.2), (8.1, -11.0)]
+    stack = np.stack([
+        _test_data_shifted(shape=(96, 80), shift=shift)[1] for shift in shifts
+    ])
+    reference, _ = _test_data_shifted(shape=(96, 80), shift=(0, 0))
+    # like raw detector frames:
+    stack = np.round(1000 * stack).astype(np.uint16)
+    reference = np.round(1000 * reference).astype(np.uint16)
+
+    correlator = ProjectionCorrelator(upsample_factor=10, refine_radius=refine_radius)
+    results = correlator.correlate_batch(
+        correlator.prepare_reference(reference),
+        correlator.prepare_batch(stack),
+    )
+    expected = correlator.correlate_batch(
+        correlator.prepare_reference(reference.astype(np.float64)),
+        correlator.prepare_batch(stack.astype(np.float64)),
+    )
+    for result, exp in zip(results, expected):
+        assert result.shift == pytest.approx(exp.shift)
+
+
+@pytest.mark.parametrize(
+    "method, tolerance", [
+        ("linear", 0.1),
+        ("cubic", 0.02),
+        ("lanczos", 0.015),
+    ],
+)
+@pytest.mark.parametrize(
+    "dtype", [np.float32, np.complex128],
+)
+def test_shift_stack_method(xp, method, tolerance, dtype):
+    from scipy.ndimage import gaussian_filter
+    from libertem_holo.base.align import shift_stack
+
+    rng = np.random.default_rng(0)
+    image = gaussian_filter(rng.random((64, 48)), 1.5, mode='wrap')
+    image -= image.mean()
+    stack = np.stack([image, 2 * image, -image, image]).astype(dtype)
+    if np.iscomplexobj(stack):
+        stack *= np.exp(1j * np.arange(4))[:, None, None]
+    shifts = np.array([(0.3, -0.4), (2.5, -3.2), (-70.1, 0.45), (0, 0)])
+
+    expected = shift_stack(stack, shifts)
+    shifted = shift_stack(xp.asarray(stack), xp.asarray(shifts), xp=xp, method=method)
+    assert shifted.dtype == stack.dtype
+    shifted = for_backend(shifted, NUMPY)
+    error = np.abs(shifted - expected).max(axis=(1, 2))
+    assert np.all(error <= tolerance * np.abs(stack).max(axis=(1, 2)))
+    # integer shifts are exact:
+    assert np.allclose(shifted[3], stack[3])
+
+
+def test_shift_stack_method_invalid():
+    from libertem_holo.base.align import shift_stack
+
+    with pytest.raises(ValueError):
+        shift_stack(np.zeros((1, 8, 8)), np.zeros((1, 2)), method="nearest")
+
+
+@pytest.mark.parametrize(
+    "dtype", [np.float32, np.complex64],
+)
+def test_shift_stack_warmup(dtype):
+    import numba
+    from libertem_holo.base import align
+    from libertem_holo.base.filters import warmup
+
+    if numba.config.DISABLE_JIT:
+        pytest.skip("needs numba JIT")
+    warmup(xp=np)
+    kernels = (align._shift_rows_cpu, align._shift_cols_cpu)
+    signatures = [list(kernel.signatures) for kernel in kernels]
+    stack = np.zeros((2, 16, 16), dtype=dtype)
+    align.shift_stack(stack, np.full((2, 2), 0.25), method="cubic")
+    # no new signatures were compiled:
+    assert [list(kernel.signatures) for kernel in kernels] == signatures
+
+
+@pytest.mark.parametrize(
+    "method", ["linear", "cubic", "lanczos"],
+)
+def test_shift_stack_worker_threads(method):
+    from concurrent.futures import ThreadPoolExecutor
+    from libertem_holo.base.align import shift_stack
+
+    rng = np.random.default_rng(0)
+    stack = rng.random((4, 32, 24))
+    shifts = rng.uniform(-3, 3, size=(4, 2))
+    expected = shift_stack(stack, shifts, method=method)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(
+            lambda _: shift_stack(stack, shifts, method=method), range(3),
+        ))
+    for result in results:
+        assert np.allclose(result, expected)
+
+
+def test_align_stack_shift_method_workers_exit():
+    import subprocess
+    import sys
+
+    # the numba thread pool doesn't support concurrent use, which can hang
+    # on interpreter exit or abort, so run in a separate interpreter:
+    script = """
+import numpy as np
+from libertem_holo.base.align import align_stack
+
+stack = np.random.default_rng(0).random((16, 64, 64)).astype(np.float32)
+align_stack(
+    stack=stack, wave_stack=stack, static=None,
+    batch_size=2, num_workers=4, shift_method="cubic",
+)
+print("done")
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True, text=True, timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "done"
+
+
+@pytest.mark.parametrize(
+    "batch_size, num_workers", [
+        (1, 1),
+        (4, 2),
+    ],
+)
+def test_align_stack_shift_method(batch_size, num_workers):
+    stack = np.zeros((6, 64, 64), dtype=np.float32)
+    for i in range(stack.shape[0]):
+        _, stack[i] = _test_data_shifted(shape=stack.shape[1:], shift=(i / 2, -i / 3))
+
+    expected, expected_shifts, _, _ = align_stack(
+        stack=stack,
+        wave_stack=stack,
+        static=None,
+    )
+    aligned, shifts_found, _, _ = align_stack(
+        stack=stack,
+        wave_stack=stack,
+        static=None,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        shift_method="cubic",
+    )
+    assert np.array_equal(shifts_found, expected_shifts)
+    assert aligned.dtype == expected.dtype
+    assert np.abs(aligned - expected).max() < 0.1 * np.abs(expected).max()
+
+
+def test_spectrum_correlator(xp):
+    from scipy.ndimage import gaussian_filter
+    from libertem_holo.base.align import SpectrumCorrelator
+    from libertem_holo.base.filters import disk_aperture
+    from libertem_holo.base.generate import hologram_frame
+    from libertem_holo.base.reconstr import reconstruct_frame, reconstruct_spectrum
+    from libertem_holo.base.utils import (
+        estimate_sideband_position, estimate_sideband_size, get_slice_fft,
+    )
+
+    rng = np.random.default_rng(1)
+    shape = (256, 256)
+    texture = gaussian_filter(rng.random(shape), 4, mode='wrap')
+    texture = (texture - texture.min()) / np.ptp(texture)
+    amp = 0.6 + 0.4 * texture
+    phase = 4 * np.pi * texture
+    # object shifts, in pixels of the holograms:
+    shifts = np.array([(0, 0), (4, -6), (-8, 2), (10, 12)])
+    holos = [
+        # the phase offset between the frames shouldn't matter:
+        hologram_frame(np.roll(amp, s, axis=(0, 1)), np.roll(phase, s, axis=(0, 1)) + i)
+        for i, s in enumerate(shifts)
+    ]
+    sb_position = estimate_sideband_position(holos[0], (1, 1))
+    out_shape = (128, 128)
+    aperture = xp.asarray(disk_aperture(
+        out_shape=out_shape,
+        radius=estimate_sideband_size(sb_position, shape) / 2,
+    ))
+    slice_fft = get_slice_fft(out_shape, shape)
+    spectra = xp.stack([
+        reconstruct_spectrum(holo, sb_position, aperture, slice_fft, xp=xp)
+        for holo in holos
+    ])
+    waves = xp.stack([
+        reconstruct_frame(holo, sb_position, aperture, slice_fft, xp=xp)
+        for holo in holos
+    ])
+    assert np.allclose(
+        for_backend(xp.fft.ifft2(spectra), NUMPY),
+        for_backend(waves, NUMPY),
+    )
+
+    _, shifts_found, _, _ = align_stack(
+        stack=spectra,
+        wave_stack=waves,
+        static=None,
+        correlator=SpectrumCorrelator(upsample_factor=10, xp=xp),
+        batch_size=2,
+        xp=xp,
+    )
+    # the waves have half the size of the holograms:
+    expected = -shifts * out_shape[0] / shape[0]
+    assert np.allclose(for_backend(shifts_found, NUMPY), expected, atol=0.2)
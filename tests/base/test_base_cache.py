@@ -0,0 +1,166 @@
+import os
+
+import numpy as np
+import pytest
+
+from libertem_holo.base.cache import DiskCache
+from libertem_holo.base.utils import HoloParams
+
+
+def test_cache_key():
+    data = np.arange(16, dtype=np.float32).reshape((4, 4))
+    key = DiskCache.key("wave", data, sigma=2, shape=(4, 4))
+    assert key == DiskCache.key("wave", data.copy(), shape=(4, 4), sigma=2)
+    assert key != DiskCache.key("wave", data + 1, sigma=2, shape=(4, 4))
+    assert key != DiskCache.key("wave", data.astype(np.float64), sigma=2, shape=(4, 4))
+    assert key != DiskCache.key("wave", data, sigma=3, shape=(4, 4))
+    assert key != DiskCache.key("phase", data, sigma=2, shape=(4, 4))
+
+
+def test_cache_key_path(tmp_path):
+    path = tmp_path / "data.npy"
+    np.save(path, np.zeros((4, 4)))
+    key = DiskCache.key(path)
+    assert key == DiskCache.key(path)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert key != DiskCache.key(path)
+
+
+def test_cache_arrays(tmp_path):
+    cache = DiskCache(tmp_path / "cache")
+    phase = np.random.default_rng(0).random((32, 32))
+    key = cache.key("phase", phase)
+    assert cache.get_arrays(key) is None
+    assert key not in cache
+
+    cache.put_arrays(key, {"phase": phase, "amplitude": 2 * phase}, meta={"sigma": 2})
+    assert key in cache
+    arrays = cache.get_arrays(key)
+    assert isinstance(arrays["phase"], np.memmap)
+    assert np.array_equal(arrays["phase"], phase)
+    assert np.array_equal(arrays["amplitude"], 2 * phase)
+    assert cache.get_meta(key) == {"sigma": 2}
+
+    # re-opening from another instance:
+    assert np.array_equal(DiskCache(tmp_path / "cache").get_arrays(key)["phase"], phase)
+
+
+def test_cache_numpy_meta(tmp_path):
+    cache = DiskCache(tmp_path / "cache")
+    key = cache.key("numpy meta")
+    cache.put_arrays(key, {"a": np.zeros(3)}, meta={
+        "n": np.int64(3),
+        "scale": np.float32(0.5),
+        "position": (np.int64(2), np.float64(1.5)),
+        "nested": {"flag": np.bool_(True)},
+    })
+    assert cache.get_meta(key) == {
+        "n": 3, "scale": 0.5, "position": [2, 1.5], "nested": {"flag": True},
+    }
+
+    params = HoloParams(
+        sb_size=(np.float64(12.5), np.float64(12.5)),
+        sb_position=(np.int64(10), np.int64(20)),
+        aperture=np.ones((8, 8), dtype=np.float32),
+        orig_shape=(np.int64(64), np.int64(64)),
+        out_shape=(np.int64(32), np.int64(32)),
+        scale_factor=np.float64(0.5),
+        xp=np,
+    )
+    cache.put_holoparams("params", params)
+    loaded = cache.get_holoparams("params")
+    assert loaded.sb_size == (12.5, 12.5)
+    assert loaded.sb_position == (10, 20)
+    assert loaded.out_shape == (32, 32)
+    assert loaded.scale_factor == 0.5
+
+
+def test_cache_concurrent_eviction(tmp_path, monkeypatch):
+    import shutil
+
+    cache = DiskCache(tmp_path / "cache")
+    phase = np.random.default_rng(0).random((32, 32))
+    key = cache.key("phase", phase)
+    cache.put_arrays(key, {"phase": phase}, meta={"sigma": 2})
+
+    # the entry vanishes after checking that it exists, but before reading it:
+    monkeypatch.setattr(DiskCache, "__contains__", lambda self, key: True)
+    os.remove(tmp_path / "cache" / key / "phase.npy")
+    assert cache.get_arrays(key) is None
+    shutil.rmtree(tmp_path / "cache" / key)
+    assert cache.get_arrays(key) is None
+    assert cache.get_meta(key) is None
+    assert cache.get_holoparams(key) is None
+
+
+def test_cache_get_or_compute(tmp_path):
+    cache = DiskCache(tmp_path)
+    calls = []
+
+    def _compute():
+        calls.append(1)
+        return {"wave": np.ones((8, 8), dtype=np.complex64)}
+
+    first = cache.get_or_compute("abc", _compute)
+    second = cache.get_or_compute("abc", _compute)
+    assert len(calls) == 1
+    assert np.array_equal(first["wave"], second["wave"])
+    assert second["wave"].dtype == np.complex64
+
+
+def test_cache_lru_eviction(tmp_path):
+    entry_size = 8 * 64 * 64
+    cache = DiskCache(tmp_path, max_size=int(3.5 * entry_size))
+    for i in range(3):
+        cache.put_arrays(f"entry{i}", {"data": np.full((64, 64), i, dtype=np.float64)})
+        # make the access order unambiguous:
+        os.utime(tmp_path / f"entry{i}" / "meta.json", ns=(i * 10**9, i * 10**9))
+    # access the oldest entry, so it's the most recently used one:
+    assert cache.get_arrays("entry0") is not None
+
+    cache.put_arrays("entry3", {"data": np.zeros((64, 64))})
+    assert "entry0" in cache
+    assert "entry1" not in cache
+    assert "entry2" in cache
+    assert "entry3" in cache
+    assert cache.size <= cache.max_size
+
+    # entries that are larger than the cache are not kept:
+    cache.put_arrays("huge", {"data": np.zeros((4, 64, 64))})
+    assert "huge" not in cache
+    assert "entry3" in cache
+
+    cache.clear()
+    assert cache.size == 0
+
+
+@pytest.mark.parametrize(
+    "source", ["array", "path"],
+)
+def test_cache_holoparams(tmp_path, holo_data, monkeypatch, source):
+    holo, _, _, _ = holo_data
+    hologram = holo[0, 0]
+    if source == "path":
+        np.save(tmp_path / "holo.npy", hologram)
+        hologram = tmp_path / "holo.npy"
+    cache = DiskCache(tmp_path / "cache")
+
+    expected = HoloParams.from_hologram(holo[0, 0], central_band_mask_radius=1)
+    params = cache.holoparams_from_hologram(hologram, central_band_mask_radius=1)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("should be cached")
+
+    monkeypatch.setattr(HoloParams, "from_hologram", _fail)
+    cached = cache.holoparams_from_hologram(hologram, central_band_mask_radius=1)
+
+    for p in (params, cached):
+        assert isinstance(p, HoloParams)
+        assert np.allclose(p.sb_size, expected.sb_size)
+        assert tuple(p.sb_position) == tuple(expected.sb_position)
+        assert tuple(p.out_shape) == tuple(expected.out_shape)
+        assert tuple(p.orig_shape) == tuple(expected.orig_shape)
+        assert p.scale_factor == expected.scale_factor
+        assert np.array_equal(p.aperture, expected.aperture)
+    assert isinstance(cached.sb_position, tuple)
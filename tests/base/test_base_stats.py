@@ -0,0 +1,222 @@
+import numpy as np
+import pytest
+from sparseconverter import for_backend, NUMPY
+
+from libertem_holo.base.align import align_stack, stack_alignment_quality
+from libertem_holo.base.stats import StreamingStats
+
+
+@pytest.mark.parametrize(
+    "batch_size", [1, 3, 10],
+)
+def test_streaming_stats(xp, batch_size):
+    rng = np.random.default_rng(42)
+    # large offset, to check for numerical stability:
+    stack = 1e4 + rng.normal(size=(10, 16, 16)) * np.arange(1, 11)[:, None, None]
+    stats = StreamingStats(margin=2, xp=xp)
+    for start in range(0, stack.shape[0], batch_size):
+        stats.update(xp.asarray(stack[start:start + batch_size]))
+
+    assert stats.count == 10
+    assert np.allclose(for_backend(stats.mean, NUMPY), stack.mean(axis=0))
+    assert np.allclose(for_backend(stats.variance, NUMPY), stack.var(axis=0))
+    assert np.allclose(for_backend(stats.std, NUMPY), stack.std(axis=0))
+
+    residuals = for_backend(stats.residuals, NUMPY)
+    assert residuals.shape == (10,)
+    assert np.isnan(residuals[0])
+    running_mean = np.cumsum(stack, axis=0) / np.arange(1, 11)[:, None, None]
+    expected = np.sqrt(np.mean((stack[1:] - running_mean[:-1])[:, 2:-2, 2:-2] ** 2, axis=(1, 2)))
+    assert np.allclose(residuals[1:], expected)
+
+
+def test_streaming_stats_merge():
+    rng = np.random.default_rng(42)
+    stack = rng.normal(size=(9, 16, 16)) + 1j * rng.normal(size=(9, 16, 16))
+
+    parts = [StreamingStats(), StreamingStats(), StreamingStats()]
+    parts[0].update(stack[:2])
+    parts[1].update(stack[2:])
+    merged = StreamingStats().merge(parts[0]).merge(parts[1]).merge(parts[2])
+
+    assert merged.count == 9
+    assert np.allclose(merged.mean, np.abs(stack).mean(axis=0))
+    assert np.allclose(merged.variance, np.abs(stack).var(axis=0))
+    assert merged.residuals.shape == (9,)
+
+
+def test_streaming_stats_errors():
+    stats = StreamingStats()
+    with pytest.raises(ValueError):
+        stats.mean
+    stats.update(np.zeros((16, 16)))
+    with pytest.raises(ValueError):
+        stats.update(np.zeros((16, 8)))
+    other = StreamingStats()
+    other.update(np.zeros((8, 8)))
+    with pytest.raises(ValueError):
+        stats.merge(other)
+
+
+@pytest.mark.parametrize(
+    "batch_size, num_workers", [
+        (1, 1),
+        (3, 2),
+    ],
+)
+def test_align_stack_stats(batch_size, num_workers):
+    rng = np.random.default_rng(0)
+    base = rng.random((64, 64))
+    stack = np.stack([
+        np.roll(base, (i, -i), axis=(0, 1)) + rng.normal(scale=0.01, size=base.shape)
+        for i in range(6)
+    ])
+    stack[4] = rng.random((64, 64))  # a frame that can't be aligned
+    wave_stack = stack * np.exp(1j * stack)
+
+    stats = StreamingStats(margin=8)
+    aligned, shifts, _, _ = align_stack(
+        stack=stack,
+        wave_stack=wave_stack,
+        static=None,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        stats=stats,
+    )
+    assert stats.count == 6
+    assert np.allclose(stats.mean, np.abs(aligned).mean(axis=0))
+    assert np.allclose(
+        stack_alignment_quality(stats, shifts),
+        stack_alignment_quality(aligned, shifts),
+    )
+    residuals = stats.residuals
+    assert np.argmax(residuals[1:]) + 1 == 4
+
+
+def _stack_with_outliers(dtype=np.float64):
+    rng = np.random.default_rng(0)
+    stack = rng.normal(5, 1, size=(61, 16, 16))
+    stack[7] = 100  # beam blanking or similar
+    stack[50, :8] = -50
+    if np.issubdtype(dtype, np.complexfloating):
+        stack = stack * np.exp(1j * 0.3)
+    return stack.astype(dtype)
+
+
+@pytest.mark.parametrize(
+    "dtype", [np.float32, np.complex128],
+)
+def test_sigma_clipped_mean(tmp_path, dtype):
+    from libertem_holo.base.stats import sigma_clipped_mean
+
+    stack = _stack_with_outliers(dtype)
+    np.save(tmp_path / "stack.npy", stack)
+    stack_mmap = np.load(tmp_path / "stack.npy", mmap_mode="r")
+
+    mean, count = sigma_clipped_mean(stack_mmap, sigma=3, batch_size=8)
+    clean = np.delete(stack, 7, axis=0)
+    expected_count = np.full((16, 16), 60)
+    expected_count[:8] = 59
+    assert np.array_equal(count, expected_count)
+    expected = clean.sum(axis=0)
+    expected[:8] -= clean[49, :8]
+    assert np.allclose(mean, expected / expected_count)
+
+
+def test_clipped_mean_merge():
+    from libertem_holo.base.stats import ClippedMean
+
+    stack = _stack_with_outliers()
+    stats = StreamingStats()
+    stats.update(stack)
+    full = ClippedMean(stats)
+    full.update(stack)
+    parts = [ClippedMean(stats), ClippedMean(stats)]
+    parts[0].update(stack[:20])
+    parts[1].update(stack[20:])
+    merged = parts[0].merge(parts[1])
+    assert np.array_equal(merged.count, full.count)
+    assert np.allclose(merged.mean, full.mean)
+
+
+def test_streaming_histogram(xp):
+    from libertem_holo.base.stats import StreamingHistogram
+
+    rng = np.random.default_rng(0)
+    stack = rng.uniform(0, 10, size=(200, 8, 8))
+    hists = [
+        StreamingHistogram(0, 10, shape=(8, 8), bins=100, xp=xp),
+        StreamingHistogram(0, 10, shape=(8, 8), bins=100, xp=xp),
+    ]
+    hists[0].update(xp.asarray(stack[:150]))
+    hists[1].update(xp.asarray(stack[150:]))
+    hist = hists[0].merge(hists[1])
+    assert hist.count == 200
+    for q in (0.1, 0.5, 0.9):
+        result = for_backend(hist.quantile(q), NUMPY)
+        # within a bin width, plus the spacing of the samples:
+        assert np.allclose(result, np.quantile(stack, q, axis=0), atol=0.2)
+    with pytest.raises(TypeError):
+        hist.update(xp.zeros((8, 8), dtype=np.complex64))
+
+
+@pytest.mark.parametrize(
+    "dtype", [np.float64, np.complex128],
+)
+def test_streaming_median(dtype):
+    from libertem_holo.base.stats import streaming_median
+
+    stack = _stack_with_outliers(dtype)
+    parts = [stack.real, stack.imag] if np.iscomplexobj(stack) else [stack]
+    parts_stats = []
+    for part in parts:
+        part_stats = StreamingStats()
+        part_stats.update(part)
+        parts_stats.append(part_stats)
+    bins = 64
+    median = streaming_median(
+        stack, bins=bins, batch_size=7,
+        stats=tuple(parts_stats) if np.iscomplexobj(stack) else parts_stats[0],
+    )
+    assert median.dtype == stack.dtype
+    # the documented accuracy, with the default width of 4, for each part:
+    medians = [median.real, median.imag] if np.iscomplexobj(stack) else [median]
+    for part, part_median, part_stats in zip(parts, medians, parts_stats):
+        accuracy = 2 * 4 * part_stats.std / bins
+        assert np.all(np.abs(part_median - np.median(part, axis=0)) <= accuracy)
+    # the outliers don't affect the median:
+    assert np.allclose(median, 5 * stack[0] / np.abs(stack[0]), atol=1)
+    # the first pass gives the same result:
+    assert np.allclose(streaming_median(stack, bins=bins, batch_size=7), median)
+
+
+@pytest.mark.parametrize(
+    "value", [5.0, 0.0, 0.3 + 0j, -2 + 1j],
+)
+def test_streaming_median_constant(value):
+    from libertem_holo.base.stats import streaming_median
+
+    stack = np.full((10, 2, 2), value)
+    median = streaming_median(stack, batch_size=3)
+    assert median.dtype == stack.dtype
+    assert np.array_equal(median, stack[0])
+
+
+def test_streaming_median_complex_offset():
+    from libertem_holo.base.stats import streaming_median
+
+    # a large mean amplitude compared to the spread of the values:
+    rng = np.random.default_rng(1)
+    noise = rng.normal(size=(2, 41, 8, 8))
+    stack = 1000 * np.exp(1j * 0.3) + noise[0] + 2j * noise[1]
+    bins = 32
+    median = streaming_median(stack, bins=bins, width=3)
+    for part, part_median in [(stack.real, median.real), (stack.imag, median.imag)]:
+        accuracy = 2 * 3 * part.std(axis=0) / bins
+        assert np.all(np.abs(part_median - np.median(part, axis=0)) <= accuracy)
+
+    # statistics of the amplitude can't be used for the parts:
+    stats = StreamingStats()
+    stats.update(stack)
+    with pytest.raises(ValueError, match="imaginary part"):
+        streaming_median(stack, stats=stats)
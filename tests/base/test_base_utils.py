@@ -1,7 +1,7 @@
 import numpy as np
 import pytest
 
-from libertem_holo.base.utils import remove_phase_ramp
+from libertem_holo.base.utils import remove_phase_ramp, HoloParams
 
 
 @pytest.mark.parametrize(
@@ -93,3 +93,105 @@ def test_remove_phase_ramp_with_roi(shape, ramp_yx, method, roi_method):
     if ramp_yx != (0, 0):
         assert not np.allclose(img_without_ramp, 0)
     assert np.allclose(detected_ramp[slice_in_shape], ramp)
+
+
+@pytest.mark.parametrize(
+    "shape", [
+        (64, 64),
+        (31, 17),
+        (32, 17),
+    ],
+)
+def test_fft_shift_coords(shape):
+    from libertem_holo.base.utils import fft_shift_coords
+
+    grid = np.moveaxis(np.mgrid[0:shape[0], 0:shape[1]], 0, -1)
+    expected = np.fft.fftshift(grid, axes=(0, 1))
+
+    for pos in [(0, 0), (3, 5), (shape[0] - 1, shape[1] - 1), (shape[0] // 2, 1)]:
+        res = fft_shift_coords(pos, shape)
+        assert isinstance(res, tuple)
+        assert res == tuple(expected[pos])
+
+    # vectorized over many positions:
+    assert np.array_equal(fft_shift_coords(grid, shape), expected)
+    assert np.array_equal(
+        fft_shift_coords(grid.reshape((-1, 2)), shape),
+        expected.reshape((-1, 2)),
+    )
+
+
+@pytest.mark.parametrize(
+    "shape", [
+        (31, 17),
+        (32, 17),
+        (64, 64),
+    ],
+)
+def test_fft_shift_coords_inverse(shape):
+    from libertem_holo.base.utils import fft_shift_coords
+
+    grid = np.moveaxis(np.mgrid[0:shape[0], 0:shape[1]], 0, -1)
+    inverse = fft_shift_coords(grid, shape, inverse=True)
+    assert np.array_equal(inverse, np.fft.ifftshift(grid, axes=(0, 1)))
+    # round trip in both directions:
+    assert np.array_equal(fft_shift_coords(inverse, shape), grid)
+    forward = fft_shift_coords(grid, shape)
+    assert np.array_equal(fft_shift_coords(forward, shape, inverse=True), grid)
+    for pos in [(0, 0), (3, 5), (shape[0] - 1, shape[1] - 1)]:
+        forward = fft_shift_coords(pos, shape)
+        assert fft_shift_coords(forward, shape, inverse=True) == pos
+
+
+@pytest.mark.parametrize(
+    "shape", [
+        (64, 64),
+        (64, 60),
+    ],
+)
+def test_other_sb(shape):
+    from libertem_holo.base.utils import other_sb
+
+    sb_position = (10, 7)
+    other = other_sb(sb_position, shape)
+    # for even shapes, the sidebands are point-symmetric around the zero frequency:
+    assert other == ((-sb_position[0]) % shape[0], (-sb_position[1]) % shape[1])
+    assert other_sb(other, shape) == sb_position
+
+
+@pytest.mark.parametrize(
+    "even", [True, False],
+)
+def test_next_fast_size(even):
+    from libertem_holo.base.utils import next_fast_size
+
+    def _factors_ok(n):
+        for p in (2, 3, 5):
+            while n % p == 0:
+                n //= p
+        return n == 1
+
+    for n in range(1, 600):
+        size = next_fast_size(n, even=even)
+        assert size >= n
+        assert _factors_ok(size)
+        if even:
+            assert size % 2 == 0
+        # it's the smallest one:
+        for m in range(n, size):
+            assert not _factors_ok(m) or (even and m % 2 == 1)
+
+
+def test_holo_params_fft_friendly(holo_data):
+    from libertem_holo.base.utils import next_fast_size, get_slice_fft
+    holo, ref, phase_ref, slice_crop = holo_data
+
+    p = HoloParams.from_hologram(ref[0, 0], central_band_mask_radius=1)
+    p_orig = HoloParams.from_hologram(
+        ref[0, 0], central_band_mask_radius=1, fft_friendly=False,
+    )
+    assert p.out_shape[0] == next_fast_size(p_orig.out_shape[0])
+    assert p.aperture.shape == p.out_shape
+    assert p.scale_factor == p.out_shape[0] / ref[0, 0].shape[0]
+    slice_fft = get_slice_fft(p.out_shape, ref[0, 0].shape)
+    assert ref[0, 0][slice_fft].shape == p.out_shape
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter, map_coordinates, shift as ndi_shift
+
+from sparseconverter import for_backend, NUMPY
+
+from libertem_holo.base.local_align import (
+    TileShifts, align_stack_local, displacement_map, fit_displacement,
+    register_tiles, tile_starts, warp,
+)
+
+
+def _distorted_stack(shape=(256, 256), num_frames=3):
+    rng = np.random.default_rng(0)
+    base = gaussian_filter(rng.random(shape), 2)
+    yy, xx = np.indices(shape).astype(np.float64)
+    frames = []
+    displacements = []
+    for i in range(num_frames):
+        # drift plus a small shear, growing over time:
+        dy = 2 * i + 0.01 * i * (xx - shape[1] / 2)
+        dx = -1.5 * i + 0.01 * i * (yy - shape[0] / 2)
+        frames.append(map_coordinates(base, [yy + dy, xx + dx], order=3, mode='nearest'))
+        displacements.append(np.stack([dy, dx]))
+    return base, np.stack(frames), np.stack(displacements)
+
+
+def test_tile_starts():
+    assert list(tile_starts(256, 64, 32)) == [0, 32, 64, 96, 128, 160, 192]
+    # the last tile is moved to cover the end:
+    assert list(tile_starts(100, 64, 32)) == [0, 32, 36]
+    with pytest.raises(ValueError):
+        tile_starts(32, 64, 32)
+
+
+def test_register_tiles_rigid():
+    base, _, _ = _distorted_stack()
+    shifts = np.array([(3.2, -1.7), (-5.5, 4.1)])
+    stack = np.stack([
+        ndi_shift(base, s, order=3, mode='nearest')
+        for s in shifts
+    ])
+    tile_shifts = register_tiles(stack, base, tile_size=64, batch_size=1, num_workers=2)
+    assert tile_shifts.shifts.shape == (2, 7, 7, 2)
+    assert tile_shifts.peaks.shape == (2, 7, 7)
+    assert np.allclose(tile_shifts.centers_y, np.arange(7) * 32 + 31.5)
+    # tiles at the border see the padded edge, so only check the inner ones;
+    # the window biases small tiles slightly towards zero shift:
+    inner = tile_shifts.shifts[:, 1:-1, 1:-1]
+    assert np.allclose(inner, -shifts[:, None, None, :], atol=0.5)
+    assert np.allclose(np.median(inner, axis=(1, 2)), -shifts, atol=0.3)
+
+
+def test_warp_constant_displacement():
+    from libertem_holo.base.align import shift_stack
+
+    base, _, _ = _distorted_stack(shape=(64, 64))
+    wave = base * np.exp(1j * base)
+    displacement = np.zeros((2, 64, 64))
+    displacement[0] = 2
+    displacement[1] = -3
+    warped = warp(wave, displacement, mode='grid-wrap')
+    expected = shift_stack(wave[None], np.array([(2.0, -3.0)]))[0]
+    assert np.allclose(warped, expected)
+
+
+def test_fit_displacement_underdetermined():
+    centers = np.array([16.0, 48.0, 80.0])
+    shifts = np.zeros((2, 3, 3, 2))
+    shifts[..., 0] = 1.5
+    peaks = np.ones((2, 3, 3))
+    # only two tiles of the second frame have a correlation peak:
+    peaks[1] = 0
+    peaks[1, 0, :2] = 1
+    tile_shifts = TileShifts(centers, centers, shifts, peaks)
+    coefficients = fit_displacement(tile_shifts, shape=(96, 96), degree=0)
+    assert np.allclose(coefficients[:, :, 0], [(1.5, 0), (1.5, 0)])
+    with pytest.raises(ValueError, match="frame 1"):
+        fit_displacement(tile_shifts, shape=(96, 96), degree=1)
+    # a single row of tiles can't determine the y terms:
+    peaks[1, 0, :] = 1
+    with pytest.raises(ValueError):
+        fit_displacement(tile_shifts, shape=(96, 96), degree=1)
+    peaks[1, 1, 0] = 1
+    fit_displacement(tile_shifts, shape=(96, 96), degree=1)
+    # a single tile per frame only determines a rigid shift:
+    _, stack, _ = _distorted_stack(shape=(64, 64), num_frames=2)
+    with pytest.raises(ValueError, match="degree 1"):
+        align_stack_local(stack, stack, tile_size=64, degree=1)
+
+
+@pytest.mark.parametrize(
+    "num_workers", [1, 3],
+)
+def test_align_stack_local(xp, num_workers):
+    base, stack, displacements = _distorted_stack()
+    aligned, coefficients, tile_shifts = align_stack_local(
+        stack=xp.asarray(stack),
+        wave_stack=xp.asarray(stack),
+        static=xp.asarray(base),
+        tile_size=64,
+        degree=1,
+        num_workers=num_workers,
+        xp=xp,
+    )
+    aligned = for_backend(aligned, NUMPY)
+    assert coefficients.shape == (3, 2, 3)
+    inner = (slice(None), slice(20, -20), slice(20, -20))
+    for i in range(stack.shape[0]):
+        displacement = for_backend(displacement_map(coefficients[i], base.shape, xp=xp), NUMPY)
+        assert np.allclose(displacement[inner], displacements[i][inner], atol=0.5)
+        error = np.abs(aligned[i] - base)[inner[1:]].max()
+        assert error <= 0.2 * np.abs(stack[i] - base).max() + 1e-6
+
+
+def test_align_stack_local_shape_mismatch():
+    stack = np.zeros((2, 64, 64))
+    with pytest.raises(ValueError):
+        align_stack_local(stack, stack[:, :32], tile_size=32)
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+import pytest
+
+
+# modules that should only be imported when they are actually used:
+LAZY_MODULES = [
+    "matplotlib.pyplot",
+    "numba.cuda",
+    "skimage",
+    "sparse",
+    "scipy.sparse.linalg",
+    "scipy.signal",
+    "scipy.optimize",
+    "cupy",
+    "libertem.masks",
+]
+
+
+@pytest.mark.parametrize(
+    "module", [
+        "libertem_holo.base.reconstr",
+        "libertem_holo.base.align",
+        "libertem_holo.base.filters",
+        "libertem_holo.base.utils",
+        "libertem_holo.base.stats",
+        "libertem_holo.base.cache",
+    ],
+)
+def test_no_heavy_imports(module):
+    code = "\n".join([
+        "import sys",
+        f"import {module}",
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))",
+    ])
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    assert result.stdout.strip() == ""
@@ -88,3 +88,209 @@ def test_default_aperture(lt_ctx: Context, backend: str, holo_data) -> None:
     phase = np.angle(w)
 
     assert np.allclose(phase_ref[slice_crop], phase[slice_crop], rtol=0.12)
+
+
+def test_jit_warmup(lt_ctx: Context, holo_data) -> None:
+    from libertem_holo.base.filters import warmup_in_background
+
+    holo, ref, phase_ref, slice_crop = holo_data
+    dataset_holo = MemoryDataSet(data=holo, num_partitions=2, sig_dims=2)
+    out_shape = dataset_holo.shape.sig
+
+    holo_udf = HoloReconstructUDF.with_default_aperture(
+        sb_size=6.26498204,
+        out_shape=out_shape,
+        sb_position=[11, 6],
+    )
+    holo_udf_warmup = HoloReconstructUDF(
+        out_shape=out_shape,
+        sb_position=[11, 6],
+        aperture=disk_aperture(out_shape=out_shape, radius=6.26498204),
+        jit_warmup=True,
+    )
+    w = lt_ctx.run_udf(dataset=dataset_holo, udf=holo_udf)["wave"].data
+    w_warmup = lt_ctx.run_udf(dataset=dataset_holo, udf=holo_udf_warmup)["wave"].data
+    # the warmup has been started by the UDF (inline executor -> same process):
+    warmup_in_background(xp=np).join()
+    assert np.allclose(w, w_warmup)
+
+
+@pytest.mark.parametrize(
+    "backend", ["numpy", "cupy"],
+)
+@pytest.mark.parametrize(
+    "dtype", [np.float32, np.complex64],
+)
+def test_stack_align_udf(lt_ctx: Context, backend: str, dtype) -> None:
+    from libertem_holo.base.align import align_stack
+    from libertem_holo.base.utils import apply_fourier_shift
+    from libertem_holo.udf import StackAlignUDF
+
+    if backend == "cupy":
+        d = detect()
+        cudas = detect()["cudas"]
+        if not d["cudas"] or not d["has_cupy"]:
+            pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+
+    rng = np.random.default_rng(42)
+    shape = (64, 64)
+    yy, xx = np.mgrid[0:shape[0], 0:shape[1]]
+    base = np.exp(-((yy - 32)**2 + (xx - 30)**2) / 50) + 0.1 * rng.random(shape)
+    shifts = rng.uniform(-5, 5, size=(8, 2))
+    spectra = np.repeat(np.fft.fft2(base)[None], shifts.shape[0], axis=0)
+    stack = np.fft.ifft2(apply_fourier_shift(spectra, shifts))
+    if dtype == np.float32:
+        stack = stack.real
+    stack = stack.astype(dtype)
+
+    ds = MemoryDataSet(data=stack.reshape((2, 4) + shape), num_partitions=2, sig_dims=2)
+    udf = StackAlignUDF(reference=base, accumulate=True)
+    try:
+        if backend == "cupy":
+            set_use_cuda(cudas[0])
+        res = lt_ctx.run_udf(dataset=ds, udf=udf)
+    finally:
+        set_use_cpu(0)
+
+    aligned, shifts_found, _, corrs = align_stack(
+        stack=np.abs(stack) if np.iscomplexobj(stack) else stack,
+        wave_stack=stack,
+        static=base,
+    )
+    udf_shifts = res['shift'].data.reshape((-1, 2))
+    assert np.allclose(udf_shifts, -shifts, atol=0.11)
+    assert np.allclose(udf_shifts, shifts_found, atol=1e-5)
+    assert np.allclose(res['aligned'].data.reshape(stack.shape), aligned, atol=1e-4)
+    assert np.allclose(res['aligned_sum'].data, aligned.sum(axis=0), atol=1e-3)
+    assert np.allclose(res['peak'].data.reshape((-1,)), corrs.max(axis=(1, 2)))
+
+
+@pytest.mark.parametrize(
+    "backend", ["numpy", "cupy"],
+)
+def test_holo_reconstruction_shifts(lt_ctx: Context, backend: str, holo_data) -> None:
+    from libertem_holo.base.align import shift_stack
+
+    holo, ref, phase_ref, slice_crop = holo_data
+
+    if backend == "cupy":
+        d = detect()
+        cudas = detect()["cudas"]
+        if not d["cudas"] or not d["has_cupy"]:
+            pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+
+    dataset_holo = MemoryDataSet(data=holo, num_partitions=2, sig_dims=2)
+    out_shape = tuple(dataset_holo.shape.sig)
+    aperture = disk_aperture(out_shape=out_shape, radius=6.26498204)
+    nav_shape = tuple(dataset_holo.shape.nav)
+    rng = np.random.default_rng(42)
+    shifts = rng.uniform(-3, 3, size=nav_shape + (2,))
+
+    holo_udf = HoloReconstructUDF(out_shape=out_shape, sb_position=[11, 6], aperture=aperture)
+    aligned_udf = HoloReconstructUDF(
+        out_shape=out_shape, sb_position=[11, 6], aperture=aperture, shifts=shifts,
+    )
+    try:
+        if backend == "cupy":
+            set_use_cuda(cudas[0])
+        waves = lt_ctx.run_udf(dataset=dataset_holo, udf=holo_udf)["wave"].data
+        aligned = lt_ctx.run_udf(dataset=dataset_holo, udf=aligned_udf)["wave"].data
+    finally:
+        set_use_cpu(0)
+
+    expected = shift_stack(
+        waves.reshape((-1,) + out_shape),
+        shifts.reshape((-1, 2)),
+    )
+    assert np.allclose(aligned.reshape(expected.shape), expected)
+
+
+@pytest.mark.parametrize(
+    "backend", ["numpy", "cupy"],
+)
+def test_holo_reconstruction_spectrum(lt_ctx: Context, backend: str, holo_data) -> None:
+    holo, ref, phase_ref, slice_crop = holo_data
+
+    if backend == "cupy":
+        d = detect()
+        cudas = detect()["cudas"]
+        if not d["cudas"] or not d["has_cupy"]:
+            pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+
+    dataset_holo = MemoryDataSet(data=holo, num_partitions=2, sig_dims=2)
+    out_shape = tuple(dataset_holo.shape.sig)
+    aperture = disk_aperture(out_shape=out_shape, radius=6.26498204)
+
+    holo_udf = HoloReconstructUDF(
+        out_shape=out_shape, sb_position=[11, 6], aperture=aperture, return_spectrum=True,
+    )
+    try:
+        if backend == "cupy":
+            set_use_cuda(cudas[0])
+        res = lt_ctx.run_udf(dataset=dataset_holo, udf=holo_udf)
+    finally:
+        set_use_cpu(0)
+
+    wave = res["wave"].data
+    spectrum = res["spectrum"].data
+    assert spectrum.shape == wave.shape
+    assert np.allclose(np.fft.fft2(wave), spectrum)
+    assert "spectrum" not in lt_ctx.run_udf(
+        dataset=dataset_holo,
+        udf=HoloReconstructUDF(out_shape=out_shape, sb_position=[11, 6], aperture=aperture),
+    )
+
+
+@pytest.mark.parametrize(
+    "backend", ["numpy", "cupy"],
+)
+def test_aligned_average_udf(lt_ctx: Context, backend: str, holo_data) -> None:
+    from libertem_holo.base.align import SpectrumCorrelator, align_stack, shift_stack
+    from libertem_holo.udf import AlignedAverageUDF
+
+    holo, ref, phase_ref, slice_crop = holo_data
+
+    if backend == "cupy":
+        d = detect()
+        cudas = detect()["cudas"]
+        if not d["cudas"] or not d["has_cupy"]:
+            pytest.skip("No CUDA device or no CuPy, skipping CuPy test")
+
+    dataset_holo = MemoryDataSet(data=holo, num_partitions=3, sig_dims=2)
+    out_shape = tuple(dataset_holo.shape.sig)
+    aperture = disk_aperture(out_shape=out_shape, radius=6.26498204)
+    waves = lt_ctx.run_udf(
+        dataset=dataset_holo,
+        udf=HoloReconstructUDF(out_shape=out_shape, sb_position=[11, 6], aperture=aperture),
+    )["wave"].data.reshape((-1,) + out_shape)
+    reference = shift_stack(waves[:1], np.array([(1.5, -2.3)]))[0]
+
+    udf = AlignedAverageUDF(
+        out_shape=out_shape,
+        sb_position=[11, 6],
+        aperture=aperture,
+        reference=reference,
+    )
+    try:
+        if backend == "cupy":
+            set_use_cuda(cudas[0])
+        res = lt_ctx.run_udf(dataset=dataset_holo, udf=udf)
+    finally:
+        set_use_cpu(0)
+
+    # the same, on the main node:
+    aligned, shifts, _, _ = align_stack(
+        stack=np.fft.fft2(waves),
+        wave_stack=waves,
+        static=np.fft.fft2(reference),
+        correlator=SpectrumCorrelator(upsample_factor=10),
+    )
+    offsets = np.angle(np.sum(reference.conj() * aligned, axis=(1, 2)))
+    expected = np.mean(aligned * np.exp(-1j * offsets)[:, None, None], axis=0)
+
+    assert int(res["count"].data[0]) == waves.shape[0]
+    assert np.allclose(res["shift"].data.reshape((-1, 2)), shifts)
+    assert np.allclose(res["shift"].data[0, 0], (1.5, -2.3))
+    assert np.allclose(res["phase_offset"].data.reshape((-1,)), offsets, atol=1e-5)
+    assert res["wave"].data.shape == out_shape
+    assert np.allclose(res["wave"].data, expected)